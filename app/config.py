@@ -3,8 +3,9 @@ Configuration management for the application
 Loads environment variables and provides configuration settings
 """
 
+import json
 import os
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -27,6 +28,93 @@ class Settings:
     GMAIL_FROM_EMAIL: str = os.getenv("GMAIL_FROM_EMAIL", "")
     GMAIL_SMTP_HOST: str = os.getenv("GMAIL_SMTP_HOST", "smtp.gmail.com")
     GMAIL_SMTP_PORT: int = int(os.getenv("GMAIL_SMTP_PORT", "587"))
+    SMTP_TIMEOUT: float = float(os.getenv("SMTP_TIMEOUT", "30"))
+    # SMTP transport: "thread" (smtplib in worker threads) or "asyncio" (aiosmtplib on the event loop)
+    SMTP_TRANSPORT: str = os.getenv("SMTP_TRANSPORT", "thread").strip().lower()
+
+    # SMTP relays: JSON list of sender accounts to spread mail across, e.g.
+    # [{"name": "a", "username": "a@x.com", "password": "...", "daily_limit": 2000, "per_minute_limit": 60}]
+    # Omitted fields fall back to the GMAIL_* / SMTP_* settings; empty = the single GMAIL_ADDRESS account
+    SMTP_RELAYS: str = os.getenv("SMTP_RELAYS", "")
+    # Default per-relay quotas, counted per process (0 = unlimited)
+    SMTP_DAILY_LIMIT: int = int(os.getenv("SMTP_DAILY_LIMIT", "0"))
+    SMTP_PER_MINUTE_LIMIT: int = int(os.getenv("SMTP_PER_MINUTE_LIMIT", "0"))
+    # Seconds a relay is skipped after a 421/454 deferral or connection failure (doubles while it persists)
+    SMTP_RELAY_COOLDOWN: float = float(os.getenv("SMTP_RELAY_COOLDOWN", "60"))
+    # Per-relay send rate (token bucket, messages/second; 0 = unlimited) and burst size.
+    # On 4xx throttling replies the rate is multiplied by SMTP_RATE_DECREASE_FACTOR (floor SMTP_RATE_MIN),
+    # then grows back by SMTP_RATE_INCREASE messages/second for every second of successful sending
+    SMTP_RATE_LIMIT: float = float(os.getenv("SMTP_RATE_LIMIT", "10"))
+    SMTP_RATE_BURST: float = float(os.getenv("SMTP_RATE_BURST", "20"))
+    SMTP_RATE_MIN: float = float(os.getenv("SMTP_RATE_MIN", "0.5"))
+    SMTP_RATE_INCREASE: float = float(os.getenv("SMTP_RATE_INCREASE", "0.5"))
+    SMTP_RATE_DECREASE_FACTOR: float = float(os.getenv("SMTP_RATE_DECREASE_FACTOR", "0.5"))
+
+    # SMTP connection pool
+    SMTP_POOL_SIZE: int = int(os.getenv("SMTP_POOL_SIZE", "5"))
+    SMTP_POOL_MAX_MESSAGES_PER_CONNECTION: int = int(os.getenv("SMTP_POOL_MAX_MESSAGES_PER_CONNECTION", "100"))
+    # Seconds an unused connection is kept open before it is closed
+    SMTP_POOL_IDLE_TIMEOUT: float = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT", "60"))
+    # Connections idle longer than this are checked with NOOP before reuse
+    SMTP_POOL_NOOP_INTERVAL: float = float(os.getenv("SMTP_POOL_NOOP_INTERVAL", "10"))
+
+    # Batch email sending
+    EMAIL_BATCH_MAX_RECIPIENTS: int = int(os.getenv("EMAIL_BATCH_MAX_RECIPIENTS", "10000"))
+    EMAIL_BATCH_CONCURRENCY: int = int(os.getenv("EMAIL_BATCH_CONCURRENCY", "10"))
+
+    # Outbound email queue (POST /api/email/enqueue)
+    EMAIL_QUEUE_WORKERS: int = int(os.getenv("EMAIL_QUEUE_WORKERS", "4"))
+    # Enqueue is refused with 429 once this many jobs are unfinished (0 = unlimited)
+    EMAIL_QUEUE_MAX_DEPTH: int = int(os.getenv("EMAIL_QUEUE_MAX_DEPTH", "10000"))
+    # Maximum queued sends per second across all workers (0 = unlimited)
+    EMAIL_QUEUE_RATE_LIMIT: float = float(os.getenv("EMAIL_QUEUE_RATE_LIMIT", "10"))
+    EMAIL_QUEUE_BATCH_SIZE: int = int(os.getenv("EMAIL_QUEUE_BATCH_SIZE", "50"))
+    EMAIL_QUEUE_POLL_INTERVAL: float = float(os.getenv("EMAIL_QUEUE_POLL_INTERVAL", "1"))
+    EMAIL_QUEUE_MAX_ATTEMPTS: int = int(os.getenv("EMAIL_QUEUE_MAX_ATTEMPTS", "3"))
+    # Base backoff in seconds before a failed job is retried (doubles per attempt, jittered, capped at RETRY_MAX_DELAY)
+    EMAIL_QUEUE_RETRY_DELAY: float = float(os.getenv("EMAIL_QUEUE_RETRY_DELAY", "30"))
+    # Seconds a claimed job stays leased to a worker before another may reclaim it
+    EMAIL_QUEUE_LEASE_SECONDS: int = int(os.getenv("EMAIL_QUEUE_LEASE_SECONDS", "300"))
+    
+    # Background retries of transient send failures (retry_jobs); exhausted sends go to dead_letters
+    RETRY_MAX_ATTEMPTS: int = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+    # Backoff before attempt n is RETRY_BASE_DELAY * 2^(n-1) seconds (half of it random), at most RETRY_MAX_DELAY
+    RETRY_BASE_DELAY: float = float(os.getenv("RETRY_BASE_DELAY", "5"))
+    RETRY_MAX_DELAY: float = float(os.getenv("RETRY_MAX_DELAY", "600"))
+    RETRY_WORKERS: int = int(os.getenv("RETRY_WORKERS", "4"))
+    RETRY_BATCH_SIZE: int = int(os.getenv("RETRY_BATCH_SIZE", "50"))
+    RETRY_POLL_INTERVAL: float = float(os.getenv("RETRY_POLL_INTERVAL", "1"))
+    RETRY_LEASE_SECONDS: int = int(os.getenv("RETRY_LEASE_SECONDS", "300"))
+    
+    # Email templates
+    # Dev mode: re-read template files when they change (stats the file on every render)
+    TEMPLATE_AUTO_RELOAD: bool = os.getenv("TEMPLATE_AUTO_RELOAD", "False").lower() == "true"
+    # Memoized renders for identical template contexts (size 0 disables the cache)
+    TEMPLATE_RENDER_CACHE_SIZE: int = int(os.getenv("TEMPLATE_RENDER_CACHE_SIZE", "512"))
+    TEMPLATE_RENDER_CACHE_TTL: float = float(os.getenv("TEMPLATE_RENDER_CACHE_TTL", "300"))
+
+    # Attachments sent repeatedly (e.g. one file to a whole batch) are kept base64-encoded
+    # in memory, up to this many bytes in total (0 disables the cache)
+    ATTACHMENT_CACHE_MAX_BYTES: int = int(os.getenv("ATTACHMENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Larger files are re-read (in chunks) for every message instead of cached
+    ATTACHMENT_CACHE_MAX_FILE_BYTES: int = int(os.getenv("ATTACHMENT_CACHE_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+
+    # Scheduled sends (persisted in the database, reloaded on startup)
+    SCHEDULER_JOBSTORE_TABLE: str = os.getenv("SCHEDULER_JOBSTORE_TABLE", "apscheduler_jobs")
+    # Seconds a run may be late (e.g. after a restart) and still fire; older runs are skipped
+    SCHEDULER_MISFIRE_GRACE_TIME: int = int(os.getenv("SCHEDULER_MISFIRE_GRACE_TIME", "300"))
+    # "local": APScheduler in each process (run a single worker/replica)
+    # "distributed": every instance polls scheduled_jobs and leases due rows, so each run fires once
+    SCHEDULER_MODE: str = os.getenv("SCHEDULER_MODE", "local")
+    SCHEDULER_POLL_INTERVAL: float = float(os.getenv("SCHEDULER_POLL_INTERVAL", "1"))
+    SCHEDULER_BATCH_SIZE: int = int(os.getenv("SCHEDULER_BATCH_SIZE", "100"))
+    # Maximum scheduled sends in flight per instance
+    SCHEDULER_CONCURRENCY: int = int(os.getenv("SCHEDULER_CONCURRENCY", "10"))
+    # Seconds a claimed run stays leased before another instance may retry it
+    # (renewed while the run is being sent)
+    SCHEDULER_LEASE_SECONDS: int = int(os.getenv("SCHEDULER_LEASE_SECONDS", "300"))
+    # Local mode: runs firing within this many seconds of each other are sent as one batch
+    SCHEDULER_BATCH_WINDOW: float = float(os.getenv("SCHEDULER_BATCH_WINDOW", "1"))
     
     # Auth0 Configuration (optional)
     AUTH0_DOMAIN: Optional[str] = os.getenv("AUTH0_DOMAIN")
@@ -38,6 +126,41 @@ class Settings:
     ONESIGNAL_APP_ID: str = (os.getenv("ONESIGNAL_APP_ID") or "").strip()
     ONESIGNAL_REST_API_KEY: str = (os.getenv("ONESIGNAL_REST_API_KEY") or "").strip()
     ONESIGNAL_API_URL: str = (os.getenv("ONESIGNAL_API_URL") or "https://onesignal.com/api").strip()
+    ONESIGNAL_TIMEOUT: float = float(os.getenv("ONESIGNAL_TIMEOUT", "30"))
+    # Shared HTTP client connection pool
+    ONESIGNAL_MAX_CONNECTIONS: int = int(os.getenv("ONESIGNAL_MAX_CONNECTIONS", "100"))
+    ONESIGNAL_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("ONESIGNAL_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    ONESIGNAL_KEEPALIVE_EXPIRY: float = float(os.getenv("ONESIGNAL_KEEPALIVE_EXPIRY", "30"))
+    # Multiplex requests over HTTP/2 (requires the 'h2' package)
+    ONESIGNAL_HTTP2: bool = os.getenv("ONESIGNAL_HTTP2", "True").lower() == "true"
+    # Large audiences are split into requests of at most this many target IDs
+    ONESIGNAL_MAX_TARGETS_PER_REQUEST: int = int(os.getenv("ONESIGNAL_MAX_TARGETS_PER_REQUEST", "2000"))
+    # Maximum concurrent requests when sending a split audience
+    ONESIGNAL_CHUNK_CONCURRENCY: int = int(os.getenv("ONESIGNAL_CHUNK_CONCURRENCY", "5"))
+    # Adaptive cap on OneSignal requests in flight per process: halved on 429/5xx, grows back on success
+    ONESIGNAL_MAX_CONCURRENCY: int = int(os.getenv("ONESIGNAL_MAX_CONCURRENCY", "50"))
+    ONESIGNAL_MIN_CONCURRENCY: int = int(os.getenv("ONESIGNAL_MIN_CONCURRENCY", "1"))
+    # Seconds a request may wait for a slot (or for Retry-After to pass) before it fails
+    ONESIGNAL_QUEUE_TIMEOUT: float = float(os.getenv("ONESIGNAL_QUEUE_TIMEOUT", "30"))
+    # Times a 429 response is retried after its Retry-After delay
+    ONESIGNAL_RATE_LIMIT_RETRIES: int = int(os.getenv("ONESIGNAL_RATE_LIMIT_RETRIES", "2"))
+    # Backoff in seconds when a 429 carries no Retry-After header
+    ONESIGNAL_DEFAULT_RETRY_AFTER: float = float(os.getenv("ONESIGNAL_DEFAULT_RETRY_AFTER", "1"))
+
+    # Batch push sending (POST /api/push/send-batch)
+    PUSH_BATCH_MAX_ITEMS: int = int(os.getenv("PUSH_BATCH_MAX_ITEMS", "10000"))
+    PUSH_BATCH_CONCURRENCY: int = int(os.getenv("PUSH_BATCH_CONCURRENCY", "10"))
+
+    # user_id -> active device targets cache for push targeting (size 0 disables the cache)
+    PUSH_TARGET_CACHE_SIZE: int = int(os.getenv("PUSH_TARGET_CACHE_SIZE", "50000"))
+    PUSH_TARGET_CACHE_TTL: float = float(os.getenv("PUSH_TARGET_CACHE_TTL", "300"))
+
+    # Bulk device registration (POST /players/register-batch)
+    PLAYER_BATCH_MAX_ITEMS: int = int(os.getenv("PLAYER_BATCH_MAX_ITEMS", "10000"))
+    # Rows per multi-row INSERT ... ON DUPLICATE KEY UPDATE statement
+    PLAYER_BATCH_CHUNK_SIZE: int = int(os.getenv("PLAYER_BATCH_CHUNK_SIZE", "500"))
+    # Times a batch registration transaction is re-run after MySQL picks it as a deadlock victim
+    PLAYER_DEADLOCK_RETRIES: int = int(os.getenv("PLAYER_DEADLOCK_RETRIES", "3"))
 
     # Database Configuration
     DB_HOST: str = os.getenv("DB_HOST", "localhost")
@@ -51,13 +174,46 @@ class Settings:
         """Construct database URL from settings"""
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
     
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        """Construct async (aiomysql) database URL from settings"""
+        return f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+    
     def effective_gmail_from_address(self) -> str:
         """From header address (alias if configured, otherwise the SMTP account)."""
         return (self.GMAIL_FROM_EMAIL or "").strip() or self.GMAIL_ADDRESS
 
     def validate_gmail_config(self) -> bool:
         """Validate that required Gmail SMTP configuration is present"""
-        return bool(self.GMAIL_ADDRESS and self.GMAIL_APP_PASSWORD)
+        return bool(self.SMTP_RELAYS.strip() or (self.GMAIL_ADDRESS and self.GMAIL_APP_PASSWORD))
+
+    def smtp_relay_configs(self) -> List[Dict[str, Any]]:
+        """SMTP relay definitions with defaults filled in (the Gmail account when SMTP_RELAYS is empty)"""
+        relays = json.loads(self.SMTP_RELAYS) if self.SMTP_RELAYS.strip() else [{
+            "username": self.GMAIL_ADDRESS,
+            "password": self.GMAIL_APP_PASSWORD,
+            "from_email": self.effective_gmail_from_address(),
+        }]
+        if not isinstance(relays, list):
+            raise ValueError("SMTP_RELAYS must be a JSON list of relay objects")
+        configs = []
+        for index, relay in enumerate(relays):
+            if self.SMTP_RELAYS.strip() and not (relay.get("username") and relay.get("password")):
+                raise ValueError(f"SMTP relay #{index} needs a username and password")
+            configs.append({
+                "name": relay.get("name") or relay["username"] or "default",
+                "host": relay.get("host") or self.GMAIL_SMTP_HOST,
+                "port": int(relay.get("port") or self.GMAIL_SMTP_PORT),
+                "username": relay["username"],
+                "password": relay["password"],
+                "from_email": relay.get("from_email") or relay["username"],
+                "from_name": relay.get("from_name", self.GMAIL_FROM_NAME),
+                "daily_limit": int(relay.get("daily_limit", self.SMTP_DAILY_LIMIT)),
+                "per_minute_limit": int(relay.get("per_minute_limit", self.SMTP_PER_MINUTE_LIMIT)),
+                "rate_limit": float(relay.get("rate_limit", self.SMTP_RATE_LIMIT)),
+                "burst": float(relay.get("burst", self.SMTP_RATE_BURST)),
+            })
+        return configs
     
     def validate_onesignal_config(self) -> bool:
         """Validate that all required OneSignal configuration is present"""
@@ -8,9 +8,14 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.routers import email, push_notification, player
-from app.services.scheduler_service import scheduler
-from app.database import engine, Base, check_connection
+from app.routers import dead_letter, email, push_notification, player
+from app.services.scheduler_service import start_scheduler, stop_scheduler
+from app.services.email_queue_service import email_queue
+from app.services.retry_service import retry_queue
+from app.services.push_notification_service import close_onesignal_client, start_onesignal_client
+from app.services.smtp_transport import close_smtp_transports
+from app.database import engine, Base, check_connection, dispose_async_engine
+from app.templates.template_loader import TemplateLoader
 
 # Configure logging
 logging.basicConfig(
@@ -25,7 +30,8 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """Manage application lifespan - start and stop scheduler"""
     # Startup: Check database connection
-    if check_connection():
+    db_available = check_connection()
+    if db_available:
         # Create database tables only if connection is successful
         try:
             Base.metadata.create_all(bind=engine)
@@ -35,15 +41,44 @@ async def lifespan(app: FastAPI):
     else:
         logger.critical("Could not connect to the database. Please check your configuration.")
     
-    # Startup: Start the scheduler
-    logger.info("Starting email scheduler...")
-    if not scheduler.running:
-        scheduler.start()
+    # Startup: Compile email templates so renders never hit the filesystem
+    TemplateLoader.precompile()
+    
+    # Startup: Start the outbound email queue workers (the queue lives in the database)
+    if db_available:
+        await email_queue.start()
+    else:
+        logger.warning("Email queue workers not started: database unavailable")
+    
+    # Startup: Start the retry queue workers (failed sends are persisted in the database)
+    if db_available:
+        await retry_queue.start()
+    else:
+        logger.warning("Retry queue workers not started: database unavailable")
+    
+    # Startup: Open the shared OneSignal HTTP client
+    await start_onesignal_client()
+    
+    # Startup: Start the scheduler (its jobs are persisted in the database and reloaded here)
+    if db_available:
+        logger.info(f"Starting email scheduler ({settings.SCHEDULER_MODE} mode)...")
+        await start_scheduler()
+    else:
+        logger.warning("Email scheduler not started: database unavailable")
     yield
     # Shutdown: Stop scheduler
     logger.info("Shutting down email scheduler...")
-    if scheduler.running:
-        scheduler.shutdown(wait=False)
+    await stop_scheduler()
+    # Shutdown: Stop email queue workers
+    await email_queue.stop()
+    # Shutdown: Stop retry queue workers
+    await retry_queue.stop()
+    # Shutdown: Close pooled SMTP sessions
+    await close_smtp_transports()
+    # Shutdown: Close the shared OneSignal HTTP client
+    await close_onesignal_client()
+    # Shutdown: Close pooled async database connections
+    await dispose_async_engine()
 
 
 # Initialize FastAPI app
@@ -69,6 +104,7 @@ app.add_middleware(
 app.include_router(email.router)
 app.include_router(push_notification.router)
 app.include_router(player.router)
+app.include_router(dead_letter.router)
 
 
 @app.get("/", tags=["Root"])
@@ -2,14 +2,29 @@
 Pydantic models for request and response schemas
 """
 
-from .email import EmailRequest, EmailResponse, ScheduledEmailRequest
-from .push_notification import PushNotificationRequest, PushNotificationResponse
+from .email import (
+    BatchEmailRequest,
+    BatchEmailResponse,
+    EmailRequest,
+    EmailResponse,
+    ScheduledEmailRequest,
+)
+from .push_notification import (
+    PushBatchRequest,
+    PushBatchResponse,
+    PushNotificationRequest,
+    PushNotificationResponse,
+)
 from .schedule import ScheduleRequest, ScheduleResponse
 
 __all__ = [
+    "BatchEmailRequest",
+    "BatchEmailResponse",
     "EmailRequest",
     "EmailResponse",
     "ScheduledEmailRequest",
+    "PushBatchRequest",
+    "PushBatchResponse",
     "PushNotificationRequest",
     "PushNotificationResponse",
     "ScheduleRequest",
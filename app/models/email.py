@@ -6,8 +6,9 @@ from __future__ import annotations
 
 from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, EmailStr, Field, model_validator
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, model_validator
 
+from app.config import settings
 from app.templates.template_types import EmailTemplateType
 
 
@@ -150,6 +151,85 @@ class EmailResponse(BaseModel):
     message_id: Optional[str] = Field(None, description="Provider message ID if successful")
     message: str = Field(..., description="Response message")
     error: Optional[str] = Field(None, description="Error message if failed")
+    retry_job_id: Optional[str] = Field(
+        None, description="Retry queue job ID when a transient failure is being retried in the background"
+    )
+
+
+class BatchEmailRecipient(BaseModel):
+    """One recipient of a batch send with its personalised template values."""
+
+    to: List[EmailStr] = Field(..., min_length=1, description="Recipient email addresses")
+    cc: Optional[List[EmailStr]] = Field(None, description="CC recipients")
+    bcc: Optional[List[EmailStr]] = Field(None, description="BCC recipients")
+    template_context: Optional[EmailTemplateContext] = Field(
+        None, description="Per-recipient template variables (override the shared context)"
+    )
+
+
+class BatchEmailRequest(BaseModel):
+    """Request model for sending one template to many recipients."""
+
+    template_type: EmailTemplateType = Field(..., description="Email template type")
+    template_context: Optional[EmailTemplateContext] = Field(
+        None, description="Template variables shared by every recipient"
+    )
+    recipients: List[BatchEmailRecipient] = Field(
+        ...,
+        min_length=1,
+        max_length=settings.EMAIL_BATCH_MAX_RECIPIENTS,
+        description="Recipients with their personalised template variables",
+    )
+    subject: Optional[str] = Field(None, min_length=1, description="Subject override for every recipient")
+    reply_to: Optional[EmailStr] = Field(None, description="Reply-to address")
+    attachments: Optional[List[str]] = Field(None, description="Attachment file paths sent to every recipient")
+
+    @model_validator(mode="after")
+    def validate_template(self):
+        if self.template_type == EmailTemplateType.CUSTOM:
+            raise ValueError("CUSTOM template type is not supported for batch sends")
+        return self
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "template_type": "BOOKING_REMINDER",
+                "template_context": {"property_name": "Beach Villa"},
+                "recipients": [
+                    {
+                        "to": ["guest1@example.com"],
+                        "template_context": {"guest_name": "John Doe", "check_in_date": "2024-12-20"},
+                    },
+                    {
+                        "to": ["guest2@example.com"],
+                        "template_context": {"guest_name": "Jane Roe", "check_in_date": "2024-12-21"},
+                    },
+                ],
+            }
+        }
+    )
+
+
+class BatchEmailResult(BaseModel):
+    """Outcome for a single recipient of a batch send."""
+
+    index: int = Field(..., description="Position of the recipient in the request")
+    to: List[str] = Field(..., description="Recipient email addresses")
+    success: bool = Field(..., description="Whether the email was sent successfully")
+    message_id: Optional[str] = Field(None, description="Provider message ID if successful")
+    error: Optional[str] = Field(None, description="Error message if failed")
+
+
+class BatchEmailResponse(BaseModel):
+    """Response model for batch email sending."""
+
+    success: bool = Field(..., description="Whether every recipient was sent successfully")
+    total: int = Field(..., description="Number of recipients in the batch")
+    sent: int = Field(..., description="Number of emails sent")
+    failed: int = Field(..., description="Number of emails that failed")
+    results: List[BatchEmailResult] = Field(..., description="Per-recipient results in request order")
+    message: str = Field(..., description="Response message")
+    error: Optional[str] = Field(None, description="Error message if the batch could not be processed")
 
 
 class ScheduledEmailRequest(BaseModel):
@@ -0,0 +1,67 @@
+"""
+Outbound email queue models
+"""
+
+import uuid
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from sqlalchemy import JSON, Column, DateTime, Enum as SQLEnum, Index, Integer, String, Text
+from sqlalchemy.dialects.mysql import CHAR
+from pydantic import BaseModel, Field
+
+from app.database import Base
+
+
+class EmailJobStatus(str, Enum):
+    """Email queue job status enum"""
+    PENDING = "PENDING"
+    SENDING = "SENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+
+class EmailJob(Base):
+    """Queued outbound email SQLAlchemy model"""
+    __tablename__ = "email_queue"
+    __table_args__ = (
+        # Workers claim due jobs with: status IN (...) AND available_at <= now ORDER BY available_at
+        Index("ix_email_queue_status_available_at", "status", "available_at"),
+    )
+
+    job_id = Column(CHAR(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    status = Column(SQLEnum(EmailJobStatus), nullable=False, default=EmailJobStatus.PENDING)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    message_id = Column(String(255), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Pydantic Schemas
+
+class EmailJobResponse(BaseModel):
+    """Response returned when an email is accepted into the queue"""
+    success: bool = Field(..., description="Whether the email was queued")
+    job_id: Optional[str] = Field(None, description="Queue job ID to poll for the delivery status")
+    status: Optional[EmailJobStatus] = Field(None, description="Current job status")
+    message: str = Field(..., description="Response message")
+    error: Optional[str] = Field(None, description="Error message if failed")
+
+
+class EmailJobStatusResponse(BaseModel):
+    """Delivery status of a queued email"""
+    job_id: str
+    status: EmailJobStatus
+    attempts: int
+    message_id: Optional[str]
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -2,15 +2,18 @@
 Player (Device) models for OneSignal registration
 """
 
+import hashlib
 import uuid
 from datetime import datetime
 from enum import Enum
 from typing import Optional, List
 
-from sqlalchemy import Column, String, DateTime, Enum as SQLEnum, Text
+from sqlalchemy import Column, String, DateTime, Enum as SQLEnum, Index, Text
 from sqlalchemy.dialects.mysql import CHAR
+from sqlalchemy.orm import validates
 from pydantic import BaseModel, Field
 
+from app.config import settings
 from app.database import Base
 
 
@@ -31,16 +34,33 @@ class DeviceStatus(str, Enum):
     LOGOUT = "LOGOUT"
 
 
+def hash_push_token(push_token: str) -> str:
+    """SHA-256 hex digest of a push token (fixed-width, indexable lookup key)"""
+    return hashlib.sha256(push_token.encode("utf-8")).hexdigest()
+
+
 class Player(Base):
     """Player (Device) SQLAlchemy model"""
     __tablename__ = "players"
+    __table_args__ = (
+        # push_token is TEXT and can't be indexed whole; look devices up by its hash instead
+        Index("uq_players_push_token_hash", "push_token_hash", unique=True),
+        # Listing order (updated_at DESC, player_id DESC) and keyset pagination seeks
+        Index("ix_players_updated_at_player_id", "updated_at", "player_id"),
+        # Push targeting (user_id IN (...) AND status = ...) and listings filtered by user
+        Index("ix_players_user_id_status_updated_at", "user_id", "status", "updated_at", "player_id"),
+        # Listings filtered by status or device type, in listing order
+        Index("ix_players_status_updated_at", "status", "updated_at", "player_id"),
+        Index("ix_players_device_type_updated_at", "device_type", "updated_at", "player_id"),
+    )
 
     player_id = Column(CHAR(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     device_id = Column(CHAR(36), nullable=False, default=lambda: str(uuid.uuid4()))
-    user_id = Column(CHAR(36), nullable=False, index=True)
+    user_id = Column(CHAR(36), nullable=False)
     device_type = Column(SQLEnum(DeviceType), nullable=False)
     push_token = Column(Text, nullable=False)
-    one_signal_id = Column(Text, nullable=True, index=True)
+    push_token_hash = Column(CHAR(64), nullable=False)
+    one_signal_id = Column(String(255), nullable=True, index=True)
     device_model = Column(Text, nullable=True)
     os_version = Column(Text, nullable=True)
     app_version = Column(Text, nullable=True)
@@ -48,6 +68,12 @@ class Player(Base):
     status = Column(SQLEnum(DeviceStatus), default=DeviceStatus.ACTIVE)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    @validates("push_token")
+    def _sync_push_token_hash(self, key, value):
+        """Keep push_token_hash in step with push_token"""
+        self.push_token_hash = hash_push_token(value) if value is not None else None
+        return value
+
 
 # Pydantic Schemas
 
@@ -92,10 +118,36 @@ class PlayerResponse(PlayerBase):
 class PlayerListResponse(BaseModel):
     """Paginated response for player list"""
     items: List[PlayerResponse]
-    total: int
-    page: int
+    total: Optional[int] = Field(None, description="Matching players (only when the total is requested)")
+    page: Optional[int] = Field(None, description="Page number (offset pagination only)")
     page_size: int
-    total_pages: int
+    total_pages: Optional[int] = Field(None, description="Number of pages (only when the total is requested)")
+    next_cursor: Optional[str] = Field(None, description="Token for the next page (cursor pagination only)")
 
     class Config:
         from_attributes = True
+
+
+class PlayerBatchRequest(BaseModel):
+    """Request model for registering many players at once"""
+    players: List[PlayerCreate] = Field(
+        ...,
+        min_length=1,
+        max_length=settings.PLAYER_BATCH_MAX_ITEMS,
+        description="Devices to register or update (matched by push_token)",
+    )
+
+
+class PlayerBatchItemResult(BaseModel):
+    """Outcome for a single device in a batch registration"""
+    index: int = Field(..., description="Position of the device in the request")
+    player_id: str = Field(..., description="Player ID the device is registered as")
+    created: bool = Field(..., description="True if a new player was created, False if an existing one was updated")
+
+
+class PlayerBatchResponse(BaseModel):
+    """Response model for batch player registration"""
+    total: int = Field(..., description="Number of devices in the request")
+    created: int = Field(..., description="Number of devices newly registered")
+    updated: int = Field(..., description="Number of already registered devices that were updated")
+    results: List[PlayerBatchItemResult] = Field(..., description="Per-device outcomes in request order")
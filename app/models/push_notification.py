@@ -5,6 +5,9 @@ Push notification request and response models
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field, model_validator, ConfigDict
 
+from app.config import settings
+from app.models.schedule import ScheduleRequest
+
 
 class PushNotificationRequest(BaseModel):
     """Request model for sending push notifications
@@ -64,9 +67,20 @@ class PushNotificationResponse(BaseModel):
     
     success: bool = Field(..., description="Whether the notification was sent successfully")
     notification_id: Optional[str] = Field(None, description="OneSignal notification ID if successful")
+    notification_ids: Optional[List[str]] = Field(
+        None, description="All OneSignal notification IDs when a large audience was split into several requests"
+    )
     recipients_count: Optional[int] = Field(None, description="Number of recipients")
     message: str = Field(..., description="Response message")
     error: Optional[str] = Field(None, description="Error message if failed")
+    errors: Optional[List[str]] = Field(None, description="Errors from individual requests that failed")
+    retry_job_id: Optional[str] = Field(
+        None,
+        description=(
+            "Retry queue job ID when a transient failure (or the failed part of a split send) "
+            "is being retried in the background"
+        ),
+    )
     
     model_config = ConfigDict(
         json_schema_extra={
@@ -79,3 +93,84 @@ class PushNotificationResponse(BaseModel):
         }
     )
 
+
+class PushBatchItem(BaseModel):
+    """One personalised notification in a batch, addressed to application users"""
+    
+    user_ids: List[str] = Field(..., min_length=1, description="Application user IDs (UUIDs) to notify")
+    headings: Dict[str, str] = Field(..., description="Notification headings in different languages")
+    contents: Dict[str, str] = Field(..., description="Notification contents in different languages")
+    data: Optional[Dict[str, Any]] = Field(None, description="Additional data payload")
+    url: Optional[str] = Field(None, description="URL to open when notification is clicked")
+    priority: int = Field(10, ge=0, le=10, description="Notification priority (0-10)")
+
+
+class PushBatchRequest(BaseModel):
+    """Request model for sending many personalised push notifications at once"""
+    
+    items: List[PushBatchItem] = Field(
+        ...,
+        min_length=1,
+        max_length=settings.PUSH_BATCH_MAX_ITEMS,
+        description="Notifications to send",
+    )
+    
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "items": [
+                    {
+                        "user_ids": ["user-id-1"],
+                        "headings": {"en": "Booking Confirmed"},
+                        "contents": {"en": "Your booking is confirmed"},
+                        "data": {"booking_id": "123", "type": "booking"},
+                    },
+                    {
+                        "user_ids": ["user-id-2"],
+                        "headings": {"en": "Booking Confirmed"},
+                        "contents": {"en": "Your booking is confirmed"},
+                        "data": {"booking_id": "456", "type": "booking"},
+                    },
+                ]
+            }
+        }
+    )
+
+
+class PushBatchItemResult(BaseModel):
+    """Outcome for a single batch item"""
+    
+    index: int = Field(..., description="Position of the item in the request")
+    success: bool = Field(..., description="Whether the notification was sent successfully")
+    notification_id: Optional[str] = Field(None, description="OneSignal notification ID if successful")
+    devices: int = Field(0, description="Number of active devices targeted for this item")
+    error: Optional[str] = Field(None, description="Error message if failed")
+    retry_job_id: Optional[str] = Field(
+        None, description="Retry queue job ID when some of the item's devices are being retried in the background"
+    )
+
+
+class PushBatchResponse(BaseModel):
+    """Response model for batch push notifications"""
+    
+    success: bool = Field(..., description="Whether every item was sent successfully")
+    total: int = Field(..., description="Number of items in the batch")
+    sent: int = Field(..., description="Number of items sent")
+    failed: int = Field(..., description="Number of items that failed")
+    notifications: int = Field(..., description="Number of distinct payloads dispatched to OneSignal")
+    results: List[PushBatchItemResult] = Field(..., description="Per-item results in request order")
+    message: str = Field(..., description="Response message")
+
+
+class ScheduledPushRequest(BaseModel):
+    """Request model for scheduling push notifications (combines notification and schedule)"""
+    
+    notification: PushNotificationRequest = Field(..., description="Push notification request details")
+    schedule: ScheduleRequest = Field(..., description="Schedule configuration")
+    
+    @model_validator(mode='after')
+    def validate_send_after(self):
+        """The schedule decides when the notification is sent"""
+        if self.notification.send_after:
+            raise ValueError("send_after cannot be combined with a schedule")
+        return self
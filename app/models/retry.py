@@ -0,0 +1,91 @@
+"""
+Retry queue and dead-letter models
+"""
+
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
+
+from sqlalchemy import JSON, Column, DateTime, Index, Integer, String, Text
+from sqlalchemy.dialects.mysql import CHAR
+from pydantic import BaseModel, Field
+
+from app.database import Base
+
+
+class RetryJob(Base):
+    """Failed send waiting for its next attempt SQLAlchemy model"""
+    __tablename__ = "retry_jobs"
+    __table_args__ = (
+        # Workers claim due jobs with: available_at <= now ORDER BY available_at
+        Index("ix_retry_jobs_available_at", "available_at"),
+    )
+
+    job_id = Column(CHAR(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    # "email" (send_email arguments) or "push" (send_notification arguments)
+    kind = Column(String(16), nullable=False)
+    payload = Column(JSON, nullable=False)
+    # Attempts made so far, including the one that failed on the request path
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DeadLetter(Base):
+    """Send that failed permanently or ran out of attempts SQLAlchemy model"""
+    __tablename__ = "dead_letters"
+    __table_args__ = (
+        Index("ix_dead_letters_kind_created_at", "kind", "created_at"),
+    )
+
+    dead_letter_id = Column(CHAR(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = Column(String(16), nullable=False)
+    # Where the send was last attempted: "retry" (retry queue), "queue" (outbound email queue)
+    # or "send" (the failed part of a push that was otherwise sent)
+    source = Column(String(16), nullable=False)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Pydantic Schemas
+
+class DeadLetterResponse(BaseModel):
+    """A parked send"""
+    dead_letter_id: str
+    kind: str
+    source: str
+    payload: Dict[str, Any]
+    attempts: int
+    error: Optional[str]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class DeadLetterListResponse(BaseModel):
+    """A page of parked sends, newest first"""
+    dead_letters: List[DeadLetterResponse]
+    count: int
+
+
+class DeadLetterReplayRequest(BaseModel):
+    """Selects parked sends to move back onto the retry queue"""
+    dead_letter_ids: Optional[List[str]] = Field(
+        None, max_length=1000, description="Dead letters to replay (default: the oldest ones matching kind)"
+    )
+    kind: Optional[Literal["email", "push"]] = Field(None, description="Only replay this kind of send")
+    limit: int = Field(100, ge=1, le=1000, description="Maximum number of dead letters to replay")
+
+
+class DeadLetterReplayResponse(BaseModel):
+    """Outcome of a bulk replay"""
+    success: bool
+    replayed: int = Field(..., description="Number of dead letters moved back onto the retry queue")
+    job_ids: List[str] = Field(..., description="Retry queue job IDs created for them")
+    message: str
@@ -1,14 +1,53 @@
 """
-Email scheduling models
+Scheduling models
 """
 
 from datetime import datetime
 from typing import Optional, Literal
 from pydantic import BaseModel, Field, field_validator, model_validator
+from sqlalchemy import JSON, Column, DateTime, Index, String
+from sqlalchemy.dialects.mysql import CHAR
+
+from app.database import Base
+
+
+class ScheduledJob(Base):
+    """
+    Scheduled send metadata SQLAlchemy model
+    
+    In local mode the trigger itself is persisted by APScheduler's job store and
+    this row holds what the job sends and how it was scheduled. In distributed
+    mode the row is also the unit of work: instances claim due rows by leasing
+    them (next_run_at / claimed_run_at / lease_*).
+    """
+    __tablename__ = "scheduled_jobs"
+    __table_args__ = (
+        # Due runs: claimed_run_at IS NULL AND next_run_at <= now ORDER BY next_run_at
+        Index("ix_scheduled_jobs_claimed_run_at_next_run_at", "claimed_run_at", "next_run_at"),
+        # Runs whose instance died mid-send: lease_expires_at < now
+        Index("ix_scheduled_jobs_lease_expires_at", "lease_expires_at"),
+    )
+
+    schedule_id = Column(CHAR(36), primary_key=True)
+    # What the payload sends: "email" (send_email arguments) or "push" (notification fields)
+    kind = Column(String(16), nullable=False, default="email")
+    schedule_type = Column(String(16), nullable=False)
+    schedule = Column(JSON, nullable=False)
+    payload = Column(JSON, nullable=False)
+    scheduled_for = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+    # UTC; NULL once the schedule has no further runs
+    next_run_at = Column(DateTime, nullable=True)
+    # Run (UTC) currently being sent by lease_owner, held until lease_expires_at
+    claimed_run_at = Column(DateTime, nullable=True)
+    lease_owner = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class ScheduleRequest(BaseModel):
-    """Request model for scheduling emails"""
+    """Request model for scheduling emails and push notifications"""
     
     schedule_type: Literal["once", "daily", "weekly", "monthly"] = Field(
         ...,
@@ -0,0 +1,84 @@
+"""
+Dead letter API router
+Handles HTTP endpoints for inspecting and replaying sends that could not be delivered
+"""
+
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query, status
+from app.models.retry import (
+    DeadLetterListResponse,
+    DeadLetterReplayRequest,
+    DeadLetterReplayResponse,
+    DeadLetterResponse,
+)
+from app.services.retry_service import retry_queue
+
+router = APIRouter(prefix="/api/dead-letters", tags=["Dead Letters"])
+
+
+@router.get("", response_model=DeadLetterListResponse, status_code=status.HTTP_200_OK)
+def list_dead_letters(
+    kind: Optional[Literal["email", "push"]] = Query(None, description="Only list this kind of send"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of dead letters to return"),
+    offset: int = Query(0, ge=0, description="Number of dead letters to skip"),
+):
+    """
+    List sends that failed permanently or ran out of retries, newest first
+    
+    - **kind**: Optional filter, 'email' or 'push'
+    - **limit**: Page size
+    - **offset**: Number of dead letters to skip
+    """
+    dead_letters = retry_queue.list_dead_letters(kind=kind, limit=limit, offset=offset)
+    return DeadLetterListResponse(
+        dead_letters=[DeadLetterResponse.model_validate(dead_letter) for dead_letter in dead_letters],
+        count=len(dead_letters),
+    )
+
+
+@router.get("/{dead_letter_id}", response_model=DeadLetterResponse, status_code=status.HTTP_200_OK)
+def get_dead_letter(dead_letter_id: str):
+    """
+    Get a dead letter, including its payload and last error
+    
+    - **dead_letter_id**: The dead letter ID
+    """
+    dead_letter = retry_queue.get_dead_letter(dead_letter_id)
+    if not dead_letter:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dead letter not found",
+        )
+    return dead_letter
+
+
+@router.post("/replay", response_model=DeadLetterReplayResponse, status_code=status.HTTP_200_OK)
+async def replay_dead_letters(request: DeadLetterReplayRequest):
+    """
+    Move dead letters back onto the retry queue
+    
+    - **dead_letter_ids**: Dead letters to replay (omit to replay the oldest ones)
+    - **kind**: Optional filter, 'email' or 'push'
+    - **limit**: Maximum number of dead letters to replay (default 100)
+    
+    Replayed sends get a fresh set of attempts and are retried right away.
+    """
+    try:
+        job_ids = await retry_queue.replay_dead_letters(
+            dead_letter_ids=request.dead_letter_ids,
+            kind=request.kind,
+            limit=request.limit,
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to replay dead letters: {str(e)}",
+        )
+    
+    return DeadLetterReplayResponse(
+        success=True,
+        replayed=len(job_ids),
+        job_ids=job_ids,
+        message=f"Replayed {len(job_ids)} dead letters",
+    )
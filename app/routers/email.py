@@ -3,11 +3,26 @@ Email API router
 Handles HTTP endpoints for email operations
 """
 
-from fastapi import APIRouter, Body, HTTPException, status
-from app.models.email import EmailRequest, EmailResponse, ScheduledEmailRequest, SEND_EMAIL_OPENAPI_EXAMPLES
+from typing import Optional
+
+from fastapi import APIRouter, Body, HTTPException, Query, Response, status
+from app.config import settings
+from app.models.email import (
+    BatchEmailRequest,
+    BatchEmailResponse,
+    EmailRequest,
+    EmailResponse,
+    ScheduledEmailRequest,
+    SEND_EMAIL_OPENAPI_EXAMPLES,
+)
+from app.models.email_queue import EmailJobResponse, EmailJobStatus, EmailJobStatusResponse
 from app.models.schedule import ScheduleRequest, ScheduleResponse
+from app.services.attachment_cache import attachment_cache_stats
+from app.services.email_queue_service import QueueFullError, email_queue
 from app.services.email_service import EmailService
+from app.services.retry_service import retry_queue
 from app.services.scheduler_service import SchedulerService
+from app.templates.template_loader import TemplateLoader
 
 router = APIRouter(prefix="/api/email", tags=["Email"])
 
@@ -21,7 +36,8 @@ scheduler_service = SchedulerService()
 
 @router.post("/send", response_model=EmailResponse, status_code=status.HTTP_200_OK)
 async def send_email(
-    email_request: EmailRequest = Body(..., openapi_examples=SEND_EMAIL_OPENAPI_EXAMPLES)
+    response: Response,
+    email_request: EmailRequest = Body(..., openapi_examples=SEND_EMAIL_OPENAPI_EXAMPLES),
 ):
     """
     Send an email using Gmail SMTP
@@ -47,6 +63,10 @@ async def send_email(
     - **is_html**: Whether the body is HTML content (default: True)
     - **reply_to**: Optional reply-to email address
     - **attachments**: Optional list of attachment file paths
+    
+    If delivery fails with a transient error (e.g. an SMTP 4xx reply), the email is
+    retried in the background and **202 Accepted** is returned with a `retry_job_id`;
+    emails that still can't be delivered end up in `/api/dead-letters`.
     """
     try:
         result = await email_service.send_email(
@@ -62,6 +82,18 @@ async def send_email(
             attachments=email_request.attachments,
         )
         
+        if not result["success"] and result.get("retryable"):
+            try:
+                result["retry_job_id"] = await retry_queue.schedule(
+                    "email", email_request.model_dump(mode="json", exclude_none=True), result.get("error")
+                )
+            except Exception as e:
+                result["error"] = f"{result.get('error')} (could not queue for retry: {e})"
+            else:
+                result["message"] = "Email delivery failed temporarily; retrying in the background"
+                response.status_code = status.HTTP_202_ACCEPTED
+                return EmailResponse(**result)
+        
         if not result["success"]:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -84,6 +116,112 @@ async def send_email(
         )
 
 
+@router.post("/enqueue", response_model=EmailJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_email(
+    email_request: EmailRequest = Body(..., openapi_examples=SEND_EMAIL_OPENAPI_EXAMPLES)
+):
+    """
+    Queue an email for background delivery and return immediately
+    
+    Accepts the same body as `/send`. The email is persisted to the outbound queue
+    and delivered by the queue workers; poll `/jobs/{job_id}` for the outcome.
+    
+    Returns **429 Too Many Requests** when the queue is full.
+    """
+    try:
+        job_id = await email_queue.enqueue(email_request.model_dump(mode="json", exclude_none=True))
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(settings.EMAIL_QUEUE_POLL_INTERVAL * 5)))},
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to queue email: {str(e)}",
+        )
+    
+    return EmailJobResponse(
+        success=True,
+        job_id=job_id,
+        status=EmailJobStatus.PENDING,
+        message="Email queued for delivery",
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=EmailJobStatusResponse, status_code=status.HTTP_200_OK)
+def get_email_job(job_id: str):
+    """
+    Get the delivery status of a queued email
+    
+    - **job_id**: The job ID returned by `/enqueue`
+    """
+    job = email_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found",
+        )
+    return job
+
+
+@router.post("/send-batch", response_model=BatchEmailResponse, status_code=status.HTTP_200_OK)
+async def send_email_batch(batch_request: BatchEmailRequest):
+    """
+    Send one template to many recipients with per-recipient personalization
+    
+    The request is validated once, recipients are rendered and sent concurrently,
+    and pooled SMTP sessions are reused across the whole batch.
+    
+    - **template_type**: Email template type used for every recipient
+    - **template_context**: Template variables shared by every recipient (optional)
+    - **recipients**: List of recipients, each with:
+      - **to**: Recipient email addresses
+      - **cc** / **bcc**: Optional CC / BCC addresses
+      - **template_context**: Per-recipient variables (override the shared ones)
+    - **subject**: Optional subject override for every recipient
+    - **reply_to**: Optional reply-to email address
+    - **attachments**: Optional list of attachment file paths sent to every recipient
+    
+    Returns per-recipient results in request order. Individual failures do not fail
+    the request; check `failed` and each result's `success`.
+    """
+    try:
+        result = await email_service.send_batch(
+            template_type=batch_request.template_type,
+            recipients=[
+                {
+                    "to": recipient.to,
+                    "cc": recipient.cc,
+                    "bcc": recipient.bcc,
+                    "template_context": recipient.template_context,
+                }
+                for recipient in batch_request.recipients
+            ],
+            template_context=batch_request.template_context,
+            subject=batch_request.subject,
+            reply_to=batch_request.reply_to,
+            attachments=batch_request.attachments,
+        )
+        
+        if result.get("error"):
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=result["error"],
+            )
+        
+        return BatchEmailResponse(**result)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unexpected error: {str(e)}",
+        )
+
+
 @router.post("/schedule", response_model=ScheduleResponse, status_code=status.HTTP_200_OK)
 async def schedule_email(request: ScheduledEmailRequest):
     """
@@ -101,19 +239,8 @@ async def schedule_email(request: ScheduledEmailRequest):
       - **end_date**: Optional end date for recurring schedules
     """
     try:
-        # Prepare email data
-        email_data = {
-            "to": request.email.to,
-            "subject": request.email.subject,
-            "body": request.email.body,
-            "template_type": request.email.template_type,
-            "template_context": request.email.template_context,
-            "cc": request.email.cc,
-            "bcc": request.email.bcc,
-            "is_html": request.email.is_html,
-            "reply_to": request.email.reply_to,
-            "attachments": request.email.attachments,
-        }
+        # Stored with the schedule, so keep it JSON-serialisable
+        email_data = request.email.model_dump(mode="json", exclude_none=True)
         
         result = await scheduler_service.schedule_email(
             email_data=email_data,
@@ -143,7 +270,7 @@ async def schedule_email(request: ScheduledEmailRequest):
 
 
 @router.delete("/schedule/{schedule_id}", status_code=status.HTTP_200_OK)
-async def cancel_scheduled_email(schedule_id: str):
+def cancel_scheduled_email(schedule_id: str):
     """
     Cancel a scheduled email
     
@@ -161,7 +288,7 @@ async def cancel_scheduled_email(schedule_id: str):
 
 
 @router.get("/schedule/{schedule_id}", status_code=status.HTTP_200_OK)
-async def get_scheduled_email(schedule_id: str):
+def get_scheduled_email(schedule_id: str):
     """
     Get information about a scheduled email
     
@@ -179,15 +306,22 @@ async def get_scheduled_email(schedule_id: str):
         "schedule_id": schedule["schedule_id"],
         "schedule_type": schedule["schedule_type"],
         "scheduled_for": schedule["scheduled_for"],
+        "last_run_at": schedule["last_run_at"],
     }
 
 
 @router.get("/schedule", status_code=status.HTTP_200_OK)
-async def list_scheduled_emails():
+def list_scheduled_emails(
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Maximum number of schedules to return"),
+    offset: int = Query(0, ge=0, description="Number of schedules to skip"),
+):
     """
-    List all scheduled emails
+    List scheduled emails, soonest first
+    
+    - **limit**: Optional page size (all schedules when omitted)
+    - **offset**: Number of schedules to skip
     """
-    schedules = scheduler_service.list_schedules()
+    schedules = scheduler_service.list_schedules(limit=limit, offset=offset)
     return {"schedules": schedules, "count": len(schedules)}
 
 
@@ -200,5 +334,9 @@ async def email_health_check():
         "status": "healthy",
         "service": "email",
         "provider": "gmail",
+        "transport": settings.SMTP_TRANSPORT,
+        "relays": email_service.relays.stats(),
+        "template_render_cache": TemplateLoader.render_cache_stats(),
+        "attachment_cache": attachment_cache_stats(),
     }
 
@@ -3,14 +3,36 @@ API Router for Player (Device) Registration
 """
 
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 from math import ceil
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app.models.player import Player, PlayerCreate, PlayerResponse, PlayerUpdate, DeviceStatus, PlayerListResponse
+from app.models.player import (
+    Player,
+    PlayerCreate,
+    PlayerResponse,
+    PlayerUpdate,
+    DeviceStatus,
+    PlayerListResponse,
+    PlayerBatchRequest,
+    PlayerBatchResponse,
+    PlayerBatchItemResult,
+)
+from app.services.player_service import (
+    count_players_query,
+    decode_player_cursor,
+    encode_player_cursor,
+    invalidate_device_targets,
+    list_players_query,
+    player_filters,
+    run_in_transaction,
+    upsert_player,
+    upsert_players,
+)
 
 router = APIRouter(
     prefix="/players",
@@ -22,109 +44,118 @@ router = APIRouter(
 @router.post("/register", response_model=PlayerResponse, status_code=status.HTTP_201_CREATED)
 def register_player(player_in: PlayerCreate, db: Session = Depends(get_db)):
     """
-    Register a new player (device) or update existing one if player_id exists (via logic, though here we might just create new or find by token).
+    Register a player (device), or re-register an existing one.
     
-    Since player_id is usually generated on client side or server side and persisted. 
-    If the client sends a player_id, we should probably use that to look up.
-    However, the requirement says player_id is UUID / Auto ID. 
+    Devices are identified by their push token. Registration is a single
+    upsert keyed on the token hash: a new token creates a player, a known
+    token is reassigned to the given user, refreshed and marked active.
+    Concurrent registrations of the same token resolve to one row.
+    """
+    player, previous_user_id = upsert_player(db, player_in)
+    db.commit()
     
-    Strategy:
-    1. Check if a player with the same push_token exists.
-    2. If yes, update it.
-    3. If no, create a new one.
+    invalidate_device_targets(previous_user_id, player_in.user_id)
+    return player
+
+
+@router.post("/register-batch", response_model=PlayerBatchResponse, status_code=status.HTTP_200_OK)
+def register_players_batch(batch: PlayerBatchRequest, db: Session = Depends(get_db)):
+    """
+    Register or update many players (devices) in one request.
     
-    Wait, usually player_id is unique per device. 
-    If the client doesn't send player_id, we create one.
-    But for "registration", usually the client wants to tell us "I am this device".
+    Devices are matched by push token exactly like `/register`; if the same
+    token appears more than once, the last occurrence wins. Rows are written
+    with chunked multi-row upserts inside a single transaction, so either the
+    whole batch is applied or none of it is. A transaction rolled back as a
+    deadlock victim is retried.
     
-    Let's assume for now we look up by push_token for simplicity if player_id is not provided (though it's not in the input schema).
-    Actually, let's look at the input schema `PlayerCreate`. It doesn't have player_id.
-    So we will check if `push_token` exists.
+    - **players**: List of devices to register
     """
-    
-    # Check if player with this push_token already exists
-    existing_player = db.query(Player).filter(Player.push_token == player_in.push_token).first()
-    
-    if existing_player:
-        # Update existing player
-        existing_player.user_id = player_in.user_id
-        existing_player.device_type = player_in.device_type
-        existing_player.one_signal_id = player_in.one_signal_id
-        existing_player.device_model = player_in.device_model
-        existing_player.os_version = player_in.os_version
-        existing_player.app_version = player_in.app_version
-        existing_player.last_login_at = datetime.utcnow()
-        existing_player.status = DeviceStatus.ACTIVE
-        
-        db.commit()
-        db.refresh(existing_player)
-        return existing_player
-    
-    # Create new player
-    new_player = Player(
-        user_id=player_in.user_id,
-        device_type=player_in.device_type,
-        push_token=player_in.push_token,
-        one_signal_id=player_in.one_signal_id,
-        device_model=player_in.device_model,
-        os_version=player_in.os_version,
-        app_version=player_in.app_version,
-        last_login_at=datetime.utcnow(),
-        status=DeviceStatus.ACTIVE
+    try:
+        outcomes, affected_user_ids = run_in_transaction(db, lambda: upsert_players(db, batch.players))
+    except SQLAlchemyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Batch registration failed: {str(e)}"
+        )
+    
+    invalidate_device_targets(*affected_user_ids)
+    
+    results = [
+        PlayerBatchItemResult(index=index, player_id=player_id, created=created)
+        for index, (player_id, created) in enumerate(outcomes)
+    ]
+    created_ids = {result.player_id for result in results if result.created}
+    return PlayerBatchResponse(
+        total=len(results),
+        created=len(created_ids),
+        updated=len({result.player_id for result in results} - created_ids),
+        results=results,
     )
-    
-    db.add(new_player)
-    db.commit()
-    db.refresh(new_player)
-    return new_player
 
 
 @router.get("", response_model=PlayerListResponse)
 def list_players(
-    page: int = Query(1, ge=1, description="Page number (1-indexed)"),
+    page: int = Query(1, ge=1, description="Page number (1-indexed, offset pagination)"),
     page_size: int = Query(10, ge=1, le=100, description="Number of items per page"),
     user_id: Optional[str] = Query(None, description="Filter by user ID"),
     device_type: Optional[str] = Query(None, description="Filter by device type"),
     status: Optional[str] = Query(None, description="Filter by status"),
+    pagination: Literal["offset", "cursor"] = Query("offset", description="Pagination mode"),
+    cursor: Optional[str] = Query(None, description="Continuation token from a previous page (implies cursor pagination)"),
+    include_total: Optional[bool] = Query(None, description="Count matching players (default: offset yes, cursor no)"),
     db: Session = Depends(get_db)
 ):
     """
     Get a paginated list of players with optional filters
     
-    - **page**: Page number (starts from 1)
+    Offset pagination (the default) returns numbered pages. Cursor pagination
+    returns a `next_cursor` token instead; each page is a seek on the
+    (updated_at, player_id) index, so deep pages are as fast as the first.
+    
+    - **page**: Page number (starts from 1, offset pagination only)
     - **page_size**: Number of items per page (1-100)
     - **user_id**: Optional filter by user ID
     - **device_type**: Optional filter by device type
     - **status**: Optional filter by status (active, blocked, logout)
+    - **pagination**: `offset` or `cursor`
+    - **cursor**: `next_cursor` from the previous page
+    - **include_total**: Also return `total` / `total_pages` (costs a COUNT)
     """
-    # Build query with filters
-    query = db.query(Player)
-    
-    if user_id:
-        query = query.filter(Player.user_id == user_id)
-    
-    if device_type:
-        query = query.filter(Player.device_type == device_type)
-    
-    if status:
-        query = query.filter(Player.status == status)
-    
-    # Get total count
-    total = query.count()
-    
-    # Calculate pagination
-    skip = (page - 1) * page_size
-    total_pages = ceil(total / page_size) if total > 0 else 0
-    
-    # Get paginated results
-    players = query.order_by(Player.updated_at.desc()).offset(skip).limit(page_size).all()
+    criteria = player_filters(user_id=user_id, device_type=device_type, status=status)
+    use_cursor = pagination == "cursor" or cursor is not None
+    if include_total is None:
+        include_total = not use_cursor
+    
+    total = db.scalar(count_players_query(criteria)) if include_total else None
+    total_pages = (ceil(total / page_size) if total > 0 else 0) if include_total else None
+    
+    if not use_cursor:
+        skip = (page - 1) * page_size
+        players = db.scalars(list_players_query(criteria, limit=page_size, offset=skip)).all()
+        return PlayerListResponse(
+            items=players,
+            total=total,
+            page=page,
+            page_size=page_size,
+            total_pages=total_pages
+        )
+    
+    try:
+        after = decode_player_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Fetch one extra row to learn whether another page follows
+    players = db.scalars(list_players_query(criteria, limit=page_size + 1, after=after)).all()
+    next_cursor = encode_player_cursor(players[page_size - 1]) if len(players) > page_size else None
     
     return PlayerListResponse(
-        items=players,
+        items=players[:page_size],
         total=total,
-        page=page,
         page_size=page_size,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor
     )
 
 
@@ -152,7 +183,12 @@ def update_player(player_id: str, player_in: PlayerUpdate, db: Session = Depends
     if "status" in update_data and update_data["status"] == DeviceStatus.ACTIVE:
          player.last_login_at = datetime.utcnow()
 
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="push_token is already registered to another player")
+    invalidate_device_targets(player.user_id)
     db.refresh(player)
     return player
 
@@ -166,4 +202,5 @@ def delete_player(player_id: str, db: Session = Depends(get_db)):
     
     db.delete(player)
     db.commit()
+    invalidate_device_targets(player.user_id)
     return None
@@ -3,24 +3,45 @@ Push Notification API router
 Handles HTTP endpoints for push notification operations
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends
-from sqlalchemy.orm import Session
-from typing import List
-from app.models.push_notification import PushNotificationRequest, PushNotificationResponse
-from app.services.push_notification_service import PushNotificationService
-from app.database import get_db
-from app.models.player import Player, DeviceStatus
+import asyncio
+import json
+import uuid
+from fastapi import APIRouter, HTTPException, Query, Response, status, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional, Set
+from app.config import settings
+from app.models.push_notification import (
+    PushBatchItem,
+    PushBatchRequest,
+    PushBatchResponse,
+    PushNotificationRequest,
+    PushNotificationResponse,
+    ScheduledPushRequest,
+)
+from app.models.schedule import ScheduleResponse
+from app.services.push_notification_service import PushNotificationService, onesignal_limiter
+from app.services.player_service import (
+    DeviceTarget,
+    device_target_cache_stats,
+    get_device_targets,
+    split_device_targets,
+)
+from app.services.retry_service import retry_queue
+from app.services.scheduler_service import SchedulerService
+from app.database import get_async_db
 
 router = APIRouter(prefix="/api/push", tags=["Push Notifications"])
 
-# Initialize push notification service
+# Initialize services
 push_service = PushNotificationService()
+scheduler_service = SchedulerService()
 
 
 @router.post("/send", response_model=PushNotificationResponse, status_code=status.HTTP_200_OK)
 async def send_push_notification(
     notification_request: PushNotificationRequest,
-    db: Session = Depends(get_db)
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Send a push notification using OneSignal API
@@ -38,6 +59,11 @@ async def send_push_notification(
     
     Note: At least one targeting method must be provided.
     If user_ids is provided, the system will query the Player table to get the corresponding OneSignal IDs.
+    
+    If OneSignal fails transiently (429, 5xx, timeout), the notification is retried in the
+    background and **202 Accepted** is returned with a `retry_job_id`. If only some of the
+    requests of a split audience fail, the rest is reported as sent and the failed requests
+    are retried (`retry_job_id`) or, if they failed permanently, parked as dead letters.
     """
     try:
         # If user_ids are provided, query Player table to get OneSignal IDs
@@ -45,25 +71,19 @@ async def send_push_notification(
         one_signal_ids: List[str] = []
         
         if notification_request.user_ids:
-            # Query Player table for players with matching user_ids
-            players = db.query(Player).filter(
-                Player.user_id.in_(notification_request.user_ids),
-                Player.status == DeviceStatus.ACTIVE  # Only active players
-            ).all()
+            # Resolve active players for the user_ids (async query, doesn't block the event loop)
+            targets_by_user = await get_device_targets(db, notification_request.user_ids)
             
-            if not players:
+            if not targets_by_user:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"No active players found for the provided user_ids: {notification_request.user_ids}"
                 )
             
             # Collect push_tokens and one_signal_ids
-            for player in players:
-                if player.push_token:
-                    print("push_token", player.push_token)
-                    external_user_ids.append(player.push_token)
-                if player.one_signal_id:
-                    one_signal_ids.append(player.one_signal_id)
+            one_signal_ids, external_user_ids = split_device_targets(
+                target for targets in targets_by_user.values() for target in targets
+            )
             
             if not external_user_ids and not one_signal_ids:
                 raise HTTPException(
@@ -76,18 +96,36 @@ async def send_push_notification(
         if one_signal_ids:
             final_player_ids.extend(one_signal_ids)
         
-        result = await push_service.send_notification(
-            player_ids=final_player_ids if final_player_ids else None,
-            external_user_ids=external_user_ids if external_user_ids else None,
-            subscription_ids=notification_request.subscription_ids,
-            segments=notification_request.segments,
-            headings=notification_request.headings,
-            contents=notification_request.contents,
-            data=notification_request.data,
-            url=notification_request.url,
-            send_after=notification_request.send_after,
-            priority=notification_request.priority,
-        )
+        notification_kwargs = {
+            "player_ids": final_player_ids if final_player_ids else None,
+            "external_user_ids": external_user_ids if external_user_ids else None,
+            "subscription_ids": notification_request.subscription_ids,
+            "segments": notification_request.segments,
+            "headings": notification_request.headings,
+            "contents": notification_request.contents,
+            "data": notification_request.data,
+            "url": notification_request.url,
+            "send_after": notification_request.send_after,
+            "priority": notification_request.priority,
+            # Carried into the retry payload, so a retry can't duplicate a send that did go out
+            "idempotency_key": str(uuid.uuid4()),
+        }
+        result = await push_service.send_notification(**notification_kwargs)
+        
+        if not result["success"] and result.get("retryable"):
+            try:
+                # Retried with the devices resolved now, so the retry reaches the same audience
+                result["retry_job_id"] = await retry_queue.schedule(
+                    "push",
+                    {key: value for key, value in notification_kwargs.items() if value is not None},
+                    result.get("error"),
+                )
+            except Exception as e:
+                result["error"] = f"{result.get('error')} (could not queue for retry: {e})"
+            else:
+                result["message"] = "Push notification failed temporarily; retrying in the background"
+                response.status_code = status.HTTP_202_ACCEPTED
+                return PushNotificationResponse(**result)
         
         if not result["success"]:
             raise HTTPException(
@@ -95,6 +133,12 @@ async def send_push_notification(
                 detail=result.get("error", "Failed to send push notification"),
             )
         
+        # Some requests of a split audience failed: retry or park just those recipients
+        try:
+            result["retry_job_id"] = await retry_queue.follow_up_partial_push(notification_kwargs, result)
+        except Exception as e:
+            result["errors"] = [*(result.get("errors") or []), f"Could not queue failed requests for retry: {e}"]
+        
         return PushNotificationResponse(**result)
         
     except HTTPException:
@@ -106,6 +150,243 @@ async def send_push_notification(
         )
 
 
+def _payload_key(item: PushBatchItem) -> str:
+    """Items with the same key render the same notification and can share one dispatch"""
+    return json.dumps(
+        {
+            "headings": item.headings,
+            "contents": item.contents,
+            "data": item.data,
+            "url": item.url,
+            "priority": item.priority,
+        },
+        sort_keys=True,
+        default=str,
+    )
+
+
+def _target_set(targets: Optional[Dict[str, List[str]]]) -> Set[DeviceTarget]:
+    """send_notification targeting arguments as a set of device targets"""
+    return {(field, target_id) for field, target_ids in (targets or {}).items() for target_id in target_ids}
+
+
+@router.post("/send-batch", response_model=PushBatchResponse, status_code=status.HTTP_200_OK)
+async def send_push_notification_batch(
+    batch_request: PushBatchRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Send many personalised push notifications in one request
+    
+    - **items**: List of notifications, each with:
+      - **user_ids**: Application user IDs (UUIDs) to notify
+      - **headings** / **contents**: Notification text in different languages
+      - **data**: Additional data payload (e.g. a per-user booking_id)
+      - **url**: URL to open when notification is clicked
+      - **priority**: Notification priority (0-10)
+    
+    All user_ids are resolved with a single Player query. Items with identical
+    headings, contents, data, url and priority are merged into one OneSignal
+    notification, and the distinct notifications are dispatched concurrently.
+    Returns per-item results in request order. When a large notification is
+    split into several requests and some of them fail, the items whose devices
+    were only in failed requests are reported as failed (with a `retry_job_id`
+    if those requests are being retried).
+    """
+    try:
+        # Resolve every user in one query
+        all_user_ids = {user_id for item in batch_request.items for user_id in item.user_ids}
+        devices_by_user = await get_device_targets(db, all_user_ids)
+        
+        # Group items that share a payload, merging their targets
+        results: List[Dict[str, Any]] = []
+        groups: Dict[str, Dict[str, Any]] = {}
+        for index, item in enumerate(batch_request.items):
+            devices = [device for user_id in item.user_ids for device in devices_by_user.get(user_id, [])]
+            result = {"index": index, "success": False, "notification_id": None, "devices": len(devices), "error": None}
+            results.append(result)
+            if not devices:
+                result["error"] = "No active players with push tokens or OneSignal IDs found for the provided user_ids"
+                continue
+            
+            group = groups.setdefault(
+                _payload_key(item),
+                {"item": item, "targets": {"player_ids": {}, "external_user_ids": {}}, "results": []},
+            )
+            for field, target_id in devices:
+                group["targets"][field][target_id] = None  # dict keeps insertion order and dedupes
+            group["results"].append((result, devices))
+        
+        semaphore = asyncio.Semaphore(max(1, settings.PUSH_BATCH_CONCURRENCY))
+        
+        async def dispatch(group: Dict[str, Any]) -> None:
+            item: PushBatchItem = group["item"]
+            notification_kwargs = {
+                "player_ids": list(group["targets"]["player_ids"]) or None,
+                "external_user_ids": list(group["targets"]["external_user_ids"]) or None,
+                "headings": item.headings,
+                "contents": item.contents,
+                "data": item.data,
+                "url": item.url,
+                "priority": item.priority,
+                "idempotency_key": str(uuid.uuid4()),
+            }
+            async with semaphore:
+                result = await push_service.send_notification(**notification_kwargs)
+            retry_job_id = None
+            if result["success"]:
+                try:
+                    retry_job_id = await retry_queue.follow_up_partial_push(notification_kwargs, result)
+                except Exception as e:
+                    result["error"] = f"Could not queue failed requests for retry: {e}"
+            
+            # A partly sent push succeeds overall; items whose devices were in failed requests didn't
+            retrying = _target_set(result.get("retry_targets"))
+            parked = _target_set(result.get("failed_targets"))
+            for item_result, devices in group["results"]:
+                item_result["success"] = result["success"]
+                item_result["notification_id"] = result.get("notification_id")
+                item_result["error"] = result.get("error")
+                if not result["success"]:
+                    continue
+                
+                pending = [device for device in devices if device in retrying]
+                lost = [device for device in devices if device in parked]
+                if not (pending or lost):
+                    continue
+                item_result["success"] = len(pending) + len(lost) < len(devices)
+                item_result["error"] = "; ".join(
+                    f"{len(failed)} of {len(devices)} devices {outcome}: {error}"
+                    for failed, outcome, error in (
+                        (pending, "failed temporarily and are being retried", result.get("retry_error")),
+                        (lost, "failed permanently (moved to dead letters)", result.get("failed_error")),
+                    )
+                    if failed
+                )
+                if pending:
+                    item_result["retry_job_id"] = retry_job_id
+        
+        await asyncio.gather(*(dispatch(group) for group in groups.values()))
+        
+        sent = sum(1 for r in results if r["success"])
+        failed = len(results) - sent
+        return PushBatchResponse(
+            success=failed == 0,
+            total=len(results),
+            sent=sent,
+            failed=failed,
+            notifications=len(groups),
+            results=results,
+            message=f"Batch processed: {sent} sent, {failed} failed in {len(groups)} notifications",
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unexpected error: {str(e)}",
+        )
+
+
+@router.post("/schedule", response_model=ScheduleResponse, status_code=status.HTTP_200_OK)
+async def schedule_push_notification(request: ScheduledPushRequest):
+    """
+    Schedule a push notification to be sent at a specific time or recurring schedule
+    
+    - **notification**: Push notification request (same structure as /send, without send_after)
+    - **schedule**: Schedule configuration (same structure as /api/email/schedule)
+    
+    user_ids are resolved to their active devices each time the schedule fires,
+    not when it is created.
+    """
+    try:
+        # Stored with the schedule, so keep it JSON-serialisable
+        notification_data = request.notification.model_dump(mode="json", exclude_none=True)
+        
+        result = await scheduler_service.schedule_push(
+            notification_data=notification_data,
+            schedule=request.schedule
+        )
+        
+        if not result["success"]:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=result.get("error", "Failed to schedule push notification"),
+            )
+        
+        return ScheduleResponse(**result)
+        
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Unexpected error: {str(e)}",
+        )
+
+
+@router.delete("/schedule/{schedule_id}", status_code=status.HTTP_200_OK)
+def cancel_scheduled_push_notification(schedule_id: str):
+    """
+    Cancel a scheduled push notification
+    
+    - **schedule_id**: The ID of the scheduled push notification to cancel
+    """
+    result = scheduler_service.cancel_schedule(schedule_id, kind="push")
+    
+    if not result["success"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=result.get("message", "Schedule not found"),
+        )
+    
+    return result
+
+
+@router.get("/schedule/{schedule_id}", status_code=status.HTTP_200_OK)
+def get_scheduled_push_notification(schedule_id: str):
+    """
+    Get information about a scheduled push notification
+    
+    - **schedule_id**: The ID of the scheduled push notification
+    """
+    schedule = scheduler_service.get_schedule(schedule_id, kind="push")
+    
+    if not schedule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Schedule not found",
+        )
+    
+    return {
+        "schedule_id": schedule["schedule_id"],
+        "schedule_type": schedule["schedule_type"],
+        "scheduled_for": schedule["scheduled_for"],
+        "last_run_at": schedule["last_run_at"],
+    }
+
+
+@router.get("/schedule", status_code=status.HTTP_200_OK)
+def list_scheduled_push_notifications(
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Maximum number of schedules to return"),
+    offset: int = Query(0, ge=0, description="Number of schedules to skip"),
+):
+    """
+    List scheduled push notifications, soonest first
+    
+    - **limit**: Optional page size (all schedules when omitted)
+    - **offset**: Number of schedules to skip
+    """
+    schedules = scheduler_service.list_schedules(limit=limit, offset=offset, kind="push")
+    return {"schedules": schedules, "count": len(schedules)}
+
+
 @router.get("/health", status_code=status.HTTP_200_OK)
 async def push_health_check():
     """
@@ -115,5 +396,7 @@ async def push_health_check():
         "status": "healthy",
         "service": "push_notification",
         "provider": "onesignal",
+        "device_target_cache": device_target_cache_stats(),
+        "onesignal_limiter": onesignal_limiter.stats(),
     }
 
@@ -0,0 +1,83 @@
+"""
+Encoded attachment cache
+Keeps attachments base64-encoded in memory, so a batch that sends the
+same file to many recipients reads and encodes it once instead of per message.
+"""
+
+import base64
+import mimetypes
+import os
+import stat
+from email.message import MIMEPart
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.utils.cache import SizedLRUCache
+
+# Files are read and encoded in whole base64 lines (57 bytes -> 76 characters),
+# so the raw file is never held in memory at once
+_READ_CHUNK = 57 * 1024
+
+# (absolute path, mtime in ns, size) -> base64 payload. Editing or replacing
+# a file changes its mtime/size and so its key; the stale entry ages out of the LRU.
+_payload_cache = SizedLRUCache(max_bytes=settings.ATTACHMENT_CACHE_MAX_BYTES)
+
+
+def _encode_file(path: str) -> str:
+    """Base64 of the file, wrapped in 76-character lines like EmailMessage.add_attachment"""
+    chunks = []
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(_READ_CHUNK)
+            if not data:
+                break
+            chunks.append(base64.encodebytes(data).decode("ascii"))
+    return "".join(chunks)
+
+
+def _build_part(path: str, payload: str) -> MIMEPart:
+    ctype, encoding = mimetypes.guess_type(path)
+    if ctype is None or encoding is not None:
+        ctype = "application/octet-stream"
+
+    part = MIMEPart()
+    part["Content-Type"] = ctype
+    part["Content-Transfer-Encoding"] = "base64"
+    part["Content-Disposition"] = "attachment"
+    part.set_param("filename", os.path.basename(path), header="Content-Disposition")
+    part.set_payload(payload)
+    return part
+
+
+def get_attachment_part(path: str) -> Optional[MIMEPart]:
+    """
+    Encoded MIME part for the file at ``path``, or None if it isn't a regular file.
+
+    The encoded payloads of files up to ATTACHMENT_CACHE_MAX_FILE_BYTES are
+    cached within the ATTACHMENT_CACHE_MAX_BYTES budget; every call gets a
+    fresh part sharing that payload, so messages never share headers.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    cacheable = _payload_cache.enabled and st.st_size <= settings.ATTACHMENT_CACHE_MAX_FILE_BYTES
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    payload = _payload_cache.get(key) if cacheable else None
+    if payload is None:
+        payload = _encode_file(path)
+        if cacheable:
+            _payload_cache.set(key, payload, len(payload))
+    return _build_part(path, payload)
+
+
+def attachment_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and memory use of the encoded attachment cache (for health checks)"""
+    return _payload_cache.stats()
+
+
+def clear_attachment_cache() -> None:
+    _payload_cache.clear()
@@ -0,0 +1,270 @@
+"""
+Outbound Email Queue Service
+Persists emails to the email_queue table and drains it with a pool of async workers
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, or_
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.email_queue import EmailJob, EmailJobStatus
+from app.services.email_service import EmailService, email_kwargs_from_payload
+from app.services.retry_service import add_dead_letter
+from app.utils.retry import backoff_delay, is_retryable_error
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the queue depth limit has been reached"""
+
+
+class _RateLimiter:
+    """Spaces out acquisitions so at most `rate` happen per second (0 = unlimited)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class EmailQueue:
+    """
+    Durable outbound email queue.
+
+    Requests are written to the email_queue table and acknowledged with a job id.
+    A dispatcher claims due jobs in batches (SELECT ... FOR UPDATE SKIP LOCKED, so
+    several processes can share the table) and feeds a fixed pool of workers,
+    which bounds SMTP concurrency. Sends are additionally rate limited, and
+    enqueue is refused once the number of unfinished jobs reaches the configured
+    maximum depth. Transient failures are retried with jittered exponential
+    backoff; jobs that fail permanently or run out of attempts are marked
+    FAILED and parked in dead_letters.
+    """
+
+    def __init__(self, email_service: Optional[EmailService] = None):
+        self.email_service = email_service or EmailService()
+        self.worker_count = max(1, settings.EMAIL_QUEUE_WORKERS)
+        self.max_depth = settings.EMAIL_QUEUE_MAX_DEPTH
+        self.batch_size = max(1, settings.EMAIL_QUEUE_BATCH_SIZE)
+        self.poll_interval = settings.EMAIL_QUEUE_POLL_INTERVAL
+        self.max_attempts = max(1, settings.EMAIL_QUEUE_MAX_ATTEMPTS)
+        self.lease = timedelta(seconds=settings.EMAIL_QUEUE_LEASE_SECONDS)
+
+        self._rate_limiter = _RateLimiter(settings.EMAIL_QUEUE_RATE_LIMIT)
+        self._jobs: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        # Depth is cached briefly so a burst of enqueues doesn't issue a COUNT each
+        self._depth = 0
+        self._depth_checked_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def _count_unfinished(self) -> int:
+        db = SessionLocal()
+        try:
+            return (
+                db.query(func.count(EmailJob.job_id))
+                .filter(EmailJob.status.in_([EmailJobStatus.PENDING, EmailJobStatus.SENDING]))
+                .scalar()
+            )
+        finally:
+            db.close()
+
+    def _insert_job(self, payload: Dict[str, Any]) -> str:
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            job = EmailJob(payload=payload, status=EmailJobStatus.PENDING, available_at=datetime.utcnow())
+            db.add(job)
+            db.commit()
+            return job.job_id
+        finally:
+            db.close()
+
+    async def depth(self) -> int:
+        """Number of unfinished (pending or in-flight) jobs"""
+        now = time.monotonic()
+        if now - self._depth_checked_at >= 1.0:
+            self._depth = await asyncio.to_thread(self._count_unfinished)
+            self._depth_checked_at = now
+        return self._depth
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        """
+        Persist an email for background delivery.
+
+        Args:
+            payload: JSON-serialisable keyword arguments for EmailService.send_email
+
+        Returns:
+            str: The queue job ID
+
+        Raises:
+            QueueFullError: If the queue already holds EMAIL_QUEUE_MAX_DEPTH unfinished jobs
+        """
+        if self.max_depth and await self.depth() >= self.max_depth:
+            raise QueueFullError(f"Email queue is full ({self.max_depth} pending jobs)")
+
+        job_id = await asyncio.to_thread(self._insert_job, payload)
+        self._depth += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        logger.info(f"Email queued. Job ID: {job_id}")
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[EmailJob]:
+        """Get a queued job by ID"""
+        db = SessionLocal()
+        try:
+            return db.query(EmailJob).filter(EmailJob.job_id == job_id).first()
+        finally:
+            db.close()
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+
+    def _claim_jobs(self, limit: int) -> List[EmailJob]:
+        """Lease up to `limit` due jobs. Expired leases (crashed workers) are reclaimed."""
+        now = datetime.utcnow()
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            jobs = (
+                db.query(EmailJob)
+                .filter(
+                    or_(
+                        EmailJob.status == EmailJobStatus.PENDING,
+                        (EmailJob.status == EmailJobStatus.SENDING) & (EmailJob.locked_until < now),
+                    ),
+                    EmailJob.available_at <= now,
+                )
+                .order_by(EmailJob.available_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for job in jobs:
+                job.status = EmailJobStatus.SENDING
+                job.locked_until = now + self.lease
+                job.attempts += 1
+            db.commit()
+            return jobs
+        finally:
+            db.close()
+
+    def _finish_job(self, job_id: str, result: Dict[str, Any], attempts: int) -> None:
+        db = SessionLocal()
+        try:
+            job = db.query(EmailJob).filter(EmailJob.job_id == job_id).first()
+            if not job:
+                return
+            job.locked_until = None
+            if result.get("success"):
+                job.status = EmailJobStatus.SENT
+                job.message_id = result.get("message_id")
+                job.error = None
+            elif result.get("retryable") and attempts < self.max_attempts:
+                job.status = EmailJobStatus.PENDING
+                job.available_at = datetime.utcnow() + timedelta(
+                    seconds=backoff_delay(attempts, settings.EMAIL_QUEUE_RETRY_DELAY, settings.RETRY_MAX_DELAY)
+                )
+                job.error = result.get("error")
+            else:
+                job.status = EmailJobStatus.FAILED
+                job.error = result.get("error")
+                add_dead_letter(db, "email", job.payload, attempts, job.error, "queue")
+            db.commit()
+        finally:
+            db.close()
+
+    async def _deliver(self, job: EmailJob) -> None:
+        await self._rate_limiter.acquire()
+        try:
+            result = await self.email_service.send_email(**email_kwargs_from_payload(job.payload))
+        except Exception as e:
+            result = {"success": False, "error": f"Error sending queued email: {str(e)}", "retryable": is_retryable_error(e)}
+
+        if not result.get("success"):
+            logger.warning(f"Queued email {job.job_id} failed (attempt {job.attempts}): {result.get('error')}")
+        await asyncio.to_thread(self._finish_job, job.job_id, result, job.attempts)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._jobs.get()
+            try:
+                await self._deliver(job)
+            except Exception as e:
+                logger.error(f"Email queue worker {index} failed on job {job.job_id}: {e}")
+            finally:
+                self._jobs.task_done()
+
+    async def _dispatcher(self) -> None:
+        while True:
+            try:
+                # Only claim what the workers can start on soon, so leases don't expire in memory
+                free = self._jobs.maxsize - self._jobs.qsize()
+                jobs = await asyncio.to_thread(self._claim_jobs, min(free, self.batch_size)) if free else []
+            except Exception as e:
+                logger.error(f"Error claiming queued emails: {e}")
+                jobs = []
+
+            for job in jobs:
+                await self._jobs.put(job)
+
+            if len(jobs) < self.batch_size:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def start(self) -> None:
+        """Start the dispatcher and worker tasks"""
+        if self.running:
+            return
+        self._jobs = asyncio.Queue(maxsize=self.worker_count * 2)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._dispatcher())]
+        self._tasks.extend(asyncio.create_task(self._worker(i)) for i in range(self.worker_count))
+        logger.info(f"Email queue started with {self.worker_count} workers")
+
+    async def stop(self) -> None:
+        """
+        Stop the dispatcher and workers.
+
+        Jobs that were claimed but not finished keep their lease and are picked
+        up again once it expires.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._jobs = None
+        self._wakeup = None
+
+
+# Global queue instance (started in lifespan)
+email_queue = EmailQueue()
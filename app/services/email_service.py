@@ -1,20 +1,24 @@
 """
 Gmail SMTP email service
 Sends mail through Gmail (or Google Workspace) using SMTP and an app password.
+Delivery goes through a pluggable transport (see smtp_transport.py), routed
+over the configured sender accounts (see smtp_relays.py).
 """
 
 import asyncio
 import logging
-import mimetypes
-import os
 import smtplib
+from datetime import datetime
 from email.message import EmailMessage
 from email.utils import formataddr, make_msgid
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from app.config import settings
+from app.services.attachment_cache import get_attachment_part
+from app.services.smtp_relays import SMTPRelay, SMTPRelayPool, get_smtp_relays
 from app.templates.template_loader import TemplateLoader
 from app.templates.template_types import EmailTemplateType
+from app.utils.retry import is_retryable_error
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +29,24 @@ def _domain_from_email(addr: str) -> str:
     return "localhost"
 
 
-def _send_via_gmail_smtp(
+def _template_context_dict(*contexts: Any) -> Dict[str, Any]:
+    """Merge template contexts (pydantic models or dicts); later ones win."""
+    context_data: Dict[str, Any] = {}
+    for context in contexts:
+        if not context:
+            continue
+        context_data.update(
+            context.model_dump(exclude_none=True)
+            if hasattr(context, "model_dump")
+            else dict(context)
+        )
+    if "current_year" not in context_data:
+        context_data["current_year"] = datetime.now().year
+    return context_data
+
+
+def _build_message(
     *,
-    smtp_host: str,
-    smtp_port: int,
-    username: str,
-    password: str,
     from_email: str,
     from_name: Optional[str],
     to: List[str],
@@ -41,8 +57,8 @@ def _send_via_gmail_smtp(
     bcc: Optional[List[str]],
     reply_to: Optional[str],
     attachments: Optional[List[str]],
-) -> str:
-    """Blocking SMTP send (invoked via asyncio.to_thread). Returns Message-ID."""
+) -> Tuple[EmailMessage, str, List[str]]:
+    """Build the MIME message. Returns (message, Message-ID, envelope recipients)."""
     msg = EmailMessage()
     msg["Subject"] = subject
     msg["From"] = (
@@ -67,22 +83,17 @@ def _send_via_gmail_smtp(
     else:
         msg.set_content(body, subtype="plain", charset="utf-8")
 
+    parts = []
     for path in attachments or []:
-        if not path or not os.path.isfile(path):
+        part = get_attachment_part(path) if path else None
+        if part is None:
             logger.warning("Attachment path missing or not a file: %s", path)
             continue
-        ctype, encoding = mimetypes.guess_type(path)
-        if ctype is None or encoding is not None:
-            ctype = "application/octet-stream"
-        maintype, subtype = ctype.split("/", 1)
-        with open(path, "rb") as f:
-            data = f.read()
-        msg.add_attachment(
-            data,
-            maintype=maintype,
-            subtype=subtype,
-            filename=os.path.basename(path),
-        )
+        parts.append(part)
+    if parts:
+        msg.make_mixed()
+        for part in parts:
+            msg.attach(part)
 
     envelope_to: List[str] = list(to)
     if cc:
@@ -90,24 +101,39 @@ def _send_via_gmail_smtp(
     if bcc:
         envelope_to.extend(bcc)
 
-    with smtplib.SMTP(smtp_host, smtp_port, timeout=30) as smtp:
-        smtp.starttls()
-        smtp.login(username, password)
-        smtp.send_message(msg, from_addr=from_email, to_addrs=envelope_to)
+    return msg, message_id, envelope_to
+
+
+async def _send_via_gmail_smtp(relays: SMTPRelayPool, **message_fields: Any) -> str:
+    """Build the message for the chosen relay's sender and send it through that relay. Returns Message-ID."""
 
-    return message_id
+    async def send_via(relay: SMTPRelay) -> str:
+        fields = dict(message_fields, from_email=relay.from_email, from_name=relay.from_name)
+        if fields.get("attachments"):
+            # Attachments are read from disk; keep that file I/O off the event loop
+            msg, message_id, envelope_to = await asyncio.to_thread(_build_message, **fields)
+        else:
+            msg, message_id, envelope_to = _build_message(**fields)
+        await relay.transport.send(msg, from_addr=relay.from_email, to_addrs=envelope_to)
+        return message_id
+
+    return await relays.send(send_via)
+
+
+def email_kwargs_from_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """send_email keyword arguments from a JSON payload persisted by the queue or scheduler"""
+    kwargs = dict(payload)
+    if kwargs.get("template_type"):
+        kwargs["template_type"] = EmailTemplateType(kwargs["template_type"])
+    return kwargs
 
 
 class EmailService:
     """Service for sending emails via Gmail SMTP."""
 
     def __init__(self):
-        self.smtp_host = settings.GMAIL_SMTP_HOST
-        self.smtp_port = settings.GMAIL_SMTP_PORT
-        self.username = settings.GMAIL_ADDRESS
-        self.password = settings.GMAIL_APP_PASSWORD
-        self.from_email = settings.effective_gmail_from_address()
-        self.from_name = settings.GMAIL_FROM_NAME
+        # Sender accounts are picked per message (SMTP_RELAYS, or the GMAIL_* account)
+        self.relays = get_smtp_relays()
 
     async def send_email(
         self,
@@ -138,7 +164,9 @@ class EmailService:
             attachments: Optional list of attachment file paths
 
         Returns:
-            dict: Response containing message_id and status (same shape as before)
+            dict: Response containing message_id and status (same shape as before).
+                Failures carry ``retryable``: True when the error was transient
+                (SMTP 4xx, dropped connection, no relay available)
         """
         try:
             if not settings.validate_gmail_config():
@@ -147,7 +175,7 @@ class EmailService:
                     "message_id": None,
                     "message": "Gmail configuration is incomplete",
                     "error": (
-                        "Set GMAIL_ADDRESS and GMAIL_APP_PASSWORD in your environment. "
+                        "Set GMAIL_ADDRESS and GMAIL_APP_PASSWORD (or SMTP_RELAYS) in your environment. "
                         "With 2-Step Verification on, use an App Password from your Google Account."
                     ),
                 }
@@ -162,16 +190,7 @@ class EmailService:
                     }
 
                 try:
-                    context_data = (
-                        template_context.model_dump(exclude_none=True)
-                        if hasattr(template_context, "model_dump")
-                        else dict(template_context)
-                    )
-                    from datetime import datetime
-
-                    if "current_year" not in context_data:
-                        context_data["current_year"] = datetime.now().year
-
+                    context_data = _template_context_dict(template_context)
                     rendered_subject, rendered_body = TemplateLoader.render_template(
                         template_type=template_type,
                         context=context_data,
@@ -195,14 +214,8 @@ class EmailService:
                         "error": "Missing subject or body",
                     }
 
-            message_id = await asyncio.to_thread(
-                _send_via_gmail_smtp,
-                smtp_host=self.smtp_host,
-                smtp_port=self.smtp_port,
-                username=self.username,
-                password=self.password,
-                from_email=self.from_email,
-                from_name=self.from_name,
+            message_id = await _send_via_gmail_smtp(
+                self.relays,
                 to=to,
                 subject=subject,
                 body=body,
@@ -229,6 +242,7 @@ class EmailService:
                 "message_id": None,
                 "message": "Failed to send email",
                 "error": error_msg,
+                "retryable": is_retryable_error(e),
             }
         except Exception as e:
             error_msg = f"Error sending email: {str(e)}"
@@ -238,4 +252,109 @@ class EmailService:
                 "message_id": None,
                 "message": "Failed to send email",
                 "error": error_msg,
+                "retryable": is_retryable_error(e),
+            }
+
+    async def send_batch(
+        self,
+        template_type: EmailTemplateType,
+        recipients: List[Dict[str, Any]],
+        template_context: Optional[Dict[str, Any]] = None,
+        subject: Optional[str] = None,
+        reply_to: Optional[str] = None,
+        attachments: Optional[List[str]] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> dict:
+        """
+        Send one template to many recipients, each with their own context.
+
+        Recipients are rendered and sent concurrently (bounded by
+        EMAIL_BATCH_CONCURRENCY) and share the pooled SMTP sessions of this
+        service's transport, so a campaign costs one handshake per pooled
+        connection rather than one per message.
+
+        Args:
+            template_type: Email template type used for every recipient
+            recipients: Items with ``to`` and optional ``cc``, ``bcc`` and ``template_context``
+            template_context: Shared context; per-recipient values override it
+            subject: Optional subject override for every recipient
+            reply_to: Optional reply-to email address
+            attachments: Optional list of attachment file paths sent to every recipient
+            max_concurrency: Override for EMAIL_BATCH_CONCURRENCY
+
+        Returns:
+            dict: Totals plus one result per recipient, in request order
+        """
+        if not settings.validate_gmail_config():
+            return {
+                "success": False,
+                "total": len(recipients),
+                "sent": 0,
+                "failed": len(recipients),
+                "results": [],
+                "message": "Gmail configuration is incomplete",
+                "error": "Set GMAIL_ADDRESS and GMAIL_APP_PASSWORD (or SMTP_RELAYS) in your environment.",
             }
+
+        semaphore = asyncio.Semaphore(max_concurrency or settings.EMAIL_BATCH_CONCURRENCY)
+
+        async def send_one(index: int, recipient: Dict[str, Any]) -> dict:
+            result = {
+                "index": index,
+                "to": list(recipient["to"]),
+                "success": False,
+                "message_id": None,
+                "error": None,
+            }
+            async with semaphore:
+                try:
+                    context_data = _template_context_dict(
+                        template_context, recipient.get("template_context")
+                    )
+                    rendered_subject, rendered_body = TemplateLoader.render_template(
+                        template_type=template_type,
+                        context=context_data,
+                    )
+                except Exception as e:
+                    result["error"] = f"Failed to render email template: {e}"
+                    return result
+
+                try:
+                    message_id = await _send_via_gmail_smtp(
+                        self.relays,
+                        to=result["to"],
+                        subject=subject or rendered_subject,
+                        body=rendered_body,
+                        is_html=True,
+                        cc=recipient.get("cc"),
+                        bcc=recipient.get("bcc"),
+                        reply_to=reply_to,
+                        attachments=attachments,
+                    )
+                except smtplib.SMTPException as e:
+                    result["error"] = f"SMTP error sending email: {e}"
+                    return result
+                except Exception as e:
+                    result["error"] = f"Error sending email: {str(e)}"
+                    return result
+
+            result["success"] = True
+            result["message_id"] = message_id
+            return result
+
+        results = await asyncio.gather(
+            *(send_one(index, recipient) for index, recipient in enumerate(recipients))
+        )
+        sent = sum(1 for r in results if r["success"])
+        failed = len(results) - sent
+
+        logger.info("Batch email finished. Sent: %s, Failed: %s", sent, failed)
+
+        return {
+            "success": failed == 0,
+            "total": len(results),
+            "sent": sent,
+            "failed": failed,
+            "results": results,
+            "message": f"Batch processed: {sent} sent, {failed} failed",
+        }
@@ -0,0 +1,416 @@
+"""
+Player (device) lookup service
+Queries used to resolve application users to their active push targets
+"""
+
+import base64
+import binascii
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from app.config import settings
+from app.models.player import DeviceStatus, Player, PlayerCreate, hash_push_token
+from app.utils.cache import TTLCache
+from app.utils.retry import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# A push target: ("external_user_ids", push_token) or ("player_ids", one_signal_id),
+# keyed by the send_notification argument the ID belongs to
+DeviceTarget = Tuple[str, str]
+
+# _user_id_key(user_id) -> device targets of the user's active devices (None caches
+# "no active devices"; an empty tuple, active devices that have neither a push token
+# nor a OneSignal ID). Keyed like the column's collation compares, so every spelling
+# of a user_id shares one entry and invalidation reaches it.
+# In-process only: writes through the players router invalidate entries here, and
+# the TTL bounds staleness for writes made by other processes.
+_device_target_cache = TTLCache(
+    maxsize=settings.PUSH_TARGET_CACHE_SIZE,
+    ttl=settings.PUSH_TARGET_CACHE_TTL,
+)
+# Bumped on every invalidation so a lookup racing with a write doesn't cache stale rows
+_cache_generation = 0
+_MISSING = object()
+
+MYSQL_DEADLOCK_ERRNO = 1213
+# Backoff (seconds) before re-running a registration transaction picked as a deadlock victim
+DEADLOCK_RETRY_BASE_DELAY = 0.05
+DEADLOCK_RETRY_MAX_DELAY = 1.0
+
+
+def active_players_query(user_ids: Iterable[str]) -> Select:
+    """Active players belonging to any of the given users"""
+    return select(Player).where(
+        Player.user_id.in_(list(user_ids)),
+        Player.status == DeviceStatus.ACTIVE,  # Only active players
+    )
+
+
+# Columns a re-registration overwrites; player_id, device_id and the hash are kept
+_UPSERT_UPDATED_COLUMNS = (
+    "user_id",
+    "device_type",
+    "push_token",
+    "one_signal_id",
+    "device_model",
+    "os_version",
+    "app_version",
+    "last_login_at",
+    "status",
+    "updated_at",
+)
+
+
+def _player_values(player_in: PlayerCreate, now: datetime) -> Dict[str, Any]:
+    """Column values written when a device registers (enums as stored names)"""
+    return {
+        "user_id": player_in.user_id,
+        "device_type": player_in.device_type.name,
+        "push_token": player_in.push_token,
+        "push_token_hash": hash_push_token(player_in.push_token),
+        "one_signal_id": player_in.one_signal_id,
+        "device_model": player_in.device_model,
+        "os_version": player_in.os_version,
+        "app_version": player_in.app_version,
+        "last_login_at": now,
+        "status": DeviceStatus.ACTIVE.name,
+        "updated_at": now,
+    }
+
+
+def is_deadlock(exc: DBAPIError) -> bool:
+    """Whether MySQL rolled the transaction back as a deadlock victim (ER_LOCK_DEADLOCK)"""
+    args = getattr(exc.orig, "args", ())
+    return bool(args) and args[0] == MYSQL_DEADLOCK_ERRNO
+
+
+def run_in_transaction(db: Session, work: Callable[[], T]) -> T:
+    """
+    Run ``work()`` and commit, retrying the whole transaction on deadlock
+    
+    Batch registrations lock rows (and, for new tokens, index gaps) by token
+    hash, so concurrent batches sharing tokens can deadlock; InnoDB then rolls
+    one of them back and it is safe to run again from the start. Other errors
+    roll back and propagate.
+    """
+    attempts = max(1, settings.PLAYER_DEADLOCK_RETRIES + 1)
+    for attempt in range(1, attempts + 1):
+        try:
+            result = work()
+            db.commit()
+            return result
+        except DBAPIError as e:
+            db.rollback()
+            if not is_deadlock(e) or attempt == attempts:
+                raise
+            logger.warning(f"Batch registration deadlocked (attempt {attempt}); retrying")
+            time.sleep(backoff_delay(attempt, DEADLOCK_RETRY_BASE_DELAY, DEADLOCK_RETRY_MAX_DELAY))
+        except Exception:
+            db.rollback()
+            raise
+
+
+def upsert_player(db: Session, player_in: PlayerCreate) -> Tuple[Player, Optional[str]]:
+    """
+    Register a device with a single INSERT ... ON DUPLICATE KEY UPDATE
+    
+    The statement is keyed on the unique push_token_hash index, so concurrent
+    registrations of the same token converge on one row. MySQL has no
+    RETURNING, so the row's identity and previous owner come from one
+    non-locking read by the same index just before the upsert (no gap locks,
+    so nothing to deadlock on); the upsert keeps player_id and device_id of a
+    known token and writes every other column, which gives the stored row.
+    Only if another registration inserted the token in between (the upsert
+    then reports an update of a row the read didn't see) is the row read
+    back. The caller commits.
+    
+    Returns:
+        tuple: (player as stored, previous user_id or None if the row was created)
+    """
+    now = datetime.utcnow().replace(microsecond=0)  # DATETIME columns drop fractions
+    values = _player_values(player_in, now)
+    token_hash = values["push_token_hash"]
+    
+    existing = db.execute(
+        select(Player.player_id, Player.device_id, Player.user_id).where(Player.push_token_hash == token_hash)
+    ).first()
+    player_id = existing.player_id if existing else str(uuid.uuid4())
+    device_id = existing.device_id if existing else str(uuid.uuid4())
+    
+    stmt = insert(Player).values(player_id=player_id, device_id=device_id, **values)
+    # player_id and device_id are kept for a known token
+    stmt = stmt.on_duplicate_key_update(
+        {name: stmt.inserted[name] for name in _UPSERT_UPDATED_COLUMNS}
+    )
+    result = db.execute(stmt)
+    
+    # Affected rows: 1 = inserted (or unchanged), 2 = an existing row was updated
+    if existing is None and result.rowcount == 2:
+        player = db.execute(
+            select(Player)
+            .where(Player.push_token_hash == token_hash)
+            .execution_options(populate_existing=True)
+        ).scalar_one()
+        return player, None
+    
+    player = Player(
+        player_id=player_id,
+        device_id=device_id,
+        user_id=player_in.user_id,
+        device_type=player_in.device_type,
+        push_token=player_in.push_token,
+        one_signal_id=player_in.one_signal_id,
+        device_model=player_in.device_model,
+        os_version=player_in.os_version,
+        app_version=player_in.app_version,
+        last_login_at=now,
+        status=DeviceStatus.ACTIVE,
+        updated_at=now,
+    )
+    return player, existing.user_id if existing else None
+
+
+def lock_players_by_token_hash_query(token_hashes: List[str]) -> Select:
+    """Lock the players registered with any of the given token hashes"""
+    return (
+        select(Player.player_id, Player.user_id, Player.push_token_hash)
+        .where(Player.push_token_hash.in_(token_hashes))
+        .with_for_update()
+    )
+
+
+def upsert_players(
+    db: Session,
+    players_in: List[PlayerCreate],
+    chunk_size: Optional[int] = None,
+) -> Tuple[List[Tuple[str, bool]], Set[str]]:
+    """
+    Register many devices with chunked multi-row INSERT ... ON DUPLICATE KEY UPDATE
+    
+    Items are de-duplicated by push token (the last occurrence wins). Each chunk
+    locks its existing rows with one SELECT ... FOR UPDATE on the token hash
+    index to learn their previous owners, writes the whole chunk with one
+    statement and reads the stored player_ids back; a row counts as created
+    only if it kept the player_id generated for it. Tokens are processed in
+    hash order so concurrent batches lock rows in the same order, but gap
+    locks on new tokens can still deadlock: run it through
+    run_in_transaction, which commits and retries.
+    
+    Returns:
+        tuple: ((player_id, created) per input item in request order,
+                user_ids whose devices changed, including previous owners)
+    """
+    chunk_size = max(1, chunk_size or settings.PLAYER_BATCH_CHUNK_SIZE)
+    now = datetime.utcnow().replace(microsecond=0)
+    
+    latest: Dict[str, Dict[str, Any]] = {}
+    item_hashes: List[str] = []
+    for player_in in players_in:
+        values = _player_values(player_in, now)
+        latest[values["push_token_hash"]] = values
+        item_hashes.append(values["push_token_hash"])
+    
+    outcomes: Dict[str, Tuple[str, bool]] = {}
+    affected_user_ids: Set[str] = set()
+    hashes = sorted(latest)
+    for start in range(0, len(hashes), chunk_size):
+        chunk = hashes[start:start + chunk_size]
+        existing = {row.push_token_hash: row for row in db.execute(lock_players_by_token_hash_query(chunk))}
+        
+        rows = []
+        for token_hash in chunk:
+            row = existing.get(token_hash)
+            affected_user_ids.add(latest[token_hash]["user_id"])
+            if row:
+                affected_user_ids.add(row.user_id)
+            rows.append({"player_id": str(uuid.uuid4()), "device_id": str(uuid.uuid4()), **latest[token_hash]})
+        
+        stmt = insert(Player).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            {name: stmt.inserted[name] for name in _UPSERT_UPDATED_COLUMNS}
+        )
+        db.execute(stmt)
+        
+        # A row was created only if it kept the player_id generated for it here
+        stored = dict(db.execute(
+            select(Player.push_token_hash, Player.player_id).where(Player.push_token_hash.in_(chunk))
+        ).all())
+        for row in rows:
+            player_id = stored[row["push_token_hash"]]
+            outcomes[row["push_token_hash"]] = (player_id, player_id == row["player_id"])
+    
+    return [outcomes[token_hash] for token_hash in item_hashes], affected_user_ids
+
+
+def player_filters(
+    user_id: Optional[str] = None,
+    device_type: Optional[str] = None,
+    status: Optional[str] = None,
+) -> List[Any]:
+    """WHERE criteria for the admin player listing"""
+    criteria = []
+    if user_id:
+        criteria.append(Player.user_id == user_id)
+    if device_type:
+        criteria.append(Player.device_type == device_type)
+    if status:
+        criteria.append(Player.status == status)
+    return criteria
+
+
+def count_players_query(criteria: List[Any]) -> Select:
+    """Number of players matching the listing criteria"""
+    return select(func.count()).select_from(Player).where(*criteria)
+
+
+def list_players_query(
+    criteria: List[Any],
+    limit: int,
+    offset: int = 0,
+    after: Optional[Tuple[datetime, str]] = None,
+) -> Select:
+    """
+    Players matching the listing criteria, most recently updated first
+    
+    player_id breaks ties so the order is total. Pass `after` (the sort key
+    of the last row already seen) for keyset pagination: the query then seeks
+    on the (updated_at, player_id) index instead of skipping rows.
+    """
+    query = select(Player).where(*criteria)
+    if after is not None:
+        updated_at, player_id = after
+        # Spelled out rather than as a row constructor, which MySQL's range
+        # optimizer doesn't reliably turn into an index range
+        query = query.where(or_(
+            Player.updated_at < updated_at,
+            and_(Player.updated_at == updated_at, Player.player_id < player_id),
+        ))
+    query = query.order_by(Player.updated_at.desc(), Player.player_id.desc()).limit(limit)
+    if offset:
+        query = query.offset(offset)
+    return query
+
+
+def encode_player_cursor(player: Player) -> str:
+    """Opaque continuation token pointing just past the given player"""
+    key = {"u": player.updated_at.isoformat(), "p": player.player_id}
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_player_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    Sort key encoded in a continuation token
+    
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(key["u"]), str(key["p"])
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def device_targets(player: Player) -> List[DeviceTarget]:
+    """Push targets for a single player"""
+    targets: List[DeviceTarget] = []
+    if player.push_token:
+        targets.append(("external_user_ids", player.push_token))
+    if player.one_signal_id:
+        targets.append(("player_ids", player.one_signal_id))
+    return targets
+
+
+def split_device_targets(targets: Iterable[DeviceTarget]) -> Tuple[List[str], List[str]]:
+    """Split device targets into (player_ids, external_user_ids) for send_notification"""
+    player_ids: List[str] = []
+    external_user_ids: List[str] = []
+    for field, target_id in targets:
+        if field == "external_user_ids":
+            external_user_ids.append(target_id)
+        else:
+            player_ids.append(target_id)
+    return player_ids, external_user_ids
+
+
+async def get_active_players(db: AsyncSession, user_ids: Iterable[str]) -> List[Player]:
+    """Load active players for the given users without blocking the event loop"""
+    result = await db.execute(active_players_query(user_ids))
+    return list(result.scalars().all())
+
+
+def _user_id_key(user_id: str) -> str:
+    """user_id as compared by the default MySQL collation (case- and trailing-space-insensitive)"""
+    return user_id.rstrip(" ").lower()
+
+
+async def get_device_targets(db: AsyncSession, user_ids: Iterable[str]) -> Dict[str, List[DeviceTarget]]:
+    """
+    Resolve users to the push targets of their active devices
+    
+    Users found in the device target cache skip the database; the rest are
+    loaded with a single query and cached.
+    
+    Returns:
+        dict: user_id -> device targets; users without active devices are omitted,
+            users whose active devices have no push token or OneSignal ID map to []
+    """
+    targets_by_user: Dict[str, List[DeviceTarget]] = {}
+    missing: List[str] = []
+    for user_id in dict.fromkeys(user_ids):
+        cached = _device_target_cache.get(_user_id_key(user_id), _MISSING)
+        if cached is _MISSING:
+            missing.append(user_id)
+        elif cached is not None:
+            targets_by_user[user_id] = list(cached)
+    
+    if not missing:
+        return targets_by_user
+    
+    generation = _cache_generation
+    loaded: Dict[str, Optional[List[DeviceTarget]]] = {user_id: None for user_id in missing}
+    # The column's collation matches user_ids case- and trailing-space-insensitively,
+    # so rows come back spelled as stored, not necessarily as requested
+    requested: Dict[str, List[str]] = {}
+    for user_id in missing:
+        requested.setdefault(_user_id_key(user_id), []).append(user_id)
+    for player in await get_active_players(db, missing):
+        targets = device_targets(player)
+        for user_id in requested.get(_user_id_key(player.user_id), ()):
+            loaded[user_id] = (loaded[user_id] or []) + targets
+    
+    for user_id, targets in loaded.items():
+        if generation == _cache_generation:
+            _device_target_cache.set(_user_id_key(user_id), tuple(targets) if targets is not None else None)
+        if targets is not None:
+            targets_by_user[user_id] = targets
+    return targets_by_user
+
+
+def invalidate_device_targets(*user_ids: Optional[str]) -> None:
+    """Drop cached targets for users whose devices were written"""
+    global _cache_generation
+    _cache_generation += 1
+    for user_id in user_ids:
+        if user_id:
+            _device_target_cache.pop(_user_id_key(user_id))
+
+
+def device_target_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and size of the device target cache"""
+    return _device_target_cache.stats()
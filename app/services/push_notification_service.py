@@ -3,14 +3,134 @@ OneSignal Push Notification Service
 Handles push notifications using OneSignal API
 """
 
+import asyncio
 import httpx
+import json
 import logging
 import re
-from typing import List, Optional, Dict, Any
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Dict, Any, Tuple
 from app.config import settings
+from app.utils.rate_limit import AdaptiveConcurrencyLimiter
+from app.utils.retry import is_retryable_error, is_retryable_status
 
 logger = logging.getLogger(__name__)
 
+# Payload fields that carry explicit target IDs (subject to the per-request limit)
+TARGET_ID_FIELDS = ("include_player_ids", "include_external_user_ids", "include_subscription_ids")
+# Payload targeting field -> the send_notification argument that fills it
+TARGET_KWARGS = {
+    "include_player_ids": "player_ids",
+    "include_external_user_ids": "external_user_ids",
+    "include_subscription_ids": "subscription_ids",
+    "included_segments": "segments",
+}
+
+# Process-wide OneSignal HTTP client, owned by the app lifespan (see app/main.py)
+_client: Optional[httpx.AsyncClient] = None
+
+# Process-wide cap on OneSignal requests in flight, shared by every send path
+onesignal_limiter = AdaptiveConcurrencyLimiter(
+    settings.ONESIGNAL_MAX_CONCURRENCY,
+    min_limit=settings.ONESIGNAL_MIN_CONCURRENCY,
+    queue_timeout=settings.ONESIGNAL_QUEUE_TIMEOUT,
+)
+
+
+def _create_onesignal_client() -> httpx.AsyncClient:
+    http2 = settings.ONESIGNAL_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("ONESIGNAL_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        timeout=settings.ONESIGNAL_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=settings.ONESIGNAL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.ONESIGNAL_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.ONESIGNAL_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+
+
+def get_onesignal_client() -> httpx.AsyncClient:
+    """Get the shared OneSignal client, creating it if the lifespan hasn't yet"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_onesignal_client()
+    return _client
+
+
+async def start_onesignal_client() -> None:
+    """Open the shared client so connections are reused across notifications"""
+    get_onesignal_client()
+
+
+async def close_onesignal_client() -> None:
+    """Close the shared client and its pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Delay requested by a Retry-After header (seconds or HTTP date), if any"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def post_to_onesignal(client: httpx.AsyncClient, url: str, **kwargs: Any) -> httpx.Response:
+    """
+    POST to OneSignal under the shared concurrency limiter
+    
+    429 and 5xx responses (and timeouts) shrink the limit and a Retry-After
+    header holds back every caller until it passes. A 429 means the request
+    was not processed, so it is retried (up to ONESIGNAL_RATE_LIMIT_RETRIES
+    times) once the delay is over; other responses are returned as they are.
+    A 5xx or timeout leaves the outcome unknown, so sends retried later must
+    carry an idempotency_key (see PushNotificationService.send_notification).
+    """
+    retries = max(0, settings.ONESIGNAL_RATE_LIMIT_RETRIES)
+    for attempt in range(retries + 1):
+        await onesignal_limiter.acquire()
+        try:
+            response = await client.post(url, **kwargs)
+        except httpx.TimeoutException:
+            onesignal_limiter.on_overload()
+            raise
+        finally:
+            await onesignal_limiter.release()
+        
+        if response.status_code != 429 and response.status_code < 500:
+            onesignal_limiter.on_success()
+            return response
+        
+        onesignal_limiter.on_overload()
+        retry_after = _retry_after_seconds(response)
+        if response.status_code == 429:
+            onesignal_limiter.pause(settings.ONESIGNAL_DEFAULT_RETRY_AFTER if retry_after is None else retry_after)
+            if attempt < retries:
+                logger.warning(f"OneSignal rate limited the request; retrying (attempt {attempt + 2} of {retries + 1})")
+                continue
+        elif retry_after is not None:
+            onesignal_limiter.pause(retry_after)
+        return response
+
 
 class PushNotificationService:
     """Service for sending push notifications via OneSignal API"""
@@ -33,6 +153,7 @@ class PushNotificationService:
         url: Optional[str] = None,
         send_after: Optional[str] = None,
         priority: int = 10,
+        idempotency_key: Optional[str] = None,
     ) -> dict:
         """
         Send a push notification using OneSignal API
@@ -48,9 +169,13 @@ class PushNotificationService:
             url: URL to open when notification is clicked
             send_after: Schedule notification for later (ISO 8601 format)
             priority: Notification priority (0-10)
+            idempotency_key: Identifies the logical send (a UUID). Each OneSignal request
+                carries a key derived from it and its audience, so resending the same send
+                (e.g. a background retry after a 5xx or timeout) doesn't notify anyone twice
             
         Returns:
-            dict: Response containing notification_id and status
+            dict: Response containing notification_id and status. Failures carry
+                ``retryable``: True when the error was transient (429, 5xx, timeouts)
         """
         try:
             # Validate configuration before attempting to send notification
@@ -116,34 +241,6 @@ class PushNotificationService:
                 "priority": priority,
                 "target_channel": "push",
                 "android_channel_id": "535b6210-7d0b-4dd3-b154-547c62830214",
-                "headings": { "en": "👋 Premium Update" },
-                "contents": { "en": "Check out the new features we just launched!" },
-                "subtitle": { "en": "Don't miss out on this." },
-
-                "data": {
-                    "push_type": "marketing",
-                    "target_screen": "promo_view",
-                    "internal_id": "campaign_99"
-                },
-
-                "url": "https://your-app-link.com/promo",
-
-                "big_picture": "https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcRkQbRwgiJaCMRav_CBQElvWipPSb6AECmZ8A&s",
-                "large_icon": "https://picsum.photos/200/200",
-                "ios_attachments": { "id1": "https://picsum.photos/1024/512" },
-
-                "buttons": [
-                    { "id": "btn_shop", "text": "Shop Now", "icon": "ic_menu_cart" },
-                    { "id": "btn_later", "text": "Remind Me", "icon": "ic_menu_recent" }
-                ],
-
-                "ios_badgeType": "Increase",
-                "ios_badgeCount": 1,
-                "ios_sound": "default",
-
-                "ttl": 3600,
-                "priority": 10,
-                "collapse_id": "promo_series_1"
             }
             
             logger.debug(f"Sending push notification with app_id: {self.app_id[:10]}...")
@@ -219,75 +316,213 @@ class PushNotificationService:
             logger.debug(f"Making request to OneSignal API: {api_url}")
             logger.debug(f"Authorization header present: {bool(self.rest_api_key)}")
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    api_url,
-                    json=notification_payload,
-                    headers=headers,
-                )
-                
-                response.raise_for_status()
-                response_data = response.json()
-                
-                # Log full response for debugging
-                logger.debug(f"OneSignal API response: {response_data}")
-                
-                # OneSignal API response fields can vary, try multiple possible field names
-                notification_id = (
-                    response_data.get("id") or 
-                    response_data.get("notification_id") or 
-                    response_data.get("notificationId")
-                )
-                
-                recipients_count = (
-                    response_data.get("recipients") or 
-                    response_data.get("recipients_count") or
-                    response_data.get("recipientsCount") or
-                    0
-                )
-                
-                # Check for errors or warnings in the response
-                errors = response_data.get("errors", [])
-                warnings = response_data.get("warnings", [])
-                
-                # If recipients_count is 0, it might mean the targeting IDs don't exist
-                if recipients_count == 0:
-                    targeting_info = []
-                    if player_ids:
-                        targeting_info.append(f"player_ids: {player_ids}")
-                    if subscription_ids:
-                        targeting_info.append(f"subscription_ids: {subscription_ids}")
-                    if segments:
-                        targeting_info.append(f"segments: {segments}")
-                    
-                    logger.warning(
-                        f"Notification sent but recipients_count is 0. "
-                        f"This might mean the targeting IDs don't exist in OneSignal. "
-                        f"Targeting: {', '.join(targeting_info)}"
-                    )
-                
-                # Build response message
-                message = "Push notification sent successfully"
-                if recipients_count == 0:
-                    message += " (but no recipients were found - player_ids may not exist in OneSignal)"
-                if warnings:
-                    message += f". Warnings: {', '.join(warnings)}"
+            # Split large audiences into provider-sized requests and send them concurrently
+            chunk_payloads = self._chunk_payload(notification_payload)
+            if len(chunk_payloads) > 1:
+                logger.info(f"Splitting push notification into {len(chunk_payloads)} requests")
+            if idempotency_key:
+                for payload in chunk_payloads:
+                    payload["idempotency_key"] = self._chunk_idempotency_key(idempotency_key, payload)
+            
+            semaphore = asyncio.Semaphore(max(1, settings.ONESIGNAL_CHUNK_CONCURRENCY))
+            
+            async def post_chunk(payload: Dict[str, Any]) -> dict:
+                async with semaphore:
+                    return await self._post_notification(api_url, payload, headers)
+            
+            results = await asyncio.gather(*(post_chunk(payload) for payload in chunk_payloads))
+            return self._aggregate_results(chunk_payloads, results)
+            
+        except Exception as e:
+            error_msg = f"Error sending push notification: {str(e)}"
+            logger.error(error_msg)
+            return {
+                "success": False,
+                "notification_id": None,
+                "recipients_count": 0,
+                "message": "Failed to send push notification",
+                "error": error_msg,
+                "retryable": is_retryable_error(e),
+            }
+    
+    @staticmethod
+    def _chunk_payload(notification_payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Split a payload so no request targets more than ONESIGNAL_MAX_TARGETS_PER_REQUEST IDs
+        
+        IDs from all include_* fields count towards the same per-request limit.
+        Segments are only sent with the first request so segment members aren't
+        notified once per chunk.
+        """
+        chunk_size = max(1, settings.ONESIGNAL_MAX_TARGETS_PER_REQUEST)
+        base_payload = dict(notification_payload)
+        targets = [
+            (field, target_id)
+            for field in TARGET_ID_FIELDS
+            for target_id in base_payload.pop(field, None) or []
+        ]
+        if len(targets) <= chunk_size:
+            return [notification_payload]
+        
+        segments = base_payload.pop("included_segments", None)
+        chunk_payloads = []
+        for start in range(0, len(targets), chunk_size):
+            payload = dict(base_payload)
+            for field, target_id in targets[start:start + chunk_size]:
+                payload.setdefault(field, []).append(target_id)
+            if segments and start == 0:
+                payload["included_segments"] = segments
+            chunk_payloads.append(payload)
+        return chunk_payloads
+    
+    @staticmethod
+    def _chunk_idempotency_key(idempotency_key: str, payload: Dict[str, Any]) -> str:
+        """
+        OneSignal idempotency key for one request of a send
+        
+        Derived from the send's key and the request's audience, so it is the
+        same whenever that audience is sent again: a retry of failed requests
+        (retry_targets) is split into the same requests as the original, as
+        the failed requests are whole slices of the original target list.
+        """
+        audience = json.dumps({field: payload.get(field) for field in TARGET_KWARGS}, sort_keys=True)
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{idempotency_key}:{audience}"))
+    
+    @staticmethod
+    def _chunk_targets(chunk_payloads: List[Dict[str, Any]]) -> Optional[Dict[str, List[str]]]:
+        """send_notification targeting arguments that reach the audience of the given requests"""
+        targets: Dict[str, List[str]] = {}
+        for payload in chunk_payloads:
+            for field, kwarg in TARGET_KWARGS.items():
+                if payload.get(field):
+                    targets.setdefault(kwarg, []).extend(payload[field])
+        return targets or None
+    
+    @classmethod
+    def _failed_chunks(cls, prefix: str, chunks: List[Tuple[Dict[str, Any], dict]]) -> Dict[str, Any]:
+        """``<prefix>_targets`` and ``<prefix>_error`` for a group of failed requests"""
+        return {
+            f"{prefix}_targets": cls._chunk_targets([payload for payload, _ in chunks]),
+            f"{prefix}_error": "; ".join(r["error"] for _, r in chunks if r.get("error")) or None,
+        }
+    
+    @classmethod
+    def _aggregate_results(cls, chunk_payloads: List[Dict[str, Any]], results: List[dict]) -> dict:
+        """
+        Combine per-chunk results into a single response
+        
+        When only some requests went out, ``retry_targets`` / ``retry_error`` and
+        ``failed_targets`` / ``failed_error`` describe the requests that failed
+        transiently and permanently, so callers can follow up on just those
+        recipients.
+        """
+        if len(results) == 1:
+            return results[0]
+        
+        succeeded = [r for r in results if r["success"]]
+        failed = [r for r in results if not r["success"]]
+        if not succeeded:
+            # Nothing went out; surface the first failure as-is (keeps e.g. the 403 guidance)
+            return {
+                **failed[0],
+                "errors": [r["error"] for r in failed],
+                "retryable": all(r.get("retryable") for r in failed),
+            }
+        
+        transient = [(p, r) for p, r in zip(chunk_payloads, results) if not r["success"] and r.get("retryable")]
+        permanent = [(p, r) for p, r in zip(chunk_payloads, results) if not r["success"] and not r.get("retryable")]
+        notification_ids = [r["notification_id"] for r in succeeded if r["notification_id"]]
+        recipients_count = sum(r["recipients_count"] or 0 for r in succeeded)
+        message = f"Push notification sent successfully in {len(results)} requests"
+        if failed:
+            message = f"Push notification partially sent: {len(succeeded)} of {len(results)} requests succeeded"
+        
+        return {
+            "success": True,
+            "notification_id": notification_ids[0] if notification_ids else None,
+            "notification_ids": notification_ids,
+            "recipients_count": recipients_count,
+            "message": message,
+            "errors": [r["error"] for r in failed] or None,
+            **cls._failed_chunks("retry", transient),
+            **cls._failed_chunks("failed", permanent),
+        }
+    
+    async def _post_notification(
+        self,
+        api_url: str,
+        notification_payload: Dict[str, Any],
+        headers: Dict[str, str],
+    ) -> dict:
+        """Send one create-notification request and normalise the response"""
+        try:
+            client = get_onesignal_client()
+            response = await post_to_onesignal(
+                client,
+                api_url,
+                json=notification_payload,
+                headers=headers,
+            )
+            
+            response.raise_for_status()
+            response_data = response.json()
+            
+            # Log full response for debugging
+            logger.debug(f"OneSignal API response: {response_data}")
+            
+            # OneSignal API response fields can vary, try multiple possible field names
+            notification_id = (
+                response_data.get("id") or 
+                response_data.get("notification_id") or 
+                response_data.get("notificationId")
+            )
+            
+            recipients_count = (
+                response_data.get("recipients") or 
+                response_data.get("recipients_count") or
+                response_data.get("recipientsCount") or
+                0
+            )
+            
+            # Check for errors or warnings in the response
+            errors = response_data.get("errors", [])
+            warnings = response_data.get("warnings", [])
+            
+            # If recipients_count is 0, it might mean the targeting IDs don't exist
+            if recipients_count == 0:
+                targeting_info = []
+                for field in TARGET_ID_FIELDS + ("included_segments",):
+                    if notification_payload.get(field):
+                        targeting_info.append(f"{field}: {notification_payload[field]}")
                 
-                logger.info(
-                    f"Push notification sent successfully. "
-                    f"Notification ID: {notification_id}, "
-                    f"Recipients: {recipients_count}, "
-                    f"Errors: {errors}, "
-                    f"Warnings: {warnings}"
+                logger.warning(
+                    f"Notification sent but recipients_count is 0. "
+                    f"This might mean the targeting IDs don't exist in OneSignal. "
+                    f"Targeting: {', '.join(targeting_info)}"
                 )
-                
-                return {
-                    "success": True,
-                    "notification_id": str(notification_id) if notification_id else None,
-                    "recipients_count": recipients_count,
-                    "message": message,
-                }
-                
+            
+            # Build response message
+            message = "Push notification sent successfully"
+            if recipients_count == 0:
+                message += " (but no recipients were found - player_ids may not exist in OneSignal)"
+            if warnings:
+                message += f". Warnings: {', '.join(warnings)}"
+            
+            logger.info(
+                f"Push notification sent successfully. "
+                f"Notification ID: {notification_id}, "
+                f"Recipients: {recipients_count}, "
+                f"Errors: {errors}, "
+                f"Warnings: {warnings}"
+            )
+            
+            return {
+                "success": True,
+                "notification_id": str(notification_id) if notification_id else None,
+                "recipients_count": recipients_count,
+                "message": message,
+            }
+            
         except httpx.HTTPStatusError as e:
             error_msg = f"HTTP error sending push notification: {e.response.status_code} - {e.response.text}"
             logger.error(error_msg)
@@ -318,6 +553,7 @@ class PushNotificationService:
                 "recipients_count": 0,
                 "message": "Failed to send push notification",
                 "error": error_msg,
+                "retryable": is_retryable_status(e.response.status_code),
             }
         except Exception as e:
             error_msg = f"Error sending push notification: {str(e)}"
@@ -328,5 +564,6 @@ class PushNotificationService:
                 "recipients_count": 0,
                 "message": "Failed to send push notification",
                 "error": error_msg,
+                "retryable": is_retryable_error(e),
             }
 
@@ -0,0 +1,398 @@
+"""
+Retry Queue Service
+Retries transient send failures in the background with jittered exponential
+backoff and parks sends that can't be delivered in the dead_letters table
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.retry import DeadLetter, RetryJob
+from app.services.email_service import EmailService, email_kwargs_from_payload
+from app.services.push_notification_service import TARGET_KWARGS, PushNotificationService
+from app.utils.retry import backoff_delay, is_retryable_error
+
+logger = logging.getLogger(__name__)
+
+RETRY_KINDS = ("email", "push")
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff before the next try of a send that has failed `attempts` times"""
+    return timedelta(seconds=backoff_delay(attempts, settings.RETRY_BASE_DELAY, settings.RETRY_MAX_DELAY))
+
+
+def add_dead_letter(
+    db: Session,
+    kind: str,
+    payload: Dict[str, Any],
+    attempts: int,
+    error: Optional[str],
+    source: str,
+) -> DeadLetter:
+    """Park a send in the caller's transaction"""
+    dead_letter = DeadLetter(kind=kind, source=source, payload=payload, attempts=attempts, error=error)
+    db.add(dead_letter)
+    return dead_letter
+
+
+def retargeted_push_payload(payload: Dict[str, Any], targets: Dict[str, List[str]]) -> Dict[str, Any]:
+    """send_notification arguments of `payload` aimed at `targets` only"""
+    kwargs = {
+        key: value
+        for key, value in payload.items()
+        if value is not None and key not in TARGET_KWARGS.values()
+    }
+    return {**kwargs, **targets}
+
+
+class RetryQueue:
+    """
+    Background retries for sends that failed with a transient error.
+
+    The request path (or the scheduler) hands a failed send to ``schedule``,
+    which persists it in retry_jobs with its next attempt pushed out by a
+    jittered exponential backoff, so callers don't retry in lock-step
+    themselves. A dispatcher claims due jobs (SELECT ... FOR UPDATE SKIP
+    LOCKED, so several processes can share the table) and a fixed pool of
+    workers retries them. Jobs that succeed are deleted; jobs that fail
+    permanently or exhaust RETRY_MAX_ATTEMPTS are moved to dead_letters,
+    from where they can be inspected and replayed in bulk.
+    """
+
+    def __init__(
+        self,
+        email_service: Optional[EmailService] = None,
+        push_service: Optional[PushNotificationService] = None,
+    ):
+        self.email_service = email_service or EmailService()
+        self.push_service = push_service or PushNotificationService()
+        self.worker_count = max(1, settings.RETRY_WORKERS)
+        self.batch_size = max(1, settings.RETRY_BATCH_SIZE)
+        self.poll_interval = settings.RETRY_POLL_INTERVAL
+        self.max_attempts = max(1, settings.RETRY_MAX_ATTEMPTS)
+        self.lease = timedelta(seconds=settings.RETRY_LEASE_SECONDS)
+
+        self._jobs: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def _insert_job(self, kind: str, payload: Dict[str, Any], error: Optional[str], attempts: int) -> str:
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            job = RetryJob(
+                kind=kind,
+                payload=payload,
+                attempts=attempts,
+                available_at=datetime.utcnow() + retry_delay(attempts),
+                last_error=error,
+            )
+            db.add(job)
+            db.commit()
+            return job.job_id
+        finally:
+            db.close()
+
+    async def schedule(self, kind: str, payload: Dict[str, Any], error: Optional[str], attempts: int = 1) -> str:
+        """
+        Persist a failed send for a later retry.
+
+        Args:
+            kind: "email" (send_email arguments) or "push" (send_notification arguments)
+            payload: JSON-serialisable keyword arguments for the send; pushes should
+                carry the idempotency_key of the failed attempt, as a 5xx or timeout
+                may have been delivered
+            error: Error from the failed attempt
+            attempts: Attempts already made
+
+        Returns:
+            str: The retry job ID
+        """
+        if kind not in RETRY_KINDS:
+            raise ValueError(f"Unknown retry kind '{kind}'. Expected one of: {', '.join(RETRY_KINDS)}")
+        if kind == "push" and not payload.get("idempotency_key"):
+            # At least keep the retries themselves from duplicating each other
+            payload = {**payload, "idempotency_key": str(uuid.uuid4())}
+        job_id = await asyncio.to_thread(self._insert_job, kind, payload, error, attempts)
+        logger.info(f"Failed {kind} send queued for retry. Job ID: {job_id}")
+        return job_id
+
+    def _add_partial_follow_ups(
+        self,
+        db: Session,
+        payload: Dict[str, Any],
+        result: Dict[str, Any],
+        attempts: int,
+        source: str,
+    ) -> Optional[RetryJob]:
+        """Queue the transiently failed chunks of a partly sent push and park the rest, in the caller's transaction"""
+        job = None
+        if result.get("retry_targets"):
+            retry_payload = retargeted_push_payload(payload, result["retry_targets"])
+            if attempts < self.max_attempts:
+                job = RetryJob(
+                    kind="push",
+                    payload=retry_payload,
+                    attempts=attempts,
+                    available_at=datetime.utcnow() + retry_delay(attempts),
+                    last_error=result.get("retry_error"),
+                )
+                db.add(job)
+            else:
+                add_dead_letter(db, "push", retry_payload, attempts, result.get("retry_error"), source)
+        if result.get("failed_targets"):
+            add_dead_letter(
+                db,
+                "push",
+                retargeted_push_payload(payload, result["failed_targets"]),
+                attempts,
+                result.get("failed_error"),
+                source,
+            )
+        return job
+    
+    def _insert_follow_ups(self, payload: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            job = self._add_partial_follow_ups(db, payload, result, 1, "send")
+            db.commit()
+            return job.job_id if job else None
+        finally:
+            db.close()
+    
+    async def follow_up_partial_push(self, payload: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+        """
+        Follow up on a push that only partly went out.
+        
+        A large audience is sent as several OneSignal requests; when some of
+        them fail, the overall result still succeeds. The requests that failed
+        transiently are queued for retry with their targets only, and the ones
+        that failed permanently are parked as dead letters.
+        
+        Args:
+            payload: send_notification arguments of the original send
+            result: Its result (see PushNotificationService._aggregate_results)
+        
+        Returns:
+            str: The retry job ID, or None if nothing needed retrying
+        """
+        if not (result.get("retry_targets") or result.get("failed_targets")):
+            return None
+        job_id = await asyncio.to_thread(self._insert_follow_ups, payload, result)
+        logger.warning(f"Push partially sent; failed requests followed up (retry job: {job_id})")
+        return job_id
+    
+    # ------------------------------------------------------------------
+    # Dead letters
+    # ------------------------------------------------------------------
+
+    def list_dead_letters(self, kind: Optional[str] = None, limit: int = 100, offset: int = 0) -> List[DeadLetter]:
+        """Parked sends, newest first"""
+        db = SessionLocal()
+        try:
+            query = db.query(DeadLetter)
+            if kind:
+                query = query.filter(DeadLetter.kind == kind)
+            return (
+                query.order_by(DeadLetter.created_at.desc(), DeadLetter.dead_letter_id)
+                .offset(offset)
+                .limit(limit)
+                .all()
+            )
+        finally:
+            db.close()
+
+    def get_dead_letter(self, dead_letter_id: str) -> Optional[DeadLetter]:
+        db = SessionLocal()
+        try:
+            return db.query(DeadLetter).filter(DeadLetter.dead_letter_id == dead_letter_id).first()
+        finally:
+            db.close()
+
+    def _replay(self, dead_letter_ids: Optional[List[str]], kind: Optional[str], limit: int) -> List[str]:
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            query = db.query(DeadLetter)
+            if dead_letter_ids:
+                query = query.filter(DeadLetter.dead_letter_id.in_(dead_letter_ids))
+            if kind:
+                query = query.filter(DeadLetter.kind == kind)
+            dead_letters = (
+                query.order_by(DeadLetter.created_at, DeadLetter.dead_letter_id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+
+            now = datetime.utcnow()
+            jobs = [
+                RetryJob(kind=dead_letter.kind, payload=dead_letter.payload, attempts=0, available_at=now)
+                for dead_letter in dead_letters
+            ]
+            db.add_all(jobs)
+            for dead_letter in dead_letters:
+                db.delete(dead_letter)
+            db.commit()
+            return [job.job_id for job in jobs]
+        finally:
+            db.close()
+
+    async def replay_dead_letters(
+        self,
+        dead_letter_ids: Optional[List[str]] = None,
+        kind: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[str]:
+        """
+        Move dead letters back onto the retry queue in one transaction.
+
+        Replayed sends start over with a full set of attempts and are due
+        immediately. Without IDs the oldest dead letters (of ``kind``, if
+        given) are replayed.
+
+        Returns:
+            list: The retry job IDs created
+        """
+        job_ids = await asyncio.to_thread(self._replay, dead_letter_ids, kind, limit)
+        if job_ids and self._wakeup is not None:
+            self._wakeup.set()
+        logger.info(f"Replayed {len(job_ids)} dead letters")
+        return job_ids
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+
+    def _claim_jobs(self, limit: int) -> List[RetryJob]:
+        """Lease up to `limit` due jobs. Expired leases (crashed workers) are reclaimed."""
+        now = datetime.utcnow()
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            jobs = (
+                db.query(RetryJob)
+                .filter(
+                    RetryJob.available_at <= now,
+                    or_(RetryJob.locked_until.is_(None), RetryJob.locked_until < now),
+                )
+                .order_by(RetryJob.available_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for job in jobs:
+                job.locked_until = now + self.lease
+                job.attempts += 1
+            db.commit()
+            return jobs
+        finally:
+            db.close()
+
+    def _finish_job(self, job: RetryJob, result: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            record = db.query(RetryJob).filter(RetryJob.job_id == job.job_id).first()
+            if not record:
+                return
+            if result.get("success"):
+                db.delete(record)
+                self._add_partial_follow_ups(db, record.payload, result, record.attempts, "retry")
+            elif result.get("retryable") and record.attempts < self.max_attempts:
+                record.locked_until = None
+                record.available_at = datetime.utcnow() + retry_delay(record.attempts)
+                record.last_error = result.get("error")
+            else:
+                add_dead_letter(db, record.kind, record.payload, record.attempts, result.get("error"), "retry")
+                db.delete(record)
+                logger.warning(f"Retry job {record.job_id} moved to dead letters after {record.attempts} attempts")
+            db.commit()
+        finally:
+            db.close()
+
+    async def _send(self, job: RetryJob) -> Dict[str, Any]:
+        if job.kind == "push":
+            return await self.push_service.send_notification(**job.payload)
+        return await self.email_service.send_email(**email_kwargs_from_payload(job.payload))
+
+    async def _deliver(self, job: RetryJob) -> None:
+        try:
+            result = await self._send(job)
+        except Exception as e:
+            result = {"success": False, "error": f"Error retrying {job.kind}: {str(e)}", "retryable": is_retryable_error(e)}
+
+        if not result.get("success"):
+            logger.warning(f"Retry of {job.kind} job {job.job_id} failed (attempt {job.attempts}): {result.get('error')}")
+        await asyncio.to_thread(self._finish_job, job, result)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._jobs.get()
+            try:
+                await self._deliver(job)
+            except Exception as e:
+                logger.error(f"Retry worker {index} failed on job {job.job_id}: {e}")
+            finally:
+                self._jobs.task_done()
+
+    async def _dispatcher(self) -> None:
+        while True:
+            try:
+                # Only claim what the workers can start on soon, so leases don't expire in memory
+                free = self._jobs.maxsize - self._jobs.qsize()
+                jobs = await asyncio.to_thread(self._claim_jobs, min(free, self.batch_size)) if free else []
+            except Exception as e:
+                logger.error(f"Error claiming retry jobs: {e}")
+                jobs = []
+
+            for job in jobs:
+                await self._jobs.put(job)
+
+            if len(jobs) < self.batch_size:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def start(self) -> None:
+        """Start the dispatcher and worker tasks"""
+        if self.running:
+            return
+        self._jobs = asyncio.Queue(maxsize=self.worker_count * 2)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._dispatcher())]
+        self._tasks.extend(asyncio.create_task(self._worker(i)) for i in range(self.worker_count))
+        logger.info(f"Retry queue started with {self.worker_count} workers")
+
+    async def stop(self) -> None:
+        """
+        Stop the dispatcher and workers.
+
+        Jobs that were claimed but not finished keep their lease and are picked
+        up again once it expires.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._jobs = None
+        self._wakeup = None
+
+
+# Global retry queue instance (started in lifespan)
+retry_queue = RetryQueue()
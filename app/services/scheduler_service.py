@@ -1,216 +1,708 @@
 """
-Email Scheduling Service
-Handles scheduling emails using APScheduler
+Scheduling Service
+Handles scheduling emails and push notifications using APScheduler triggers
+
+Schedules are persisted in the scheduled_jobs table, so they survive restarts
+and are not held in process memory. Runs are fired in one of two modes
+(SCHEDULER_MODE):
+- "local": an AsyncIOScheduler with a SQLAlchemy job store fires them; only
+  one process may run it
+- "distributed": every instance polls scheduled_jobs and leases due rows with
+  SELECT ... FOR UPDATE SKIP LOCKED, so each run is claimed by one instance at
+  a time; delivery is at-least-once (see DistributedScheduleRunner)
 """
 
+import asyncio
 import logging
+import os
+import socket
 import uuid
-from datetime import datetime, time, timedelta
-from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, List, Set, Tuple
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.base import BaseTrigger
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
-from apscheduler.triggers.interval import IntervalTrigger
-from app.models.schedule import ScheduleRequest
-from app.services.email_service import EmailService
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal, engine
+from app.models.schedule import ScheduleRequest, ScheduledJob
+from app.services.email_service import EmailService, email_kwargs_from_payload
+from app.services.player_service import DeviceTarget, get_device_targets, split_device_targets
+from app.services.push_notification_service import PushNotificationService
+from app.services.retry_service import retry_queue
 
 logger = logging.getLogger(__name__)
 
 # Global scheduler instance (will be started in lifespan)
-scheduler = AsyncIOScheduler()
+scheduler = AsyncIOScheduler(
+    jobstores={
+        "default": SQLAlchemyJobStore(engine=engine, tablename=settings.SCHEDULER_JOBSTORE_TABLE),
+    },
+    job_defaults={
+        "misfire_grace_time": settings.SCHEDULER_MISFIRE_GRACE_TIME,
+        "coalesce": True,  # Runs missed while down fire once, not once per missed slot
+        "max_instances": 1,
+    },
+)
 
-# Store scheduled job metadata
-scheduled_jobs: Dict[str, Dict[str, Any]] = {}
+_email_service: Optional[EmailService] = None
+_push_service: Optional[PushNotificationService] = None
 
 
-class SchedulerService:
-    """Service for scheduling email sending"""
+def _get_email_service() -> EmailService:
+    global _email_service
+    if _email_service is None:
+        _email_service = EmailService()
+    return _email_service
+
+
+def _get_push_service() -> PushNotificationService:
+    global _push_service
+    if _push_service is None:
+        _push_service = PushNotificationService()
+    return _push_service
+
+
+def build_trigger(schedule: ScheduleRequest) -> BaseTrigger:
+    """APScheduler trigger for a schedule configuration"""
+    if schedule.schedule_type == "once":
+        return DateTrigger(run_date=schedule.send_at)
+    
+    if schedule.schedule_type == "daily":
+        hour, minute = map(int, schedule.daily_time.split(':'))
+        return CronTrigger(hour=hour, minute=minute, end_date=schedule.end_date)
+    
+    if schedule.schedule_type == "weekly":
+        # Weekly schedule (0=Monday, 6=Sunday)
+        hour, minute = map(int, schedule.weekly_time.split(':'))
+        return CronTrigger(
+            day_of_week=schedule.weekly_day, hour=hour, minute=minute, end_date=schedule.end_date
+        )
+    
+    if schedule.schedule_type == "monthly":
+        # Months without the requested day are skipped
+        hour, minute = map(int, schedule.monthly_time.split(':'))
+        return CronTrigger(day=schedule.monthly_day, hour=hour, minute=minute, end_date=schedule.end_date)
+    
+    raise ValueError(f"Unsupported schedule type: {schedule.schedule_type}")
+
+
+def _local(fire_time: Optional[datetime]) -> Optional[datetime]:
+    """Aware fire time as naive local time (how scheduled_for is reported)"""
+    return fire_time.astimezone(scheduler.timezone).replace(tzinfo=None) if fire_time else None
+
+
+def _utc(fire_time: Optional[datetime]) -> Optional[datetime]:
+    """Aware fire time as naive UTC (how next_run_at and the lease columns are stored)"""
+    return fire_time.astimezone(timezone.utc).replace(tzinfo=None) if fire_time else None
+
+
+def next_fire_time(trigger: BaseTrigger) -> Optional[datetime]:
+    """Next time the trigger fires, as an aware datetime (None if it never fires again)"""
+    return trigger.get_next_fire_time(None, datetime.now(scheduler.timezone))
+
+
+def fire_time_after(trigger: BaseTrigger, run_at: datetime, now: datetime) -> Optional[datetime]:
+    """
+    First fire time after both `run_at` and `now` (aware datetimes)
+    
+    Slots missed while nothing was polling are skipped rather than replayed,
+    matching APScheduler's coalescing in local mode.
+    """
+    fire_time = trigger.get_next_fire_time(run_at, now)
+    while fire_time is not None and fire_time <= now:
+        fire_time = trigger.get_next_fire_time(fire_time, now)
+    return fire_time
+
+
+def _load_schedule(schedule_id: str) -> Optional[ScheduledJob]:
+    db = SessionLocal()
+    try:
+        return db.query(ScheduledJob).filter(ScheduledJob.schedule_id == schedule_id).first()
+    finally:
+        db.close()
+
+
+def _load_schedules(schedule_ids: List[str]) -> List[ScheduledJob]:
+    db = SessionLocal()
+    try:
+        return db.query(ScheduledJob).filter(ScheduledJob.schedule_id.in_(schedule_ids)).all()
+    finally:
+        db.close()
+
+
+def _record_runs(schedule_ids: List[str]) -> None:
+    """Stamp a batch of local-mode runs and move each row's next run past now"""
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        for record in db.query(ScheduledJob).filter(ScheduledJob.schedule_id.in_(schedule_ids)):
+            trigger = build_trigger(ScheduleRequest.model_validate(record.schedule))
+            fire_time = fire_time_after(trigger, now, now)
+            record.last_run_at = now.replace(tzinfo=None)
+            record.scheduled_for = _local(fire_time)
+            record.next_run_at = _utc(fire_time)
+        db.commit()
+    finally:
+        db.close()
+
+
+# Caps scheduled sends in flight per process, across all batches
+_send_slots = asyncio.Semaphore(max(1, settings.SCHEDULER_CONCURRENCY))
+
+
+async def _retry_if_transient(record: ScheduledJob, payload: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """Hand a transiently failed run (or the failed part of a push) to the retry queue; the schedule itself moves on"""
+    if not result.get("success") and result.get("retryable"):
+        job_id = await retry_queue.schedule(record.kind, payload, result.get("error"))
+        logger.warning(f"Scheduled {record.kind} {record.schedule_id} failed; retrying as job {job_id}")
+    elif result.get("success") and record.kind == "push":
+        await retry_queue.follow_up_partial_push(payload, result)
+
+
+async def _send_scheduled_email(record: ScheduledJob) -> None:
+    result = await _get_email_service().send_email(**email_kwargs_from_payload(record.payload))
+    logger.info(f"Scheduled email {record.schedule_id} sent. Result: {result}")
+    await _retry_if_transient(record, record.payload, result)
+
+
+def _run_idempotency_key(record: ScheduledJob) -> str:
+    """
+    Idempotency key for one run of a scheduled push
+    
+    Leased runs (distributed mode) derive it from the schedule and the fire
+    time, so a run re-sent after its lease expired isn't delivered twice.
+    """
+    if record.claimed_run_at is not None:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"schedule:{record.schedule_id}:{record.claimed_run_at.isoformat()}"))
+    return str(uuid.uuid4())
+
+
+async def _send_scheduled_push(record: ScheduledJob, targets_by_user: Dict[str, List[DeviceTarget]]) -> None:
+    """Send a scheduled push to its users' devices as they are registered at fire time"""
+    kwargs = dict(record.payload)
+    user_ids = kwargs.pop("user_ids", None) or []
+    player_ids, external_user_ids = split_device_targets(
+        target for user_id in user_ids for target in targets_by_user.get(user_id, [])
+    )
+    player_ids = list(kwargs.pop("player_ids", None) or []) + player_ids
+    if not (player_ids or external_user_ids or kwargs.get("subscription_ids") or kwargs.get("segments")):
+        logger.warning(f"Scheduled push {record.schedule_id} skipped: no active devices for its user_ids")
+        return
+    
+    if player_ids:
+        kwargs["player_ids"] = player_ids
+    if external_user_ids:
+        kwargs["external_user_ids"] = external_user_ids
+    kwargs["idempotency_key"] = _run_idempotency_key(record)
+    result = await _get_push_service().send_notification(**kwargs)
+    logger.info(f"Scheduled push {record.schedule_id} sent. Result: {result}")
+    # Retried with the devices resolved for this run
+    await _retry_if_transient(record, kwargs, result)
+
+
+async def _send_scheduled_run(record: ScheduledJob, targets_by_user: Dict[str, List[DeviceTarget]]) -> None:
+    async with _send_slots:
+        try:
+            if record.kind == "push":
+                await _send_scheduled_push(record, targets_by_user)
+            else:
+                await _send_scheduled_email(record)
+        except Exception as e:
+            logger.error(f"Error sending scheduled {record.kind} {record.schedule_id}: {str(e)}")
+
+
+async def send_scheduled_batch(records: List[ScheduledJob]) -> None:
+    """
+    Send a batch of co-scheduled emails and pushes with bounded concurrency
+    
+    Every email goes through the one shared EmailService, so the batch reuses
+    the precompiled templates, memoized renders and pooled SMTP sessions. The
+    users of every push in the batch are resolved to devices with one query.
+    """
+    if not records:
+        return
+    logger.info(f"Sending batch of {len(records)} scheduled sends")
+    
+    targets_by_user: Dict[str, List[DeviceTarget]] = {}
+    user_ids = {user_id for record in records if record.kind == "push" for user_id in record.payload.get("user_ids") or []}
+    if user_ids:
+        try:
+            async with AsyncSessionLocal() as db:
+                targets_by_user = await get_device_targets(db, user_ids)
+        except Exception as e:
+            logger.error(f"Error resolving devices for scheduled pushes: {e}")
+    
+    await asyncio.gather(*(_send_scheduled_run(record, targets_by_user) for record in records))
+
+
+async def _run_local_batch(schedule_ids: List[str]) -> None:
+    records = await asyncio.to_thread(_load_schedules, schedule_ids)
+    found = {record.schedule_id for record in records}
+    for schedule_id in schedule_ids:
+        if schedule_id not in found:
+            logger.warning(f"Schedule {schedule_id} fired but its metadata is gone; skipping")
+    
+    await send_scheduled_batch(records)
+    
+    try:
+        await asyncio.to_thread(_record_runs, [record.schedule_id for record in records])
+    except Exception as e:
+        logger.warning(f"Could not record runs of {len(records)} schedules: {e}")
+
+
+class ScheduledRunBatcher:
+    """
+    Coalesces local-mode firings into time-bucketed batches.
+    
+    APScheduler fires each schedule as its own job, so thousands of 09:00
+    schedules would start thousands of sends at once. Instead the job only
+    hands its schedule ID to the batcher: the first firing opens a bucket,
+    everything that fires within SCHEDULER_BATCH_WINDOW seconds joins it, and
+    the bucket is then sent as one batch (one metadata query, bounded sends,
+    one bookkeeping transaction).
+    """
     
     def __init__(self):
-        self.email_service = EmailService()
+        self.window = settings.SCHEDULER_BATCH_WINDOW
+        self._bucket: List[str] = []
+        self._tasks: Set[asyncio.Task] = set()
     
-    async def schedule_email(
-        self,
-        email_data: Dict[str, Any],
-        schedule: ScheduleRequest
-    ) -> dict:
+    def submit(self, schedule_id: str) -> None:
+        if not self._bucket:
+            task = asyncio.create_task(self._flush_after_window())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._bucket.append(schedule_id)
+    
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self.window)
+        schedule_ids, self._bucket = self._bucket, []
+        try:
+            await _run_local_batch(schedule_ids)
+        except Exception as e:
+            logger.error(f"Error running batch of {len(schedule_ids)} scheduled sends: {e}")
+    
+    async def stop(self) -> None:
+        """Cancel open buckets and batches in flight (their runs are not retried)"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._bucket = []
+
+
+run_batcher = ScheduledRunBatcher()
+
+
+async def run_scheduled_email(schedule_id: str) -> None:
+    """
+    APScheduler job (local mode): queue a schedule's send for the current batch
+    
+    Module-level (not a bound method) so the persistent job store can
+    reference it by import path; only the schedule ID is pickled.
+    """
+    run_batcher.submit(schedule_id)
+
+
+class DistributedScheduleRunner:
+    """
+    Fires scheduled sends from the scheduled_jobs table (distributed mode).
+    
+    Every instance runs one of these. A poller leases due rows in batches with
+    SELECT ... FOR UPDATE SKIP LOCKED, moving each row's next_run_at to its
+    following fire time in the same transaction, so a run is claimed by one
+    instance at a time. The runs claimed in one poll are sent as a batch with
+    bounded concurrency; the batch's leases are renewed every third of
+    SCHEDULER_LEASE_SECONDS while it is in flight and released together once
+    it is done.
+    
+    Delivery is at-least-once: if an instance dies mid-send, stalls for longer
+    than the lease (so renewals stop reaching the database) or fails to
+    release a finished batch, the lease expires and another instance sends
+    the run again.
+    """
+    
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+        self.batch_size = max(1, settings.SCHEDULER_BATCH_SIZE)
+        self.concurrency = max(1, settings.SCHEDULER_CONCURRENCY)
+        self.poll_interval = settings.SCHEDULER_POLL_INTERVAL
+        self.lease = timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        self.misfire_grace = timedelta(seconds=settings.SCHEDULER_MISFIRE_GRACE_TIME)
+        
+        self._poller: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._in_flight_runs = 0
+    
+    @property
+    def running(self) -> bool:
+        return self._poller is not None
+    
+    def _advance(self, record: ScheduledJob, now: datetime) -> None:
+        """Move a claimed row's next_run_at past the run being sent"""
+        trigger = build_trigger(ScheduleRequest.model_validate(record.schedule))
+        fire_time = fire_time_after(
+            trigger,
+            record.claimed_run_at.replace(tzinfo=timezone.utc),
+            now.replace(tzinfo=timezone.utc),
+        )
+        record.next_run_at = _utc(fire_time)
+        record.scheduled_for = _local(fire_time)
+    
+    def _claim_runs(self, limit: int) -> List[Tuple[ScheduledJob, bool]]:
         """
-        Schedule an email to be sent
+        Lease up to `limit` due runs, then runs whose lease expired.
         
-        Args:
-            email_data: Email data (to, subject, body, etc.)
-            schedule: Schedule configuration
-            
         Returns:
-            dict: Response containing schedule_id and scheduled_for
+            list: (row, retry) pairs; retry is True for runs reclaimed from a dead instance
         """
+        now = datetime.utcnow()
+        db = SessionLocal(expire_on_commit=False)
         try:
-            schedule_id = str(uuid.uuid4())
-            scheduled_for = None
-            
-            if schedule.schedule_type == "once":
-                # One-time schedule
-                if not schedule.send_at:
-                    return {
-                        "success": False,
-                        "schedule_id": None,
-                        "scheduled_for": None,
-                        "message": "send_at is required for 'once' schedule",
-                        "error": "Missing required field: send_at"
-                    }
-                
-                scheduled_for = schedule.send_at
-                trigger = DateTrigger(run_date=schedule.send_at)
-                
-                job = scheduler.add_job(
-                    self._send_scheduled_email,
-                    trigger=trigger,
-                    id=schedule_id,
-                    args=[email_data],
-                    replace_existing=True
-                )
-                
-            elif schedule.schedule_type == "daily":
-                # Daily schedule
-                hour, minute = map(int, schedule.daily_time.split(':'))
-                trigger = CronTrigger(hour=hour, minute=minute)
-                
-                # Calculate next run time
-                now = datetime.now()
-                next_run = datetime.combine(now.date(), time(hour, minute))
-                if next_run <= now:
-                    next_run += timedelta(days=1)
-                scheduled_for = next_run
-                
-                job = scheduler.add_job(
-                    self._send_scheduled_email,
-                    trigger=trigger,
-                    id=schedule_id,
-                    args=[email_data],
-                    replace_existing=True,
-                    end_date=schedule.end_date
+            due = (
+                db.query(ScheduledJob)
+                .filter(ScheduledJob.claimed_run_at.is_(None), ScheduledJob.next_run_at <= now)
+                .order_by(ScheduledJob.next_run_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            expired = []
+            if len(due) < limit:
+                expired = (
+                    db.query(ScheduledJob)
+                    .filter(ScheduledJob.lease_expires_at < now)
+                    .limit(limit - len(due))
+                    .with_for_update(skip_locked=True)
+                    .all()
                 )
-                
-            elif schedule.schedule_type == "weekly":
-                # Weekly schedule (0=Monday, 6=Sunday)
-                hour, minute = map(int, schedule.weekly_time.split(':'))
-                trigger = CronTrigger(day_of_week=schedule.weekly_day, hour=hour, minute=minute)
-                
-                # Calculate next run time
-                now = datetime.now()
-                days_ahead = (schedule.weekly_day - now.weekday()) % 7
-                if days_ahead == 0 and datetime.combine(now.date(), time(hour, minute)) <= now:
-                    days_ahead = 7
-                next_run = datetime.combine(now.date(), time(hour, minute)) + timedelta(days=days_ahead)
-                scheduled_for = next_run
-                
-                job = scheduler.add_job(
-                    self._send_scheduled_email,
-                    trigger=trigger,
-                    id=schedule_id,
-                    args=[email_data],
-                    replace_existing=True,
-                    end_date=schedule.end_date
+            
+            for record in due:
+                record.claimed_run_at = record.next_run_at
+                self._advance(record, now)
+            for record in due + expired:
+                record.lease_owner = self.owner
+                record.lease_expires_at = now + self.lease
+            db.commit()
+            return [(record, False) for record in due] + [(record, True) for record in expired]
+        finally:
+            db.close()
+    
+    def _renew(self, schedule_ids: List[str]) -> None:
+        """Extend this instance's leases on a batch still in flight"""
+        db = SessionLocal()
+        try:
+            (
+                db.query(ScheduledJob)
+                .filter(ScheduledJob.schedule_id.in_(schedule_ids), ScheduledJob.lease_owner == self.owner)
+                .update({ScheduledJob.lease_expires_at: datetime.utcnow() + self.lease}, synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+    
+    async def _keep_leases(self, schedule_ids: List[str]) -> None:
+        interval = max(1.0, self.lease.total_seconds() / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self._renew, schedule_ids)
+            except Exception as e:
+                logger.warning(f"Could not renew leases on {len(schedule_ids)} schedules: {e}")
+    
+    def _release(self, sent_ids: List[str], skipped_ids: List[str]) -> None:
+        """Drop this instance's leases on a finished batch in one transaction"""
+        db = SessionLocal()
+        try:
+            released = {
+                ScheduledJob.claimed_run_at: None,
+                ScheduledJob.lease_owner: None,
+                ScheduledJob.lease_expires_at: None,
+            }
+            for schedule_ids, values in (
+                (sent_ids, {**released, ScheduledJob.last_run_at: datetime.utcnow()}),
+                (skipped_ids, released),
+            ):
+                if schedule_ids:
+                    (
+                        db.query(ScheduledJob)
+                        .filter(ScheduledJob.schedule_id.in_(schedule_ids), ScheduledJob.lease_owner == self.owner)
+                        .update(values, synchronize_session=False)
+                    )
+            db.commit()
+        finally:
+            db.close()
+    
+    async def _run_batch(self, claimed: List[Tuple[ScheduledJob, bool]]) -> None:
+        now = datetime.utcnow()
+        runs: List[ScheduledJob] = []
+        skipped_ids: List[str] = []
+        for record, retry in claimed:
+            # Retries are late by at least the lease; only fresh runs are subject to the misfire grace
+            late_by = now - record.claimed_run_at
+            if retry or late_by <= self.misfire_grace:
+                runs.append(record)
+            else:
+                skipped_ids.append(record.schedule_id)
+                logger.warning(
+                    f"Skipping run of schedule {record.schedule_id} due at {record.claimed_run_at} UTC: "
+                    f"missed by {late_by}"
                 )
-                
-            elif schedule.schedule_type == "monthly":
-                # Monthly schedule
-                hour, minute = map(int, schedule.monthly_time.split(':'))
-                trigger = CronTrigger(day=schedule.monthly_day, hour=hour, minute=minute)
-                
-                # Calculate next run time
-                now = datetime.now()
-                # Start with current month
+        
+        run_ids = [record.schedule_id for record in runs]
+        renewer = asyncio.create_task(self._keep_leases(run_ids)) if run_ids else None
+        try:
+            await send_scheduled_batch(runs)
+            await asyncio.to_thread(self._release, run_ids, skipped_ids)
+        except Exception as e:
+            logger.warning(f"Could not release batch of {len(claimed)} schedules: {e}")
+        finally:
+            if renewer:
+                renewer.cancel()
+            self._in_flight_runs -= len(claimed)
+    
+    async def _poll(self) -> None:
+        while True:
+            claimed: List[Tuple[ScheduledJob, bool]] = []
+            free = self.concurrency - self._in_flight_runs
+            if free > 0:
                 try:
-                    next_run = now.replace(day=schedule.monthly_day, hour=hour, minute=minute, second=0, microsecond=0)
-                except ValueError:
-                    # If day doesn't exist in current month (e.g., Feb 30), use last day of month
-                    from calendar import monthrange
-                    last_day = monthrange(now.year, now.month)[1]
-                    next_run = now.replace(day=min(schedule.monthly_day, last_day), hour=hour, minute=minute, second=0, microsecond=0)
-                
-                # If the time has passed this month, move to next month
-                if next_run <= now:
-                    if now.month == 12:
-                        next_run = next_run.replace(year=now.year + 1, month=1)
-                    else:
-                        next_run = next_run.replace(month=now.month + 1)
-                    
-                    # Handle day overflow in next month
-                    try:
-                        next_run = next_run.replace(day=schedule.monthly_day)
-                    except ValueError:
-                        from calendar import monthrange
-                        last_day = monthrange(next_run.year, next_run.month)[1]
-                        next_run = next_run.replace(day=min(schedule.monthly_day, last_day))
-                
-                scheduled_for = next_run
-                
-                job = scheduler.add_job(
-                    self._send_scheduled_email,
-                    trigger=trigger,
-                    id=schedule_id,
-                    args=[email_data],
-                    replace_existing=True,
-                    end_date=schedule.end_date
-                )
+                    claimed = await asyncio.to_thread(self._claim_runs, min(free, self.batch_size))
+                except Exception as e:
+                    logger.error(f"Error claiming scheduled sends: {e}")
             
-            # Store job metadata
-            scheduled_jobs[schedule_id] = {
-                "schedule_id": schedule_id,
-                "schedule_type": schedule.schedule_type,
-                "scheduled_for": scheduled_for,
-                "email_data": email_data,
-                "job": job
-            }
+            if claimed:
+                # Everything due in this poll is one batch
+                self._in_flight_runs += len(claimed)
+                task = asyncio.create_task(self._run_batch(claimed))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+            
+            if len(claimed) < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+            else:
+                await asyncio.sleep(0)
+    
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._poller = asyncio.create_task(self._poll())
+        logger.info(f"Distributed scheduler started as {self.owner}")
+    
+    async def stop(self) -> None:
+        """
+        Stop polling and cancel in-flight sends.
+        
+        Cancelled runs keep their lease and are retried by another instance
+        once it expires.
+        """
+        tasks = [self._poller, *self._in_flight] if self._poller else list(self._in_flight)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._poller = None
+        self._in_flight.clear()
+        self._in_flight_runs = 0
+
+
+schedule_runner = DistributedScheduleRunner()
+
+
+def _distributed() -> bool:
+    if settings.SCHEDULER_MODE not in ("local", "distributed"):
+        raise ValueError(
+            f"Unknown SCHEDULER_MODE '{settings.SCHEDULER_MODE}'. Expected one of: local, distributed"
+        )
+    return settings.SCHEDULER_MODE == "distributed"
+
+
+async def start_scheduler() -> None:
+    """Start firing scheduled sends in the configured mode (called from lifespan)"""
+    if _distributed():
+        await schedule_runner.start()
+    elif not scheduler.running:
+        scheduler.start()
+        logger.info("Local scheduler started")
+
+
+async def stop_scheduler() -> None:
+    """Stop firing scheduled sends (called on application shutdown)"""
+    await schedule_runner.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    await run_batcher.stop()
+
+
+class SchedulerService:
+    """Service for scheduling email and push notification sending"""
+    
+    def _create_schedule(
+        self,
+        schedule_id: str,
+        kind: str,
+        payload: Dict[str, Any],
+        schedule: ScheduleRequest,
+        trigger: BaseTrigger,
+        fire_time: datetime,
+    ) -> None:
+        db = SessionLocal()
+        try:
+            db.add(ScheduledJob(
+                schedule_id=schedule_id,
+                kind=kind,
+                schedule_type=schedule.schedule_type,
+                schedule=schedule.model_dump(mode="json", exclude_none=True),
+                payload=payload,
+                scheduled_for=_local(fire_time),
+                next_run_at=_utc(fire_time),
+            ))
+            db.commit()
+        finally:
+            db.close()
+        
+        if _distributed():
+            return  # The row itself is the work item
+        
+        try:
+            scheduler.add_job(
+                run_scheduled_email,
+                trigger=trigger,
+                id=schedule_id,
+                args=[schedule_id],
+                replace_existing=True
+            )
+        except Exception:
+            self._delete_schedule(schedule_id, kind)
+            raise
+    
+    def _delete_schedule(self, schedule_id: str, kind: str) -> bool:
+        db = SessionLocal()
+        try:
+            deleted = (
+                db.query(ScheduledJob)
+                .filter(ScheduledJob.schedule_id == schedule_id, ScheduledJob.kind == kind)
+                .delete()
+            )
+            db.commit()
+            return bool(deleted)
+        finally:
+            db.close()
+    
+    async def _schedule(self, kind: str, payload: Dict[str, Any], schedule: ScheduleRequest) -> dict:
+        label = "Email" if kind == "email" else "Push notification"
+        try:
+            if schedule.schedule_type == "once" and not schedule.send_at:
+                return {
+                    "success": False,
+                    "schedule_id": None,
+                    "scheduled_for": None,
+                    "message": "send_at is required for 'once' schedule",
+                    "error": "Missing required field: send_at"
+                }
+            
+            schedule_id = str(uuid.uuid4())
+            trigger = build_trigger(schedule)
+            fire_time = next_fire_time(trigger)
+            if fire_time is None:
+                return {
+                    "success": False,
+                    "schedule_id": None,
+                    "scheduled_for": None,
+                    "message": "Schedule has no future run (check send_at / end_date)",
+                    "error": "Schedule never fires",
+                }
             
-            logger.info(f"Email scheduled successfully. Schedule ID: {schedule_id}, Scheduled for: {scheduled_for}")
+            await asyncio.to_thread(
+                self._create_schedule, schedule_id, kind, payload, schedule, trigger, fire_time
+            )
+            scheduled_for = _local(fire_time)
+            
+            logger.info(f"{label} scheduled successfully. Schedule ID: {schedule_id}, Scheduled for: {scheduled_for}")
             
             return {
                 "success": True,
                 "schedule_id": schedule_id,
                 "scheduled_for": scheduled_for,
-                "message": f"Email scheduled successfully for {scheduled_for}",
+                "message": f"{label} scheduled successfully for {scheduled_for}",
             }
-            
+        
         except Exception as e:
-            error_msg = f"Error scheduling email: {str(e)}"
+            error_msg = f"Error scheduling {label.lower()}: {str(e)}"
             logger.error(error_msg)
             return {
                 "success": False,
                 "schedule_id": None,
                 "scheduled_for": None,
-                "message": "Failed to schedule email",
+                "message": f"Failed to schedule {label.lower()}",
                 "error": error_msg,
             }
     
-    async def _send_scheduled_email(self, email_data: Dict[str, Any]):
-        """Internal method to send a scheduled email"""
-        try:
-            result = await self.email_service.send_email(**email_data)
-            logger.info(f"Scheduled email sent. Result: {result}")
-        except Exception as e:
-            logger.error(f"Error sending scheduled email: {str(e)}")
+    async def schedule_email(
+        self,
+        email_data: Dict[str, Any],
+        schedule: ScheduleRequest
+    ) -> dict:
+        """
+        Schedule an email to be sent
+        
+        Args:
+            email_data: JSON-serialisable keyword arguments for EmailService.send_email
+            schedule: Schedule configuration
+        
+        Returns:
+            dict: Response containing schedule_id and scheduled_for
+        """
+        return await self._schedule("email", email_data, schedule)
     
-    def cancel_schedule(self, schedule_id: str) -> dict:
+    async def schedule_push(
+        self,
+        notification_data: Dict[str, Any],
+        schedule: ScheduleRequest
+    ) -> dict:
+        """
+        Schedule a push notification to be sent
+        
+        user_ids are kept as given and resolved to their active devices each
+        time the schedule fires, so devices registered in the meantime are
+        reached and logged-out ones are not.
+        
+        Args:
+            notification_data: JSON-serialisable PushNotificationRequest fields
+            schedule: Schedule configuration
+        
+        Returns:
+            dict: Response containing schedule_id and scheduled_for
+        """
+        return await self._schedule("push", notification_data, schedule)
+    
+    def cancel_schedule(self, schedule_id: str, kind: str = "email") -> dict:
         """
-        Cancel a scheduled email
+        Cancel a scheduled email or push notification
         
         Args:
             schedule_id: The schedule ID to cancel
-            
+            kind: What the schedule sends ("email" or "push")
+        
         Returns:
             dict: Response indicating success or failure
         """
         try:
-            if schedule_id not in scheduled_jobs:
+            record = _load_schedule(schedule_id)
+            if record is None or record.kind != kind:
                 return {
                     "success": False,
                     "message": f"Schedule ID {schedule_id} not found",
                 }
             
-            scheduler.remove_job(schedule_id)
-            del scheduled_jobs[schedule_id]
+            if not _distributed():
+                try:
+                    scheduler.remove_job(schedule_id)
+                except JobLookupError:
+                    pass  # Already fired for the last time
+            self._delete_schedule(schedule_id, kind)
             
             logger.info(f"Schedule {schedule_id} cancelled successfully")
             
@@ -218,7 +710,7 @@ class SchedulerService:
                 "success": True,
                 "message": f"Schedule {schedule_id} cancelled successfully",
             }
-            
+        
         except Exception as e:
             error_msg = f"Error cancelling schedule: {str(e)}"
             logger.error(error_msg)
@@ -228,18 +720,39 @@ class SchedulerService:
                 "error": error_msg,
             }
     
-    def get_schedule(self, schedule_id: str) -> Optional[Dict[str, Any]]:
+    def get_schedule(self, schedule_id: str, kind: str = "email") -> Optional[Dict[str, Any]]:
         """Get schedule information by ID"""
-        return scheduled_jobs.get(schedule_id)
-    
-    def list_schedules(self) -> List[Dict[str, Any]]:
-        """List all scheduled emails"""
-        return [
-            {
-                "schedule_id": job["schedule_id"],
-                "schedule_type": job["schedule_type"],
-                "scheduled_for": job["scheduled_for"],
-            }
-            for job in scheduled_jobs.values()
-        ]
-
+        record = _load_schedule(schedule_id)
+        if record is None or record.kind != kind:
+            return None
+        data_key = "email_data" if kind == "email" else "notification_data"
+        return {
+            "schedule_id": record.schedule_id,
+            "schedule_type": record.schedule_type,
+            "scheduled_for": record.scheduled_for,
+            "last_run_at": record.last_run_at,
+            data_key: record.payload,
+        }
+    
+    def list_schedules(self, limit: Optional[int] = None, offset: int = 0, kind: str = "email") -> List[Dict[str, Any]]:
+        """List scheduled emails or push notifications, soonest first"""
+        db = SessionLocal()
+        try:
+            query = (
+                db.query(ScheduledJob.schedule_id, ScheduledJob.schedule_type, ScheduledJob.scheduled_for)
+                .filter(ScheduledJob.kind == kind)
+                .order_by(ScheduledJob.scheduled_for, ScheduledJob.schedule_id)
+                .offset(offset)
+            )
+            if limit:
+                query = query.limit(limit)
+            return [
+                {
+                    "schedule_id": row.schedule_id,
+                    "schedule_type": row.schedule_type,
+                    "scheduled_for": row.scheduled_for,
+                }
+                for row in query.all()
+            ]
+        finally:
+            db.close()
@@ -0,0 +1,382 @@
+"""
+SMTP connection pool
+Keeps authenticated SMTP sessions open so consecutive sends skip the
+connect / STARTTLS / LOGIN handshake.
+"""
+
+import asyncio
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from email.message import EmailMessage
+from typing import Deque, Dict, Iterator, List
+
+import aiosmtplib
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSMTPConnection:
+    """An authenticated smtplib session plus the bookkeeping the pool needs."""
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.messages_sent = 0
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_used_at
+
+    def close(self) -> None:
+        try:
+            self.smtp.quit()
+        except Exception:
+            # Connection is already gone (or half-closed); just drop the socket
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of authenticated SMTP sessions.
+
+    Sends run in worker threads (via asyncio.to_thread), so the pool guards its
+    state with a lock and caps open sessions with a semaphore. Connections are:
+    - checked with NOOP when they have been idle longer than ``noop_interval``
+    - recycled after ``max_messages_per_connection`` messages
+    - evicted after ``idle_timeout`` seconds without use
+    - replaced transparently when the server drops them (SMTPServerDisconnected)
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        *,
+        max_size: int = 5,
+        max_messages_per_connection: int = 100,
+        idle_timeout: float = 60.0,
+        noop_interval: float = 10.0,
+        timeout: float = 30.0,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max(1, max_size)
+        self.max_messages_per_connection = max(1, max_messages_per_connection)
+        self.idle_timeout = idle_timeout
+        self.noop_interval = noop_interval
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle: Deque[PooledSMTPConnection] = deque()
+        self._closed = False
+
+    def _connect(self) -> PooledSMTPConnection:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.starttls()
+            smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        logger.debug("Opened SMTP connection to %s:%s", self.host, self.port)
+        return PooledSMTPConnection(smtp)
+
+    def _is_alive(self, conn: PooledSMTPConnection) -> bool:
+        if conn.idle_for() < self.noop_interval:
+            return True
+        try:
+            code, _ = conn.smtp.noop()
+            return code == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def _evict_idle_locked(self) -> List[PooledSMTPConnection]:
+        """Pop connections idle past idle_timeout (oldest are at the left)."""
+        expired: List[PooledSMTPConnection] = []
+        while self._idle and self._idle[0].idle_for() >= self.idle_timeout:
+            expired.append(self._idle.popleft())
+        return expired
+
+    def acquire(self, *, fresh: bool = False) -> PooledSMTPConnection:
+        """Borrow a live connection, opening a new one if none are idle (or if ``fresh``)."""
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if self._closed:
+                        raise RuntimeError("SMTP connection pool is closed")
+                    expired = self._evict_idle_locked()
+                    conn = self._idle.pop() if self._idle and not fresh else None
+                for stale in expired:
+                    stale.close()
+
+                if conn is None:
+                    return self._connect()
+                if self._is_alive(conn):
+                    return conn
+                logger.debug("Discarding dead SMTP connection to %s:%s", self.host, self.port)
+                conn.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn: PooledSMTPConnection, *, discard: bool = False) -> None:
+        """Return a borrowed connection; discarded or worn-out ones are closed."""
+        try:
+            conn.last_used_at = time.monotonic()
+            if discard or conn.messages_sent >= self.max_messages_per_connection:
+                conn.close()
+                return
+            with self._lock:
+                if self._closed:
+                    keep = False
+                else:
+                    self._idle.append(conn)
+                    keep = True
+            if not keep:
+                conn.close()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, *, fresh: bool = False) -> Iterator[PooledSMTPConnection]:
+        conn = self.acquire(fresh=fresh)
+        discard = False
+        try:
+            yield conn
+        except (smtplib.SMTPServerDisconnected, OSError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def send_message(self, msg: EmailMessage, from_addr: str, to_addrs: List[str]) -> None:
+        """
+        Send a message over a pooled session.
+
+        If the server has silently dropped the session, the send is retried once
+        on a freshly opened connection.
+        """
+        for attempt in range(2):
+            try:
+                with self.connection(fresh=attempt > 0) as conn:
+                    conn.smtp.send_message(msg, from_addr=from_addr, to_addrs=to_addrs)
+                    conn.messages_sent += 1
+                    return
+            except smtplib.SMTPServerDisconnected:
+                if attempt == 1:
+                    raise
+                logger.info("SMTP server %s:%s disconnected, reconnecting", self.host, self.port)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"idle": len(self._idle), "max_size": self.max_size}
+
+    def close(self) -> None:
+        """Close every idle connection and refuse further checkouts."""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+
+
+def _translate_aiosmtplib_error(exc: aiosmtplib.SMTPException) -> Exception:
+    """
+    Map aiosmtplib errors onto what smtplib raises so callers handle one exception family.
+
+    Timeouts and failed connects become TimeoutError / ConnectionError, as
+    smtplib's socket errors are, so relay failover and retries treat them as
+    connection trouble rather than a problem with the message.
+    """
+    if isinstance(exc, aiosmtplib.SMTPServerDisconnected):
+        return smtplib.SMTPServerDisconnected(str(exc))
+    if isinstance(exc, aiosmtplib.SMTPResponseException):
+        return smtplib.SMTPResponseException(exc.code, exc.message)
+    if isinstance(exc, aiosmtplib.SMTPTimeoutError):
+        return TimeoutError(str(exc))
+    if isinstance(exc, aiosmtplib.SMTPConnectError):
+        return ConnectionError(str(exc))
+    return smtplib.SMTPException(str(exc))
+
+
+class PooledAsyncSMTPConnection:
+    """An authenticated aiosmtplib session plus the bookkeeping the pool needs."""
+
+    def __init__(self, smtp: aiosmtplib.SMTP):
+        self.smtp = smtp
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.messages_sent = 0
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_used_at
+
+    async def close(self) -> None:
+        try:
+            await self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+
+
+class AsyncSMTPConnectionPool:
+    """
+    Event-loop native pool of authenticated SMTP sessions.
+
+    Same policies as SMTPConnectionPool, but STARTTLS, AUTH and DATA run as
+    non-blocking coroutines, so in-flight sends do not each hold an OS thread.
+    Must only be used from the event loop that created it.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        *,
+        max_size: int = 5,
+        max_messages_per_connection: int = 100,
+        idle_timeout: float = 60.0,
+        noop_interval: float = 10.0,
+        timeout: float = 30.0,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max(1, max_size)
+        self.max_messages_per_connection = max(1, max_messages_per_connection)
+        self.idle_timeout = idle_timeout
+        self.noop_interval = noop_interval
+        self.timeout = timeout
+
+        self._slots = asyncio.Semaphore(self.max_size)
+        self._idle: Deque[PooledAsyncSMTPConnection] = deque()
+        self._closed = False
+
+    async def _connect(self) -> PooledAsyncSMTPConnection:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.host,
+            port=self.port,
+            timeout=self.timeout,
+            start_tls=True,
+        )
+        try:
+            await smtp.connect()
+            await smtp.login(self.username, self.password)
+        except aiosmtplib.SMTPException as e:
+            smtp.close()
+            raise _translate_aiosmtplib_error(e) from e
+        logger.debug("Opened async SMTP connection to %s:%s", self.host, self.port)
+        return PooledAsyncSMTPConnection(smtp)
+
+    async def _is_alive(self, conn: PooledAsyncSMTPConnection) -> bool:
+        if not conn.smtp.is_connected:
+            return False
+        if conn.idle_for() < self.noop_interval:
+            return True
+        try:
+            response = await conn.smtp.noop()
+            return response.code == 250
+        except (aiosmtplib.SMTPException, OSError):
+            return False
+
+    async def acquire(self, *, fresh: bool = False) -> PooledAsyncSMTPConnection:
+        """Borrow a live connection, opening a new one if none are idle (or if ``fresh``)."""
+        await self._slots.acquire()
+        try:
+            while True:
+                if self._closed:
+                    raise RuntimeError("SMTP connection pool is closed")
+                while self._idle and self._idle[0].idle_for() >= self.idle_timeout:
+                    await self._idle.popleft().close()
+
+                if fresh or not self._idle:
+                    return await self._connect()
+                conn = self._idle.pop()
+                if await self._is_alive(conn):
+                    return conn
+                logger.debug("Discarding dead SMTP connection to %s:%s", self.host, self.port)
+                await conn.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, conn: PooledAsyncSMTPConnection, *, discard: bool = False) -> None:
+        """Return a borrowed connection; discarded or worn-out ones are closed."""
+        try:
+            conn.last_used_at = time.monotonic()
+            if discard or self._closed or conn.messages_sent >= self.max_messages_per_connection:
+                await conn.close()
+            else:
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    async def send_message(self, msg: EmailMessage, from_addr: str, to_addrs: List[str]) -> None:
+        """
+        Send a message over a pooled session.
+
+        If the server has silently dropped the session, the send is retried once
+        on a freshly opened connection.
+        """
+        for attempt in range(2):
+            conn = await self.acquire(fresh=attempt > 0)
+            discard = False
+            try:
+                await conn.smtp.send_message(msg, sender=from_addr, recipients=to_addrs)
+                conn.messages_sent += 1
+                return
+            except aiosmtplib.SMTPServerDisconnected as e:
+                discard = True
+                if attempt == 1:
+                    raise _translate_aiosmtplib_error(e) from e
+                logger.info("SMTP server %s:%s disconnected, reconnecting", self.host, self.port)
+            except aiosmtplib.SMTPException as e:
+                discard = isinstance(e, aiosmtplib.SMTPTimeoutError) or not conn.smtp.is_connected
+                raise _translate_aiosmtplib_error(e) from e
+            except OSError:
+                discard = True
+                raise
+            finally:
+                await self.release(conn, discard=discard)
+
+    def stats(self) -> Dict[str, int]:
+        return {"idle": len(self._idle), "max_size": self.max_size}
+
+    async def close(self) -> None:
+        """Close every idle connection and refuse further checkouts."""
+        self._closed = True
+        idle = list(self._idle)
+        self._idle.clear()
+        for conn in idle:
+            await conn.close()
+
+
+def pool_options() -> Dict[str, float]:
+    """Pool tuning shared by both pool flavours, taken from settings."""
+    return {
+        "max_size": settings.SMTP_POOL_SIZE,
+        "max_messages_per_connection": settings.SMTP_POOL_MAX_MESSAGES_PER_CONNECTION,
+        "idle_timeout": settings.SMTP_POOL_IDLE_TIMEOUT,
+        "noop_interval": settings.SMTP_POOL_NOOP_INTERVAL,
+        "timeout": settings.SMTP_TIMEOUT,
+    }
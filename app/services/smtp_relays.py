@@ -0,0 +1,271 @@
+"""
+SMTP relay routing
+Spreads outbound mail over several sender accounts (SMTP_RELAYS), tracking
+each account's daily and per-minute quota, pacing each account with an
+adaptive token bucket and steering traffic away from relays that defer
+(421/454) or cannot be reached.
+"""
+
+import logging
+import smtplib
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from app.config import settings
+from app.services.smtp_transport import SMTPTransport, get_smtp_transport
+from app.utils.rate_limit import AdaptiveTokenBucket
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Replies meaning "try again later": service unavailable / temporary authentication failure
+DEFERRAL_CODES = (421, 454)
+# Gmail's "550 5.4.5 Daily user sending limit exceeded"
+QUOTA_EXCEEDED_STATUS = b"5.4.5"
+QUOTA_EXCEEDED_COOLDOWN = 3600.0
+# Consecutive failures keep doubling the cooldown up to this multiple
+MAX_COOLDOWN_FACTOR = 16
+
+
+class NoRelayAvailableError(smtplib.SMTPException):
+    """Raised when every relay is over quota or cooling down"""
+
+
+class SMTPRelay:
+    """
+    One sender account plus its in-process usage counters.
+
+    Sends are counted when they start, so concurrent sends can't overshoot a
+    quota. The minute window keeps a timestamp per send; the day window keeps
+    per-minute counts, so it stays small however much mail goes out.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        from_email: str,
+        from_name: Optional[str],
+        daily_limit: int = 0,
+        per_minute_limit: int = 0,
+        rate_limit: float = 0.0,
+        burst: float = 1.0,
+    ):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.from_email = from_email
+        self.from_name = from_name
+        self.daily_limit = daily_limit
+        self.per_minute_limit = per_minute_limit
+        self.limiter = AdaptiveTokenBucket(
+            rate_limit,
+            burst,
+            min_rate=settings.SMTP_RATE_MIN,
+            increase=settings.SMTP_RATE_INCREASE,
+            decrease_factor=settings.SMTP_RATE_DECREASE_FACTOR,
+        )
+
+        self.in_flight = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self._last_minute: Deque[float] = deque()
+        self._last_day: Deque[List[int]] = deque()  # [minute index, sends]
+        self._sent_today = 0
+        self._transport: Optional[SMTPTransport] = None
+
+    @property
+    def transport(self) -> SMTPTransport:
+        if self._transport is None:
+            self._transport = get_smtp_transport(self.host, self.port, self.username, self.password)
+        return self._transport
+
+    def _expire(self, now: float) -> None:
+        while self._last_minute and self._last_minute[0] <= now - 60:
+            self._last_minute.popleft()
+        current_minute = int(now // 60)
+        while self._last_day and self._last_day[0][0] <= current_minute - 1440:
+            self._sent_today -= self._last_day.popleft()[1]
+
+    def sent_last_minute(self, now: float) -> int:
+        self._expire(now)
+        return len(self._last_minute)
+
+    def sent_today(self, now: float) -> int:
+        self._expire(now)
+        return self._sent_today
+
+    def available(self, now: float) -> bool:
+        """Not cooling down and under both quotas"""
+        if now < self.cooldown_until:
+            return False
+        if self.daily_limit and self.sent_today(now) >= self.daily_limit:
+            return False
+        if self.per_minute_limit and self.sent_last_minute(now) >= self.per_minute_limit:
+            return False
+        return True
+
+    def load(self, now: float) -> tuple:
+        """Sort key for routing: quota used (fraction of the tighter limit), then sends in flight"""
+        used = 0.0
+        if self.daily_limit:
+            used = max(used, self.sent_today(now) / self.daily_limit)
+        if self.per_minute_limit:
+            used = max(used, self.sent_last_minute(now) / self.per_minute_limit)
+        return (used, self.in_flight, self.sent_last_minute(now))
+
+    def record_send(self, now: float) -> None:
+        self._expire(now)
+        self._last_minute.append(now)
+        minute = int(now // 60)
+        if self._last_day and self._last_day[-1][0] == minute:
+            self._last_day[-1][1] += 1
+        else:
+            self._last_day.append([minute, 1])
+        self._sent_today += 1
+
+    def refund_send(self, sent_at: float) -> None:
+        """Give back the quota slot taken by record_send(sent_at) for a send the relay didn't accept"""
+        try:
+            self._last_minute.remove(sent_at)
+        except ValueError:
+            pass  # Already out of the minute window
+        minute = int(sent_at // 60)
+        for bucket in reversed(self._last_day):
+            if bucket[0] == minute:
+                bucket[1] -= 1
+                self._sent_today -= 1
+                break
+
+    def cool_down(self, seconds: float, now: float) -> None:
+        self.failures += 1
+        factor = min(2 ** (self.failures - 1), MAX_COOLDOWN_FACTOR)
+        self.cooldown_until = max(self.cooldown_until, now + seconds * factor)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "name": self.name,
+            "healthy": now >= self.cooldown_until,
+            "cooldown_remaining": max(0.0, round(self.cooldown_until - now, 1)),
+            "in_flight": self.in_flight,
+            "sent_last_minute": self.sent_last_minute(now),
+            "per_minute_limit": self.per_minute_limit,
+            "sent_today": self.sent_today(now),
+            "daily_limit": self.daily_limit,
+            "rate_limiter": self.limiter.stats() if self.limiter.enabled else None,
+            "transport": self._transport.stats() if self._transport else None,
+        }
+
+
+def _is_throttling(exc: BaseException) -> bool:
+    """Temporary (4xx) replies: the relay wants us to slow down"""
+    return isinstance(exc, smtplib.SMTPResponseException) and 400 <= exc.smtp_code < 500
+
+
+def _cooldown_for(exc: BaseException) -> Optional[float]:
+    """Seconds to rest a relay after this error, or None if the error is about the message"""
+    if isinstance(exc, smtplib.SMTPResponseException):
+        if exc.smtp_code in DEFERRAL_CODES:
+            return settings.SMTP_RELAY_COOLDOWN
+        message = exc.smtp_error if isinstance(exc.smtp_error, bytes) else str(exc.smtp_error).encode()
+        if exc.smtp_code == 550 and QUOTA_EXCEEDED_STATUS in message:
+            return QUOTA_EXCEEDED_COOLDOWN
+        return None
+    if isinstance(exc, (smtplib.SMTPServerDisconnected, OSError)):
+        return settings.SMTP_RELAY_COOLDOWN
+    return None
+
+
+class SMTPRelayPool:
+    """
+    Routes each send to the least-loaded healthy relay.
+
+    Each send first waits for a token from the relay's rate limiter, whose
+    rate is cut on 4xx replies and recovers as sends succeed. A send's quota
+    slot is taken when it starts and given back if the relay doesn't accept it.
+
+    A relay that defers (421/454), reports its sending quota exhausted or
+    can't be reached is rested for a cooldown and the send moves on to the
+    next relay; errors about the message itself (e.g. a rejected recipient)
+    are raised straight away. Counters are per process and only touched on
+    the event loop.
+    """
+
+    def __init__(self, relays: List[SMTPRelay]):
+        if not relays:
+            raise ValueError("At least one SMTP relay must be configured")
+        self.relays = relays
+
+    def _pick(self, exclude: List[SMTPRelay]) -> SMTPRelay:
+        now = time.monotonic()
+        candidates = [relay for relay in self.relays if relay not in exclude and relay.available(now)]
+        if not candidates:
+            raise NoRelayAvailableError(
+                "No SMTP relay available: every relay is over its sending quota or cooling down"
+            )
+        return min(candidates, key=lambda relay: relay.load(now))
+
+    async def send(self, send_via: Callable[[SMTPRelay], Awaitable[T]]) -> T:
+        """
+        Run ``send_via(relay)`` on a relay, failing over to others on relay trouble.
+
+        Raises:
+            NoRelayAvailableError: If no relay is left to try
+            smtplib.SMTPException: Errors about the message itself
+        """
+        tried: List[SMTPRelay] = []
+        last_error: Optional[Exception] = None
+        while True:
+            try:
+                relay = self._pick(tried)
+            except NoRelayAvailableError:
+                if last_error is not None:
+                    raise last_error
+                raise
+            tried.append(relay)
+            sent_at = time.monotonic()
+            relay.record_send(sent_at)
+            relay.in_flight += 1
+            try:
+                await relay.limiter.acquire()
+                result = await send_via(relay)
+            except Exception as e:
+                # The relay didn't accept the message, so it doesn't count towards its quota
+                relay.refund_send(sent_at)
+                if _is_throttling(e):
+                    relay.limiter.on_throttle()
+                cooldown = _cooldown_for(e)
+                if cooldown is None:
+                    raise
+                relay.cool_down(cooldown, time.monotonic())
+                logger.warning(f"SMTP relay {relay.name} failed ({e}); resting it and trying another relay")
+                last_error = e
+                continue
+            finally:
+                relay.in_flight -= 1
+            relay.failures = 0
+            relay.limiter.on_success()
+            return result
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [relay.stats() for relay in self.relays]
+
+
+_relay_pool: Optional[SMTPRelayPool] = None
+
+
+def get_smtp_relays() -> SMTPRelayPool:
+    """Get (or lazily create) the relay pool shared by every EmailService instance"""
+    global _relay_pool
+    if _relay_pool is None:
+        _relay_pool = SMTPRelayPool([SMTPRelay(**config) for config in settings.smtp_relay_configs()])
+        logger.info(f"Routing mail over {len(_relay_pool.relays)} SMTP relay(s)")
+    return _relay_pool
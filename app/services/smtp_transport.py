@@ -0,0 +1,109 @@
+"""
+SMTP transports
+Pluggable delivery backends used by EmailService. The transport is chosen
+with the SMTP_TRANSPORT setting:
+- "thread": blocking smtplib sessions from SMTPConnectionPool, run via asyncio.to_thread
+- "asyncio": aiosmtplib sessions from AsyncSMTPConnectionPool, run on the event loop
+"""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from email.message import EmailMessage
+from typing import Dict, List, Tuple
+
+from app.config import settings
+from app.services.smtp_pool import AsyncSMTPConnectionPool, SMTPConnectionPool, pool_options
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPTransport(ABC):
+    """Delivers a fully built message to an SMTP relay."""
+
+    name: str = ""
+
+    @abstractmethod
+    async def send(self, msg: EmailMessage, from_addr: str, to_addrs: List[str]) -> None:
+        """Send a message. Raises smtplib.SMTPException subclasses, or OSError (e.g. TimeoutError) on connection trouble."""
+
+    @abstractmethod
+    async def close(self) -> None:
+        """Release any pooled connections."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Pool statistics for health reporting."""
+
+
+class ThreadedSMTPTransport(SMTPTransport):
+    """smtplib over a thread-safe connection pool; each send occupies a worker thread."""
+
+    name = "thread"
+
+    def __init__(self, host: str, port: int, username: str, password: str):
+        self.pool = SMTPConnectionPool(host, port, username, password, **pool_options())
+
+    async def send(self, msg: EmailMessage, from_addr: str, to_addrs: List[str]) -> None:
+        await asyncio.to_thread(self.pool.send_message, msg, from_addr, to_addrs)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.pool.close)
+
+    def stats(self) -> Dict[str, int]:
+        return self.pool.stats()
+
+
+class AsyncSMTPTransport(SMTPTransport):
+    """aiosmtplib over an event-loop native connection pool; no thread per send."""
+
+    name = "asyncio"
+
+    def __init__(self, host: str, port: int, username: str, password: str):
+        self.pool = AsyncSMTPConnectionPool(host, port, username, password, **pool_options())
+
+    async def send(self, msg: EmailMessage, from_addr: str, to_addrs: List[str]) -> None:
+        await self.pool.send_message(msg, from_addr, to_addrs)
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    def stats(self) -> Dict[str, int]:
+        return self.pool.stats()
+
+
+TRANSPORTS = {
+    ThreadedSMTPTransport.name: ThreadedSMTPTransport,
+    AsyncSMTPTransport.name: AsyncSMTPTransport,
+}
+
+# One transport per (host, port, account), shared by every EmailService instance
+_transports: Dict[Tuple[str, int, str], SMTPTransport] = {}
+
+
+def get_smtp_transport(host: str, port: int, username: str, password: str) -> SMTPTransport:
+    """Get (or lazily create) the shared transport for an SMTP account."""
+    key = (host, port, username)
+    transport = _transports.get(key)
+    if transport is None:
+        transport_cls = TRANSPORTS.get(settings.SMTP_TRANSPORT)
+        if transport_cls is None:
+            raise ValueError(
+                f"Unknown SMTP_TRANSPORT '{settings.SMTP_TRANSPORT}'. "
+                f"Expected one of: {', '.join(TRANSPORTS)}"
+            )
+        transport = transport_cls(host, port, username, password)
+        _transports[key] = transport
+        logger.info("Using '%s' SMTP transport for %s:%s", transport.name, host, port)
+    return transport
+
+
+async def close_smtp_transports() -> None:
+    """Close all shared transports (called on application shutdown)."""
+    transports = list(_transports.values())
+    _transports.clear()
+    for transport in transports:
+        try:
+            await transport.close()
+        except Exception as e:
+            logger.warning(f"Error closing SMTP transport: {e}")
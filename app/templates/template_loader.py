@@ -3,27 +3,89 @@ Email template loader
 Loads and renders email templates with variable substitution
 """
 
+import hashlib
+import json
+import logging
 import os
 from pathlib import Path
 from typing import Dict, Any, Optional
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+from jinja2 import Environment, FileSystemLoader, Template, TemplateNotFound
+from app.config import settings
 from app.templates.template_types import EmailTemplateType
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 # Get the templates directory path
 TEMPLATES_DIR = Path(__file__).parent / "html"
 
 # Initialize Jinja2 environment
+# auto_reload makes Jinja stat the source file on every get_template; only wanted in dev mode
 env = Environment(
     loader=FileSystemLoader(str(TEMPLATES_DIR)),
     autoescape=True,
     trim_blocks=True,
     lstrip_blocks=True,
+    auto_reload=settings.TEMPLATE_AUTO_RELOAD,
 )
 
+# Compiled templates by type, filled by TemplateLoader.precompile() at startup
+_compiled_templates: Dict[EmailTemplateType, Template] = {}
+
+# Rendered (subject, html_body) by template type + context hash, so broadcasts render once
+_render_cache = TTLCache(
+    maxsize=settings.TEMPLATE_RENDER_CACHE_SIZE,
+    ttl=settings.TEMPLATE_RENDER_CACHE_TTL,
+)
+
+
+def _context_hash(context: Dict[str, Any]) -> Optional[str]:
+    """Stable hash of a template context, or None if it can't be serialised"""
+    try:
+        encoded = json.dumps(context, sort_keys=True, default=str, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
 
 class TemplateLoader:
     """Loads and renders email templates"""
     
+    @staticmethod
+    def precompile() -> int:
+        """
+        Compile every EmailTemplateType that has an HTML file into the registry
+        
+        In production mode (TEMPLATE_AUTO_RELOAD off) renders are then served from
+        the registry without touching the filesystem. In dev mode the registry is
+        bypassed and Jinja re-checks the source file on each render instead.
+        
+        Returns:
+            int: Number of templates compiled
+        """
+        compiled = 0
+        for template_type in EmailTemplateType:
+            if template_type == EmailTemplateType.CUSTOM:
+                continue
+            try:
+                _compiled_templates[template_type] = env.get_template(f"{template_type.value}.html")
+                compiled += 1
+            except TemplateNotFound:
+                logger.debug(f"No HTML file for template '{template_type.value}'")
+        logger.info(f"Precompiled {compiled} email templates")
+        return compiled
+    
+    @staticmethod
+    def _get_template(template_type: EmailTemplateType) -> Template:
+        """Get a compiled template, compiling (and caching) it on first use"""
+        if settings.TEMPLATE_AUTO_RELOAD:
+            return env.get_template(f"{template_type.value}.html")
+        template = _compiled_templates.get(template_type)
+        if template is None:
+            template = env.get_template(f"{template_type.value}.html")
+            _compiled_templates[template_type] = template
+        return template
+    
     @staticmethod
     def render_template(
         template_type: EmailTemplateType,
@@ -48,10 +110,19 @@ class TemplateLoader:
             subject = context.get("subject", "Notification from Heaven Connect")
             return subject, custom_body
         
+        # Identical contexts produce identical output; skip the cache in dev mode
+        cache_key = None
+        if _render_cache.enabled and not settings.TEMPLATE_AUTO_RELOAD:
+            context_hash = _context_hash(context)
+            if context_hash:
+                cache_key = (template_type, context_hash)
+                cached = _render_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+        
         try:
-            # Load the template file
-            template_file = f"{template_type.value}.html"
-            template = env.get_template(template_file)
+            # Get the compiled template
+            template = TemplateLoader._get_template(template_type)
             
             # Render the template with context
             html_body = template.render(**context)
@@ -59,6 +130,8 @@ class TemplateLoader:
             # Get subject from context or use default
             subject = context.get("subject") or TemplateLoader._get_default_subject(template_type)
             
+            if cache_key:
+                _render_cache.set(cache_key, (subject, html_body))
             return subject, html_body
             
         except TemplateNotFound:
@@ -66,6 +139,16 @@ class TemplateLoader:
         except Exception as e:
             raise ValueError(f"Error rendering template: {str(e)}")
     
+    @staticmethod
+    def render_cache_stats() -> Dict[str, Any]:
+        """Hit/miss counters and size of the rendered-output cache"""
+        return _render_cache.stats()
+    
+    @staticmethod
+    def clear_render_cache() -> None:
+        """Drop all memoized renders"""
+        _render_cache.clear()
+    
     @staticmethod
     def _get_default_subject(template_type: EmailTemplateType) -> str:
         """Get default subject for a template type"""
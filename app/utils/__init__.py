@@ -0,0 +1,7 @@
+"""
+Shared utilities
+"""
+
+from .cache import TTLCache
+
+__all__ = ["TTLCache"]
@@ -0,0 +1,181 @@
+"""
+Adaptive rate and concurrency limiting helpers
+"""
+
+import asyncio
+import time
+from typing import Any, Dict
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate adapts to the remote side (AIMD).
+
+    ``acquire`` takes one token, waiting for it if the bucket is empty; up to
+    ``burst`` tokens accumulate while idle. When the remote side signals
+    throttling, ``on_throttle`` multiplies the rate by ``decrease_factor``
+    (at most once per second, so a wave of failures from sends already in
+    flight counts as one signal) and drains the burst. Every ``on_success``
+    adds ``increase / rate``, so sending at the current rate for one second
+    raises it by ``increase`` per second, back up to ``max_rate``.
+
+    A ``max_rate`` of 0 disables limiting. Must only be used from one event loop.
+    """
+
+    def __init__(
+        self,
+        max_rate: float,
+        burst: float,
+        *,
+        min_rate: float = 0.1,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate) if max_rate > 0 else min_rate
+        self.burst = max(1.0, burst)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.rate = max_rate
+        self.throttled = 0
+
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._last_decrease = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rate > 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        """Take a token, sleeping until one is available (a negative balance queues callers)"""
+        if not self.enabled:
+            return
+        self._refill(time.monotonic())
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+    def on_success(self) -> None:
+        if self.enabled and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self) -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self._tokens = min(self._tokens, 0.0)
+        self.throttled += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": round(self.rate, 2),
+            "max_rate": self.max_rate,
+            "burst": self.burst,
+            "throttled": self.throttled,
+        }
+
+
+class ConcurrencyLimitTimeout(Exception):
+    """Raised when a call waited longer than the queue timeout for a slot"""
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Caps calls in flight to a remote API, adapting the cap to its replies (AIMD).
+
+    Callers over the limit (or arriving while the API has asked us to back
+    off) wait up to ``queue_timeout`` seconds for a slot rather than failing.
+    ``on_overload`` halves the limit (at most once per second) and
+    ``pause`` blocks new calls until a Retry-After deadline; each
+    ``on_success`` adds ``1 / limit``, so a full window of successful calls
+    raises the limit by one, back up to ``max_limit``.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        *,
+        min_limit: int = 1,
+        queue_timeout: float = 30.0,
+        decrease_factor: float = 0.5,
+    ):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.queue_timeout = queue_timeout
+        self.decrease_factor = decrease_factor
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.overloaded = 0
+        self.timed_out = 0
+
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """
+        Wait for a free slot
+
+        Raises:
+            ConcurrencyLimitTimeout: If no slot frees up within queue_timeout
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        async with self._changed:
+            while True:
+                now = time.monotonic()
+                if now >= self._paused_until and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.timed_out += 1
+                    raise ConcurrencyLimitTimeout(
+                        f"No capacity within {self.queue_timeout}s "
+                        f"({self.in_flight} calls in flight, limit {int(self.limit)})"
+                    )
+                if self._paused_until > now:
+                    remaining = min(remaining, self._paused_until - now)
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self) -> None:
+        async with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def on_overload(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+        self.overloaded += 1
+
+    def pause(self, seconds: float) -> None:
+        """Hold back new calls for `seconds` (e.g. a Retry-After header)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "paused_for": max(0.0, round(self._paused_until - time.monotonic(), 1)),
+            "overloaded": self.overloaded,
+            "timed_out": self.timed_out,
+        }
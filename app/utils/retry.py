@@ -0,0 +1,50 @@
+"""
+Retry helpers: transient-error classification and jittered backoff
+"""
+
+import asyncio
+import random
+import smtplib
+
+import httpx
+
+from app.utils.rate_limit import ConcurrencyLimitTimeout
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """HTTP statuses worth retrying: rate limiting and server errors"""
+    return status_code == 429 or status_code >= 500
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """
+    Whether a failed send may succeed if tried again later
+
+    SMTP 4xx replies are temporary by definition and 5xx permanent; dropped
+    connections, timeouts and "no relay available" are transient. HTTP
+    errors follow is_retryable_status. Anything unrecognised is treated as
+    permanent so bad requests are not retried forever.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return bool(exc.recipients) and all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPNotSupportedError):
+        return False
+    if isinstance(exc, smtplib.SMTPException):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return is_retryable_status(exc.response.status_code)
+    return isinstance(exc, (httpx.TransportError, ConcurrencyLimitTimeout, asyncio.TimeoutError, OSError))
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Seconds to wait before retry number `attempt` (1-based)
+
+    Exponential (base * 2^(attempt - 1), capped at `cap`) with "equal jitter":
+    half the delay is fixed and half random, so retries of messages that
+    failed together spread out instead of arriving as one wave.
+    """
+    delay = min(cap, base * 2 ** max(0, attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
@@ -0,0 +1,180 @@
+"""
+Query plan audit for the players table
+Creates a scratch database with the application schema, seeds it with players,
+runs EXPLAIN on every read the player and push routers issue and exits with
+status 1 if any of them scans the whole table or a whole index (EXPLAIN type
+ALL or index), apart from the allowlisted reads that inherently need one.
+
+Writes (register upserts, updates and deletes) go through the primary key or
+the unique push_token_hash index and are covered by the lookups below.
+
+Usage: python explain_player_queries.py [--rows 20000] [--database NAME] [--keep]
+"""
+
+import argparse
+import itertools
+import logging
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app.config import settings
+from app.database import Base
+from app.models.player import DeviceStatus, DeviceType, Player, hash_push_token
+from app.services.player_service import (
+    active_players_query,
+    count_players_query,
+    list_players_query,
+    lock_players_by_token_hash_query,
+    player_filters,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Reads allowed a full index scan, by description, and why
+FULL_INDEX_SCAN_ALLOWED = {
+    "list (no filters): count": "counting every player reads a whole (the smallest) index",
+    "list (no filters): offset page": "walks the listing index in order, stopping after offset + limit rows",
+}
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN <statement>, compiled with the statement's own parameters"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "mysql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN " + compiler.process(element.statement, **kw)
+
+
+def seed_players(engine, rows: int) -> dict:
+    """Insert `rows` players spread over rows // 3 users; returns sample values to query with"""
+    rng = random.Random(42)
+    user_ids = [str(uuid.uuid4()) for _ in range(max(1, rows // 3))]
+    statuses = [DeviceStatus.ACTIVE] * 8 + [DeviceStatus.LOGOUT, DeviceStatus.BLOCKED]
+    start = datetime(2024, 1, 1)
+
+    batch = []
+    tokens = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            token = f"token-{uuid.uuid4()}"
+            tokens.append(token)
+            batch.append({
+                "player_id": str(uuid.uuid4()),
+                "device_id": str(uuid.uuid4()),
+                "user_id": rng.choice(user_ids),
+                "device_type": rng.choice(list(DeviceType)).name,
+                "push_token": token,
+                "push_token_hash": hash_push_token(token),
+                "one_signal_id": str(uuid.uuid4()),
+                "last_login_at": start + timedelta(seconds=rng.randrange(365 * 86400)),
+                "status": rng.choice(statuses).name,
+                "updated_at": start + timedelta(seconds=rng.randrange(365 * 86400)),
+            })
+            if len(batch) == 1000 or i == rows - 1:
+                conn.execute(insert(Player), batch)
+                batch = []
+        conn.execute(text("ANALYZE TABLE players"))
+
+    return {
+        "user_ids": rng.sample(user_ids, min(50, len(user_ids))),
+        "token_hashes": [hash_push_token(token) for token in rng.sample(tokens, min(500, len(tokens)))],
+    }
+
+
+def router_queries(sample: dict):
+    """(description, statement) for every players read issued by the routers"""
+    user_id = sample["user_ids"][0]
+    yield "push: active players for users", active_players_query(sample["user_ids"])
+    yield "players: lock existing tokens (register-batch)", lock_players_by_token_hash_query(sample["token_hashes"])
+    yield "players: get/update/delete by player_id", select(Player).where(Player.player_id == str(uuid.uuid4()))
+
+    filter_values = {
+        "user_id": user_id,
+        "device_type": DeviceType.IOS.name,
+        "status": DeviceStatus.ACTIVE.name,
+    }
+    cursor_key = (datetime(2024, 7, 1), str(uuid.uuid4()))
+    for size in range(len(filter_values) + 1):
+        for names in itertools.combinations(filter_values, size):
+            criteria = player_filters(**{name: filter_values[name] for name in names})
+            label = "+".join(names) or "no filters"
+            yield f"list ({label}): count", count_players_query(criteria)
+            yield f"list ({label}): offset page", list_players_query(criteria, limit=11, offset=1000)
+            yield f"list ({label}): cursor page", list_players_query(criteria, limit=11, after=cursor_key)
+
+
+def explain_queries(engine, sample: dict) -> bool:
+    """EXPLAIN each query; returns False if any plan scans a whole table or index it shouldn't"""
+    ok = True
+    with engine.connect() as conn:
+        for description, statement in router_queries(sample):
+            plan = conn.execute(Explain(statement)).mappings().all()
+            full_scans = [
+                row for row in plan
+                if row["type"] == "ALL" or (row["type"] == "index" and description not in FULL_INDEX_SCAN_ALLOWED)
+            ]
+            summary = ", ".join(
+                f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']}"
+                for row in plan
+            )
+            if full_scans:
+                ok = False
+                logger.error(f"✗ {description}: FULL SCAN ({summary})")
+            elif description in FULL_INDEX_SCAN_ALLOWED:
+                logger.info(f"✓ {description}: {summary} (allowed: {FULL_INDEX_SCAN_ALLOWED[description]})")
+            else:
+                logger.info(f"✓ {description}: {summary}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="Players to seed")
+    parser.add_argument("--database", default=f"{settings.DB_NAME}_explain", help="Scratch database name")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database afterwards")
+    args = parser.parse_args()
+
+    server_engine = create_engine(make_url(settings.DATABASE_URL).set(database=None))
+    scratch_engine = create_engine(make_url(settings.DATABASE_URL).set(database=args.database))
+    try:
+        with server_engine.begin() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS `{args.database}`"))
+            conn.execute(text(f"CREATE DATABASE `{args.database}`"))
+        Base.metadata.create_all(bind=scratch_engine)
+
+        logger.info(f"Seeding {args.rows} players into {args.database}...")
+        sample = seed_players(scratch_engine, args.rows)
+
+        ok = explain_queries(scratch_engine, sample)
+        if ok:
+            logger.info("No full table or index scans found")
+        else:
+            logger.error(
+                "Some queries scan the whole players table or one of its indexes; "
+                "add or fix an index in app/models/player.py"
+            )
+        return 0 if ok else 1
+    finally:
+        scratch_engine.dispose()
+        if not args.keep:
+            with server_engine.begin() as conn:
+                conn.execute(text(f"DROP DATABASE IF EXISTS `{args.database}`"))
+        server_engine.dispose()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Migration script to bring the players table indexes in line with the model
+- converts one_signal_id from TEXT to VARCHAR(255) so it can be indexed
+- creates every index in Player.__table__.indexes that the database doesn't have yet
+- drops indexes superseded by the composite ones
+
+Usage: python migrate_player_indexes.py
+"""
+
+import logging
+
+from sqlalchemy import text
+
+from app.database import engine, check_connection
+from app.models.player import Player
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Single-column indexes now covered by a composite index's leading column
+OBSOLETE_INDEXES = {
+    "ix_players_user_id": "ix_players_user_id_status_updated_at",
+}
+
+
+def get_existing_indexes(conn) -> set:
+    result = conn.execute(text("""
+        SELECT DISTINCT INDEX_NAME
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'players'
+    """))
+    return {row[0] for row in result.fetchall()}
+
+
+def migrate_one_signal_id_column(conn) -> bool:
+    """Convert one_signal_id to VARCHAR(255); TEXT columns can't be indexed whole"""
+    result = conn.execute(text("""
+        SELECT DATA_TYPE
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'players'
+        AND COLUMN_NAME = 'one_signal_id'
+    """))
+    row = result.fetchone()
+    if row is None or row[0].lower() == "varchar":
+        logger.info("✓ one_signal_id column is already VARCHAR")
+        return True
+
+    longest = conn.execute(text("SELECT MAX(CHAR_LENGTH(one_signal_id)) FROM players")).scalar() or 0
+    if longest > 255:
+        logger.error(f"one_signal_id values up to {longest} characters exist; cannot convert to VARCHAR(255)")
+        return False
+
+    logger.info("Converting one_signal_id column to VARCHAR(255)...")
+    conn.execute(text("""
+        ALTER TABLE players
+        MODIFY COLUMN one_signal_id VARCHAR(255) NULL
+    """))
+    logger.info("✓ Converted one_signal_id column")
+    return True
+
+
+def migrate_player_indexes():
+    """Create missing players table indexes and drop superseded ones"""
+    if not check_connection():
+        logger.error("Cannot connect to database. Please check your configuration.")
+        return False
+
+    try:
+        with engine.begin() as conn:
+            if not migrate_one_signal_id_column(conn):
+                return False
+            existing_indexes = get_existing_indexes(conn)
+
+        for index in sorted(Player.__table__.indexes, key=lambda idx: idx.name):
+            if index.name in existing_indexes:
+                logger.info(f"✓ {index.name} index already exists")
+                continue
+            if index.unique:
+                # Unique indexes need their data prepared first (see migrate_push_token_hash.py)
+                logger.warning(f"Skipping unique index {index.name}; run its dedicated migration")
+                continue
+            logger.info(f"Creating index {index.name}...")
+            # One statement per index; InnoDB builds secondary indexes online
+            index.create(bind=engine)
+            existing_indexes.add(index.name)
+            logger.info(f"✓ Created index {index.name}")
+
+        for name, replacement in OBSOLETE_INDEXES.items():
+            if name in existing_indexes and replacement in existing_indexes:
+                logger.info(f"Dropping index {name} (superseded by {replacement})...")
+                with engine.begin() as conn:
+                    conn.execute(text(f"DROP INDEX {name} ON players"))
+                logger.info(f"✓ Dropped index {name}")
+
+        logger.info("Migration completed successfully!")
+        return True
+
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    migrate_player_indexes()
@@ -0,0 +1,141 @@
+"""
+Migration script to add the hashed push token column to the players table
+Adds push_token_hash, backfills it in batches and creates its unique index
+
+Usage: python migrate_push_token_hash.py [--batch-size 1000]
+"""
+
+import argparse
+import logging
+
+from sqlalchemy import text
+
+from app.database import engine, check_connection
+from app.models.player import hash_push_token
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "uq_players_push_token_hash"
+
+
+def backfill_push_token_hashes(batch_size: int) -> int:
+    """Fill push_token_hash for every row, walking the primary key in batches"""
+    updated = 0
+    last_player_id = ""
+    while True:
+        # One short transaction per batch so the table is never locked for long
+        with engine.begin() as conn:
+            rows = conn.execute(text("""
+                SELECT player_id, push_token, push_token_hash
+                FROM players
+                WHERE player_id > :last_player_id
+                ORDER BY player_id
+                LIMIT :batch_size
+            """), {"last_player_id": last_player_id, "batch_size": batch_size}).fetchall()
+            if not rows:
+                break
+
+            changes = [
+                {"player_id": row[0], "push_token_hash": hash_push_token(row[1])}
+                for row in rows
+                if row[1] is not None and row[2] != hash_push_token(row[1])
+            ]
+            if changes:
+                conn.execute(text("""
+                    UPDATE players
+                    SET push_token_hash = :push_token_hash
+                    WHERE player_id = :player_id
+                """), changes)
+            updated += len(changes)
+            last_player_id = rows[-1][0]
+        logger.info(f"Backfilled {updated} rows (up to player_id {last_player_id})")
+    return updated
+
+
+def migrate_push_token_hash(batch_size: int = 1000):
+    """Add, backfill and index push_token_hash if not already done"""
+    if not check_connection():
+        logger.error("Cannot connect to database. Please check your configuration.")
+        return False
+
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(text("""
+                SELECT COLUMN_NAME
+                FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE()
+                AND TABLE_NAME = 'players'
+            """))
+            existing_columns = {row[0] for row in result.fetchall()}
+
+            if 'push_token_hash' not in existing_columns:
+                logger.info("Adding push_token_hash column to players table...")
+                # Nullable until the backfill has run
+                conn.execute(text("""
+                    ALTER TABLE players
+                    ADD COLUMN push_token_hash CHAR(64) NULL
+                """))
+                logger.info("✓ Added push_token_hash column")
+            else:
+                logger.info("✓ push_token_hash column already exists")
+
+        logger.info(f"Backfilling push_token_hash in batches of {batch_size}...")
+        updated = backfill_push_token_hashes(batch_size)
+        logger.info(f"✓ Backfilled push_token_hash for {updated} rows")
+
+        with engine.begin() as conn:
+            result = conn.execute(text("""
+                SELECT COUNT(*)
+                FROM information_schema.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE()
+                AND TABLE_NAME = 'players'
+                AND INDEX_NAME = :index_name
+            """), {"index_name": INDEX_NAME})
+            if result.fetchone()[0]:
+                logger.info(f"✓ {INDEX_NAME} index already exists")
+                logger.info("Migration completed successfully!")
+                return True
+
+            # A unique index can't be built while the same token is registered twice
+            duplicates = conn.execute(text("""
+                SELECT push_token_hash, COUNT(*)
+                FROM players
+                GROUP BY push_token_hash
+                HAVING COUNT(*) > 1
+                LIMIT 20
+            """)).fetchall()
+            if duplicates:
+                logger.error(
+                    f"Found push tokens registered to more than one player "
+                    f"(showing up to 20 hashes): {[row[0] for row in duplicates]}"
+                )
+                logger.error(
+                    "Remove the stale duplicates (keep the most recently updated row) "
+                    "and re-run this script to create the unique index."
+                )
+                return False
+
+            logger.info(f"Creating unique index {INDEX_NAME}...")
+            conn.execute(text(f"""
+                ALTER TABLE players
+                MODIFY COLUMN push_token_hash CHAR(64) NOT NULL,
+                ADD UNIQUE INDEX {INDEX_NAME} (push_token_hash)
+            """))
+            logger.info(f"✓ Created unique index {INDEX_NAME}")
+
+        logger.info("Migration completed successfully!")
+        return True
+
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows backfilled per transaction")
+    args = parser.parse_args()
+    migrate_push_token_hash(batch_size=args.batch_size)
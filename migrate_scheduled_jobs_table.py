@@ -0,0 +1,105 @@
+"""
+Migration script to add the distributed scheduling columns to scheduled_jobs
+Adds kind / next_run_at / claimed_run_at / lease_owner / lease_expires_at,
+backfills next_run_at from scheduled_for and creates the claim indexes
+
+Usage: python migrate_scheduled_jobs_table.py
+"""
+
+import logging
+
+from sqlalchemy import text
+
+from app.database import engine, check_connection
+from app.models.schedule import ScheduledJob
+from app.services.scheduler_service import _utc, scheduler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NEW_COLUMNS = {
+    # Existing schedules all send emails
+    "kind": "VARCHAR(16) NOT NULL DEFAULT 'email'",
+    "next_run_at": "DATETIME NULL",
+    "claimed_run_at": "DATETIME NULL",
+    "lease_owner": "VARCHAR(64) NULL",
+    "lease_expires_at": "DATETIME NULL",
+}
+
+
+def migrate_scheduled_jobs_table():
+    """Add missing columns and indexes to scheduled_jobs"""
+    if not check_connection():
+        logger.error("Cannot connect to database. Please check your configuration.")
+        return False
+
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(text("""
+                SELECT COLUMN_NAME
+                FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE()
+                AND TABLE_NAME = 'scheduled_jobs'
+            """))
+            existing_columns = {row[0] for row in result.fetchall()}
+            if not existing_columns:
+                logger.info("✓ scheduled_jobs table doesn't exist yet; it is created on startup")
+                return True
+
+            added_next_run_at = False
+            for name, definition in NEW_COLUMNS.items():
+                if name in existing_columns:
+                    logger.info(f"✓ {name} column already exists")
+                    continue
+                logger.info(f"Adding {name} column to scheduled_jobs table...")
+                conn.execute(text(f"ALTER TABLE scheduled_jobs ADD COLUMN {name} {definition}"))
+                added_next_run_at = added_next_run_at or name == "next_run_at"
+                logger.info(f"✓ Added {name} column")
+
+            if added_next_run_at:
+                # scheduled_for holds the next run in the server's local time
+                rows = conn.execute(text("""
+                    SELECT schedule_id, scheduled_for
+                    FROM scheduled_jobs
+                    WHERE scheduled_for IS NOT NULL
+                """)).fetchall()
+                changes = [
+                    {"schedule_id": row[0], "next_run_at": _utc(row[1].replace(tzinfo=scheduler.timezone))}
+                    for row in rows
+                ]
+                if changes:
+                    conn.execute(text("""
+                        UPDATE scheduled_jobs
+                        SET next_run_at = :next_run_at
+                        WHERE schedule_id = :schedule_id
+                    """), changes)
+                logger.info(f"✓ Backfilled next_run_at for {len(changes)} schedules")
+
+            result = conn.execute(text("""
+                SELECT DISTINCT INDEX_NAME
+                FROM information_schema.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE()
+                AND TABLE_NAME = 'scheduled_jobs'
+            """))
+            existing_indexes = {row[0] for row in result.fetchall()}
+
+        for index in sorted(ScheduledJob.__table__.indexes, key=lambda idx: idx.name):
+            if index.name in existing_indexes:
+                logger.info(f"✓ {index.name} index already exists")
+                continue
+            logger.info(f"Creating index {index.name}...")
+            index.create(bind=engine)
+            logger.info(f"✓ Created index {index.name}")
+
+        logger.info("Migration completed successfully!")
+        return True
+
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    migrate_scheduled_jobs_table()